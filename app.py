@@ -2,12 +2,17 @@ import streamlit as st
 import pdfplumber
 import re
 import os
+import sys
 import time
 from anthropic import Anthropic
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Anomaly rules live in backend/rules.json and are shared with the API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from detection import AnomalyDetector
+
 # Force reload - v2
 
 st.set_page_config(
@@ -191,50 +196,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Helper classes
-class AnomalyDetector:
-    def detect(self, data):
-        anomalies = []
-        severity = "low"
-        
-        usage = data.get('usage_kwh', 0)
-        
-        if usage > 800:
-            anomalies.append({
-                "type": "Usage Spike",
-                "severity": "high",
-                "detail": f"Consumption of {usage} kWh exceeds baseline (500 kWh)",
-                "impact": f"Estimated ${(usage - 500) * 0.15:.2f} above normal"
-            })
-            severity = "high"
-
-        t1_usage = data.get('tier1_usage', 0)
-        t1_cost = data.get('tier1_cost', 0)
-        if t1_usage > 0 and t1_cost > 0:
-            rate = t1_cost / t1_usage
-            if abs(rate - 0.13) > 0.01:
-                anomalies.append({
-                    "type": "Rate Error",
-                    "severity": "critical",
-                    "detail": f"Tier 1 rate ${rate:.2f}/kWh (expected $0.13/kWh)",
-                    "impact": f"Overcharge of ${(rate - 0.13) * t1_usage:.2f}"
-                })
-                severity = "critical"
-
-        components = data.get('components_sum', 0)
-        total = data.get('total_amount', 0)
-        if components > 0 and total > 0:
-            diff = abs(total - components)
-            if diff > 1.0:
-                anomalies.append({
-                    "type": "Calculation Error",
-                    "severity": "critical",
-                    "detail": f"Line items total ${components:.2f}, billed ${total:.2f}",
-                    "impact": f"Discrepancy of ${diff:.2f}"
-                })
-                severity = "critical"
-
-        return anomalies, severity
-
 def extract_data_from_pdf(pdf_file):
     try:
         with pdfplumber.open(pdf_file) as pdf:
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+
+ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "artifacts")
+
+
+class ArtifactStore:
+    # Generated files (report PDFs) kept on disk under their SHA-256, so the
+    # id doubles as a strong ETag and identical renders share one file.
+    # Files untouched for `ttl` seconds are purged on the next put(). The
+    # directory is created on the first put(), not when the store is built.
+    def __init__(self, root=DEFAULT_ARTIFACT_DIR, ttl=24 * 3600):
+        self.root = root
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=os.getenv("ARTIFACT_DIR", DEFAULT_ARTIFACT_DIR),
+            ttl=float(os.getenv("ARTIFACT_TTL", str(24 * 3600))),
+        )
+
+    def _path(self, artifact_id):
+        return os.path.join(self.root, artifact_id)
+
+    def put(self, data):
+        artifact_id = hashlib.sha256(data).hexdigest()
+        path = self._path(artifact_id)
+        if os.path.exists(path):
+            # Refresh the age so a re-generated report isn't purged early
+            os.utime(path)
+        else:
+            # Write to a temp file first so readers never see a partial file
+            os.makedirs(self.root, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        self.purge()
+        return artifact_id
+
+    def path(self, artifact_id):
+        # Returns the file path, or None for unknown (or malformed) ids
+        if not ARTIFACT_ID_RE.match(artifact_id or ""):
+            return None
+        path = self._path(artifact_id)
+        return path if os.path.exists(path) else None
+
+    def _entries(self):
+        try:
+            return list(os.scandir(self.root))
+        except FileNotFoundError:
+            return []
+
+    def purge(self):
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for entry in self._entries():
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        files = [entry for entry in self._entries() if entry.is_file()]
+        return {"files": len(files), "bytes": sum(entry.stat().st_size for entry in files)}
@@ -0,0 +1,301 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from bill_history import parse_bill_date
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+PARTITION_KEYS = ("month", "account")
+
+NUMERIC_FIELDS = ("total_amount", "usage_kwh", "customer_charge", "tier1_rate", "tier1_usage", "tier1_cost",
+                  "tier2_rate", "tier2_usage", "tier2_cost", "dist_charge", "taxes", "components_sum")
+
+DOLLARS_RE = re.compile(r"\$(-?[\d,]+\.\d{2})")
+
+TOP_ACCOUNTS = 10
+
+
+def _schema():
+    return pa.schema(
+        [("audited_at", pa.float64()), ("document", pa.string()), ("account_number", pa.string()),
+         ("bill_date", pa.string()), ("month", pa.string())]
+        + [(field, pa.float64()) for field in NUMERIC_FIELDS]
+        + [("severity", pa.string()), ("anomaly_count", pa.int32()), ("critical_count", pa.int32()),
+           ("high_count", pa.int32()), ("anomaly_types", pa.list_(pa.string())),
+           ("rate_overcharge", pa.float64()), ("billing_discrepancy", pa.float64()),
+           ("overcharge", pa.float64()), ("anomalies", pa.string())]
+    )
+
+
+def audit_row(data, anomalies, severity, document=None):
+    # One flat row per audited bill. Overcharge is what the customer paid
+    # beyond a correct bill: the Rate Error impact plus any amount billed
+    # above the line items. Usage spikes are real usage and don't count.
+    bill_date = parse_bill_date(data.get("bill_date"))
+    rate_overcharge = 0.0
+    for anomaly in anomalies:
+        if anomaly["type"] == "Rate Error":
+            match = DOLLARS_RE.search(anomaly.get("impact", ""))
+            if match:
+                rate_overcharge += float(match.group(1).replace(",", ""))
+    discrepancy = 0.0
+    if any(a["type"] == "Calculation Error" for a in anomalies):
+        discrepancy = round(data.get("total_amount", 0) - data.get("components_sum", 0), 2)
+    return {
+        "audited_at": time.time(),
+        "document": document,
+        "account_number": data.get("account_number"),
+        "bill_date": bill_date,
+        "month": bill_date[:7] if bill_date else "unknown",
+        **{field: data.get(field) for field in NUMERIC_FIELDS},
+        "severity": severity,
+        "anomaly_count": len(anomalies),
+        "critical_count": sum(1 for a in anomalies if a.get("severity") == "critical"),
+        "high_count": sum(1 for a in anomalies if a.get("severity") == "high"),
+        "anomaly_types": [a["type"] for a in anomalies],
+        "rate_overcharge": rate_overcharge,
+        "billing_discrepancy": discrepancy,
+        "overcharge": round(max(0.0, rate_overcharge) + max(0.0, discrepancy), 2),
+        "anomalies": json.dumps(anomalies),
+    }
+
+
+def _partition_value(value):
+    # Directory-safe partition value
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value or "unknown")
+
+
+class AuditStore:
+    # Append-only Parquet files of audit results, one row per bill, under
+    # hive-style partitions (root/month=2024-10/ or root/account=.../).
+    # Rows are buffered and written as one file per partition every
+    # `flush_rows` rows or `flush_interval` seconds, and before every query,
+    # so queries always see everything appended. A crash loses at most the
+    # unflushed buffer.
+    #
+    # Once a partition has `compact_files` small files they are merged into
+    # one, so the file count grows with data volume rather than with flushes.
+    #
+    # Queries prune partitions by directory name, read only the columns they
+    # aggregate and keep the latest audit of each (account, bill date), so
+    # re-uploaded bills count once.
+    def __init__(self, root="cache/audits", partition="month", flush_rows=500, flush_interval=30.0,
+                 compact_files=16, compact_bytes=8 * 1024 * 1024):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the audit store")
+        if partition not in PARTITION_KEYS:
+            raise ValueError(f"Unknown audit partition: {partition}")
+        self.root = root
+        self.partition = partition
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.compact_files = compact_files
+        self.compact_bytes = compact_bytes
+        self.schema = _schema()
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.files_written = 0
+        self.compactions = 0
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        # None when AUDIT_STORE_DIR is empty or pyarrow isn't installed
+        root = os.getenv("AUDIT_STORE_DIR", "cache/audits")
+        if not root:
+            return None
+        if pa is None:
+            print("Audit store disabled: pyarrow is not installed")
+            return None
+        return cls(
+            root=root,
+            partition=os.getenv("AUDIT_PARTITION", "month"),
+            flush_rows=int(os.getenv("AUDIT_FLUSH_ROWS", "500")),
+            flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "30")),
+        )
+
+    def _partition_of(self, row):
+        if self.partition == "month":
+            return f"month={_partition_value(row['month'])}"
+        return f"account={_partition_value(row['account_number'])}"
+
+    def append(self, data, anomalies, severity, document=None):
+        with self._lock:
+            self._buffer.append(audit_row(data, anomalies, severity, document))
+            self.appended += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (len(self._buffer) >= self.flush_rows
+                   or time.monotonic() - self._oldest >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer, self._oldest = self._buffer, [], None
+            partitions = {}
+            for row in rows:
+                partitions.setdefault(self._partition_of(row), []).append(row)
+            for partition, part_rows in partitions.items():
+                directory = os.path.join(self.root, partition)
+                os.makedirs(directory, exist_ok=True)
+                self._write(directory, pa.Table.from_pylist(part_rows, schema=self.schema))
+                self._compact(directory)
+        return len(rows)
+
+    def _write(self, directory, table):
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet")
+        # Written under a temporary name so scans never see a partial file
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+        self.files_written += 1
+
+    def _compact(self, directory):
+        small = [path for path in sorted(glob.glob(os.path.join(directory, "*.parquet")))
+                 if os.path.getsize(path) < self.compact_bytes]
+        if len(small) < self.compact_files:
+            return
+        # Rows keep their order, so the newest audit of a bill stays last
+        self._write(directory, pa.concat_tables([pq.read_table(path, schema=self.schema) for path in small]))
+        for path in small:
+            os.remove(path)
+        self.compactions += 1
+
+    def _files(self, start_month=None, end_month=None, account=None):
+        files = []
+        for directory in sorted(glob.glob(os.path.join(self.root, f"{self.partition}=*"))):
+            value = os.path.basename(directory).split("=", 1)[1]
+            if self.partition == "month" and value != "unknown":
+                if (start_month and value < start_month) or (end_month and value > end_month):
+                    continue
+            if self.partition == "account" and account and value != _partition_value(account):
+                continue
+            files.extend(sorted(glob.glob(os.path.join(directory, "*.parquet"))))
+        return files
+
+    def scan(self, columns, start_month=None, end_month=None, account=None):
+        # Latest audit of each bill within the filters, as a pyarrow Table
+        # holding only `columns`
+        self.flush()
+        keys = ["account_number", "bill_date"]
+        wanted = list(dict.fromkeys(keys + ["audited_at", "month"] + list(columns)))
+        condition = None
+        for expression in (
+            ds.field("month") >= start_month if start_month else None,
+            ds.field("month") <= end_month if end_month else None,
+            ds.field("account_number") == account if account else None,
+        ):
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+
+        # Held while reading so a compaction can't remove files mid-scan
+        with self._lock:
+            files = self._files(start_month, end_month, account)
+            if not files:
+                return self.schema.empty_table().select(wanted)
+            dataset = ds.dataset(files, schema=self.schema, format="parquet")
+            table = dataset.to_table(columns=wanted, filter=condition)
+
+        # Keep the newest row per bill; rows without a key can't be matched
+        # up and are all kept
+        keyed = pc.and_(pc.is_valid(table["account_number"]), pc.is_valid(table["bill_date"]))
+        unkeyed = table.filter(pc.invert(keyed))
+        table = table.filter(keyed).sort_by([("audited_at", "ascending")])
+        rows = table.append_column("_row", pa.array(range(table.num_rows), pa.int64()))
+        latest = rows.group_by(keys).aggregate([("_row", "max")])["_row_max"]
+        # `latest` holds row numbers; sorting them keeps audit order
+        return pa.concat_tables([table.take(latest.take(pc.sort_indices(latest))), unkeyed])
+
+    def aggregates(self, start_month=None, end_month=None, account=None):
+        table = self.scan(
+            ["total_amount", "usage_kwh", "overcharge", "rate_overcharge", "billing_discrepancy",
+             "anomaly_count", "critical_count", "high_count", "anomaly_types"],
+            start_month, end_month, account,
+        )
+
+        def total(column):
+            return pc.sum(table[column]).as_py() or 0
+
+        amount, usage = total("total_amount"), total("usage_kwh")
+        issue_counts = pc.value_counts(pc.list_flatten(table["anomaly_types"])).to_pylist()
+
+        by_month = table.group_by("month").aggregate([
+            ("total_amount", "sum"), ("usage_kwh", "sum"), ("overcharge", "sum"),
+            ("critical_count", "sum"), ("month", "count"),
+        ]).sort_by("month").to_pylist()
+
+        by_account = table.group_by("account_number").aggregate([
+            ("overcharge", "sum"), ("anomaly_count", "sum"), ("total_amount", "sum"), ("account_number", "count"),
+        ]).sort_by([("overcharge_sum", "descending"), ("anomaly_count_sum", "descending")])
+
+        return {
+            "bills": table.num_rows,
+            "accounts": pc.count_distinct(table["account_number"]).as_py(),
+            "period_start": pc.min(table["month"]).as_py(),
+            "period_end": pc.max(table["month"]).as_py(),
+            "total_amount": round(amount, 2),
+            "total_usage_kwh": round(usage, 2),
+            "average_rate": round(amount / usage, 4) if usage else None,
+            "total_overcharge": round(total("overcharge"), 2),
+            "rate_overcharge": round(total("rate_overcharge"), 2),
+            "billing_discrepancy": round(total("billing_discrepancy"), 2),
+            "total_issues": total("anomaly_count"),
+            "critical_issues": total("critical_count"),
+            "high_priority_issues": total("high_count"),
+            "bills_with_issues": pc.sum(pc.greater(table["anomaly_count"], 0)).as_py() or 0,
+            "issue_counts": {item["values"]: item["counts"] for item in issue_counts},
+            "by_month": [
+                {
+                    "month": row["month"],
+                    "bills": row["month_count"],
+                    "total_amount": round(row["total_amount_sum"] or 0.0, 2),
+                    "average_rate": round(row["total_amount_sum"] / row["usage_kwh_sum"], 4)
+                    if row["usage_kwh_sum"] else None,
+                    "overcharge": round(row["overcharge_sum"] or 0.0, 2),
+                    "critical_issues": row["critical_count_sum"],
+                }
+                for row in by_month
+            ],
+            "top_accounts": [
+                {
+                    "account": row["account_number"],
+                    "bills": row["account_number_count"],
+                    "issues": row["anomaly_count_sum"],
+                    "amount": round(row["total_amount_sum"] or 0.0, 2),
+                    "overcharge": round(row["overcharge_sum"] or 0.0, 2),
+                }
+                for row in by_account.slice(0, TOP_ACCOUNTS).to_pylist()
+            ],
+        }
+
+    def stats(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        files = glob.glob(os.path.join(self.root, "*=*", "*.parquet"))
+        return {
+            "root": self.root,
+            "partition": self.partition,
+            "appended": self.appended,
+            "buffered": buffered,
+            "files": len(files),
+            "compactions": self.compactions,
+            "bytes": sum(os.path.getsize(f) for f in files),
+        }
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import json
+import os
+import re
+
+from llm import LLMUnavailable
+
+
+BATCH_PROMPT = (
+    "Summarize the billing issues of each bill below in 2 sentences.\n"
+    "Respond with only a JSON object mapping each bill id to its summary, "
+    'e.g. {{"B1": "...", "B2": "..."}}.\n\n{bills}'
+)
+
+# Rough size of a summary in tokens, used to size max_tokens for a batch
+TOKENS_PER_SUMMARY = 100
+
+JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class SummaryParseError(Exception):
+    # The batched answer didn't contain a usable summary for this bill;
+    # the caller should ask for it on its own.
+    pass
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting English prompts
+    return len(text) // 4 + 1
+
+
+def build_prompt(entries):
+    # entries: [(bill_id, anomaly_text)]
+    bills = "\n".join(f"[{bill_id}]\n{anomaly_text}" for bill_id, anomaly_text in entries)
+    return BATCH_PROMPT.format(bills=bills)
+
+
+def parse_summaries(text, bill_ids):
+    # Returns {bill_id: summary} for every id the model answered with a
+    # non-empty string; anything else (prose around the JSON, missing or
+    # garbled entries) is simply left out.
+    match = JSON_OBJECT_RE.search(text or "")
+    if not match:
+        return {}
+    try:
+        parsed = json.loads(match.group())
+    except ValueError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {
+        bill_id: parsed[bill_id].strip()
+        for bill_id in bill_ids
+        if isinstance(parsed.get(bill_id), str) and parsed[bill_id].strip()
+    }
+
+
+class SummaryBatcher:
+    # Collects summary requests that arrive close together (a batch upload
+    # analyzing many bills) and sends them as one model call. A batch is sent
+    # once it holds `max_bills` bills, once adding another would exceed
+    # `max_tokens` of prompt, or `linger` seconds after its first request.
+    # Each caller gets its own summary back, LLMUnavailable when the call
+    # failed, or SummaryParseError when the answer had nothing for its bill.
+    def __init__(self, client, max_bills=20, max_tokens=4000, linger=0.05):
+        self.client = client
+        self.max_bills = max(1, max_bills)
+        self.max_tokens = max_tokens
+        self.linger = linger
+        self._entries = []
+        self._tokens = 0
+        self._timer = None
+        self._context = None
+        self._counts = {"batches": 0, "bills": 0, "parse_failures": 0, "failed_batches": 0}
+
+    @classmethod
+    def from_env(cls, client):
+        return cls(
+            client,
+            max_bills=int(os.getenv("LLM_BATCH_SIZE", "20")),
+            max_tokens=int(os.getenv("LLM_BATCH_MAX_TOKENS", "4000")),
+            linger=float(os.getenv("LLM_BATCH_LINGER_MS", "50")) / 1000,
+        )
+
+    @property
+    def enabled(self):
+        return self.max_bills > 1
+
+    def stats(self):
+        batches = self._counts["batches"]
+        return {
+            **self._counts,
+            "mean_batch_size": round(self._counts["bills"] / batches, 2) if batches else None,
+        }
+
+    async def summarize(self, anomaly_text):
+        future = asyncio.get_running_loop().create_future()
+        tokens = estimate_tokens(anomaly_text) + 4
+        if self._entries and self._tokens + tokens > self.max_tokens:
+            self._flush()
+        if not self._entries:
+            # The batch's model call runs in the context of the request that
+            # opened it (its metrics are labeled with that endpoint), not of
+            # whichever request happens to fill it
+            self._context = contextvars.copy_context()
+        self._entries.append((anomaly_text, future))
+        self._tokens += tokens
+        if len(self._entries) >= self.max_bills:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        entries, self._entries, self._tokens = self._entries, [], 0
+        if entries:
+            self._context.run(asyncio.ensure_future, self._send(entries))
+
+    async def _send(self, entries):
+        bill_ids = [f"B{i}" for i in range(1, len(entries) + 1)]
+        prompt = build_prompt([(bill_id, text) for bill_id, (text, _) in zip(bill_ids, entries)])
+        self._counts["batches"] += 1
+        self._counts["bills"] += len(entries)
+        try:
+            text = await self.client.complete(prompt, max_tokens=TOKENS_PER_SUMMARY * len(entries) + 50)
+        except Exception as e:
+            self._counts["failed_batches"] += 1
+            error = e if isinstance(e, LLMUnavailable) else LLMUnavailable(f"Batched summary failed: {e}")
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        summaries = parse_summaries(text, bill_ids)
+        for bill_id, (_, future) in zip(bill_ids, entries):
+            if future.done():
+                continue
+            if bill_id in summaries:
+                future.set_result(summaries[bill_id])
+            else:
+                self._counts["parse_failures"] += 1
+                future.set_exception(SummaryParseError(f"No summary for {bill_id} in batched answer"))
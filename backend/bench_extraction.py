@@ -0,0 +1,141 @@
+"""Micro-benchmark: single-pass field engine vs. the old per-key re.search loop.
+
+Usage:
+    python bench_extraction.py                 # built-in sample bill text
+    python bench_extraction.py ../generated_bills --repeat 200
+
+Each document is also padded with filler lines to show how both approaches
+scale with length:
+  inserts   plain marketing text, as on real multi-page bills
+  mentions  trailing insert pages that mention "Tier 2" on a bill with no
+            Tier 2 row; the old `Tier 2.*?` patterns fail after rescanning
+            the rest of the document from every mention, so they go quadratic
+"""
+import argparse
+import glob
+import os
+import re
+import time
+
+from extraction import extract_fields
+
+
+# The pattern table and loop used before the single-pass engine, kept here
+# verbatim as the baseline.
+LEGACY_PATTERNS = {
+    "account_number": r"Account Number:\s*(\d{4}-\d{4}-\d{4})",
+    "bill_date": r"Bill Date:\s*([A-Za-z]{3} \d{2}, \d{4})",
+    "total_amount": r"Total Due:\s*\$(\d+\.\d{2})",
+    "usage_kwh": r"MC-\d+\s+[\d,]+\s+[\d,]+\s+[\d.]+\s+(?:<b>)?(\d+)(?:</b>)?",
+    "customer_charge": r"Customer Charge.*?\$(\d+\.\d{2})",
+    "tier1_rate": r"Tier 1.*?\$(\d+\.\d{2})\s+\d+\s+kWh",
+    "tier1_usage": r"Tier 1.*?\$\d+\.\d{2}\s+(\d+)\s+kWh",
+    "tier1_cost": r"Tier 1.*?\$\d+\.\d{2}\s+\d+\s+kWh\s+\$(\d+\.\d{2})",
+    "tier2_rate": r"Tier 2.*?\$(\d+\.\d{2})\s+\d+\s+kWh",
+    "tier2_usage": r"Tier 2.*?\$\d+\.\d{2}\s+(\d+)\s+kWh",
+    "tier2_cost": r"Tier 2.*?\$\d+\.\d{2}\s+\d+\s+kWh\s+\$(\d+\.\d{2})",
+    "dist_charge": r"Distribution.*?\$(\d+\.\d{2})",
+    "taxes": r"Taxes.*?\$(\d+\.\d{2})",
+}
+
+
+def legacy_extract_fields(text):
+    data = {}
+    for key, pattern in LEGACY_PATTERNS.items():
+        match = re.search(pattern, text, re.MULTILINE | re.DOTALL)
+        if match:
+            val = next((g for g in match.groups() if g is not None), None)
+            if val:
+                val = val.replace(',', '')
+                try:
+                    if "usage" in key:
+                        data[key] = int(val)
+                    else:
+                        data[key] = float(val)
+                except:
+                    pass
+    return data
+
+
+SAMPLE_TEXT = """METRO CITY POWER 123 Utility Way, Metro City, ST 12345
+Customer Service: 1-800-555-0199
+Account Number: 8271-4523-0019 Previous Balance: $0.00
+Service Address: 123 Maple Ave, Metro City Payments Received: $0.00
+Bill Date: Oct 01, 2024 Total New Charges: $106.26
+Total Due: $106.26
+Billing Period: Sep 01, 2024 - Sep 30, 2024
+Meter Reading Details
+Meter Number Previous Reading Current Reading Multiplier Total Usage (kWh)
+MC-8842 45,320 45,900 1.0 <b>580</b>
+Electric Charges Detail
+Description Rate/Unit Usage Amount
+Customer Charge Fixed - $10.00
+Energy Charge - Tier 1 (First 500 kWh) $0.13 500 kWh $65.00
+Energy Charge - Tier 2 (Over 500 kWh) $0.17 80 kWh $13.60
+Distribution Charges Variable - $8.00
+Taxes & Fees ~10% - $9.66
+Total Electric Charges $106.26"""
+
+SCENARIOS = {
+    "inserts": "Save energy and money by switching to LED bulbs! Visit our website for rebates and programs.",
+    "mentions": "Tier 2 pricing applies above 500 kWh. Visit our website for rebates and efficiency programs.",
+}
+
+
+def load_texts(directory):
+    import pdfplumber
+
+    texts = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.pdf"))):
+        with pdfplumber.open(path) as pdf:
+            texts.append((os.path.basename(path), "\n".join(p.extract_text() or "" for p in pdf.pages)))
+    return texts
+
+
+def pad(text, lines, scenario):
+    if scenario == "mentions":
+        text = "\n".join(line for line in text.split("\n") if "Tier 2" not in line)
+        return text + "\n" + (SCENARIOS[scenario] + "\n") * lines
+    # Inserts land before the charges table, which is the worst case for the
+    # old loop: every `.*?` pattern has to walk past them.
+    head, sep, tail = text.partition("Electric Charges Detail")
+    return head + (SCENARIOS[scenario] + "\n") * lines + sep + tail
+
+
+def time_it(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="directory of bill PDFs (default: built-in sample)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--padding", type=int, nargs="+", default=[0, 100, 1000],
+                        help="filler lines inserted per document")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), nargs="+", default=sorted(SCENARIOS))
+    args = parser.parse_args()
+
+    texts = load_texts(args.directory) if args.directory else [("sample", SAMPLE_TEXT)]
+
+    print(f"{'document':<24}{'scenario':<10}{'filler':>7}{'chars':>9}{'legacy us':>12}{'engine us':>12}{'speedup':>9}  parity")
+    for name, text in texts:
+        for scenario, lines in [(s, n) for s in args.scenario for n in args.padding]:
+            doc = pad(text, lines, scenario)
+            legacy = legacy_extract_fields(doc)
+            engine = extract_fields(doc)
+            # The old loop could not store string fields (float() on them
+            # failed), so parity is checked on the fields it did return.
+            parity = all(engine.get(k) == v for k, v in legacy.items())
+
+            repeat = max(1, args.repeat // (1 + lines // 100))
+            legacy_us = time_it(legacy_extract_fields, doc, repeat)
+            engine_us = time_it(extract_fields, doc, repeat)
+            print(f"{name[:23]:<24}{scenario:<10}{lines:>7}{len(doc):>9}{legacy_us:>12.1f}{engine_us:>12.1f}"
+                  f"{legacy_us / engine_us:>8.1f}x  {'ok' if parity else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
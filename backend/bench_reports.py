@@ -0,0 +1,165 @@
+"""Benchmark: PDFs rendered per second by the report renderer.
+
+Usage:
+    python bench_reports.py                      # 200 single-bill reports
+    python bench_reports.py --count 1000 --workers 1 2 4 8
+    python bench_reports.py --combined-bills 500 # plus one large combined report
+
+Compares three ways of rendering the same single-bill reports:
+  legacy    the renderer used before report_rendering.py had cached styles:
+            stylesheet and title style rebuilt per PDF, raw lines handed to
+            Paragraph (kept here verbatim as the baseline)
+  serial    render_report_pdf() one after another, styles built once
+  parallel  render_many() on a process pool, once per --workers value
+
+The legacy renderer prints **, | and - markers literally and raises on model
+output containing "<" or "&" (ReportLab parses it as markup); the sample
+reports avoid those so it can be timed. Because the new renderer lays out
+real bold runs, bullets and tables it does more work per page, so "serial"
+can trail "legacy"; the "styles" line shows what the cached stylesheet saves
+per PDF. Parallel rendering only pays off with more than one CPU.
+"""
+import argparse
+import os
+import random
+import time
+from io import BytesIO
+
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from report_rendering import build_styles, render_many, render_report_pdf
+
+
+def legacy_render(report_text):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor='#1e40af',
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+    story.append(Paragraph("BillGuard AI - Combined Audit Report", title_style))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Report content
+    paragraphs = report_text.split('\n')
+
+    for para in paragraphs:
+        if para.strip():
+            if para.startswith('**') and para.endswith('**'):
+                # Heading
+                story.append(Paragraph(para.replace('**', ''), styles['Heading2']))
+            elif para.startswith('#'):
+                # Heading
+                story.append(Paragraph(para.replace('#', '').strip(), styles['Heading3']))
+            else:
+                # Normal text
+                story.append(Paragraph(para, styles['BodyText']))
+            story.append(Spacer(1, 0.1*inch))
+
+    doc.build(story)
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+def sample_bill_report(rng):
+    usage = rng.randint(300, 1500)
+    total = round(usage * rng.uniform(0.14, 0.2) + 18, 2)
+    issues = rng.sample([
+        ("Usage Spike", f"Usage of {usage} kWh is well above the historical average"),
+        ("Calculation Error", "Line items do not add up to the total due"),
+        ("Incorrect Rate", "Tier 1 rate is higher than the published tariff"),
+    ], rng.randint(0, 3))
+    lines = [
+        "## Bill Summary",
+        f"Account **{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}** used {usage} kWh "
+        f"for a total of ${total:.2f}.",
+        "",
+        "## Issues Found",
+    ]
+    lines += [f"- **{kind}**: {detail}" for kind, detail in issues] or ["- No issues detected"]
+    lines += [
+        "",
+        "## Charges",
+        "| Item | Amount |",
+        "|---|---|",
+        "| Customer Charge | $10.00 |",
+        f"| Energy | ${total - 18:.2f} |",
+        "| Distribution | $8.00 |",
+        "",
+        "## Recommendations",
+        "1. Review the flagged line items with the utility",
+        "2. Request a corrected bill if the *rate* or *total* is wrong",
+    ]
+    return "\n".join(lines)
+
+
+def sample_combined_report(rng, bills):
+    lines = ["# Executive Summary", f"Analyzed {bills} bills across the portfolio.", "", "## Top Accounts"]
+    lines += [f"- Account {rng.randint(1000, 9999)}: ${rng.uniform(100, 900):.2f}, "
+              f"{rng.randint(0, 3)} issue(s)" for _ in range(bills)]
+    return "\n".join(lines)
+
+
+def rate(fn, reports):
+    start = time.perf_counter()
+    fn(reports)
+    elapsed = time.perf_counter() - start
+    return len(reports) / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200, help="single-bill reports to render")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--combined-bills", type=int, default=0,
+                        help="also time one combined report listing this many bills")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reports = [sample_bill_report(rng) for _ in range(args.count)]
+    # Warm up imports and fonts so the first mode isn't penalized
+    render_report_pdf(reports[0], "bill")
+    legacy_render(reports[0])
+
+    runs = [("legacy", lambda rs: [legacy_render(r) for r in rs]),
+            ("serial", lambda rs: [render_report_pdf(r, "bill") for r in rs])]
+    runs += [(f"parallel x{w}", lambda rs, w=w: render_many(rs, workers=w)) for w in args.workers]
+
+    print(f"{'mode':<14}{'reports':>9}{'seconds':>10}{'PDFs/s':>10}{'vs legacy':>11}")
+    baseline = None
+    for name, fn in runs:
+        per_second, elapsed = rate(fn, reports)
+        baseline = baseline or per_second
+        print(f"{name:<14}{len(reports):>9}{elapsed:>10.2f}{per_second:>10.1f}{per_second / baseline:>10.1f}x")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        build_styles()
+    print(f"styles: {(time.perf_counter() - start) * 10:.2f} ms per PDF rebuilding the stylesheet, 0 when cached "
+          f"({os.cpu_count()} CPU(s))")
+
+    if args.combined_bills:
+        text = sample_combined_report(rng, args.combined_bills)
+        for name, fn in [("legacy", legacy_render), ("serial", lambda t: render_report_pdf(t, "combined"))]:
+            start = time.perf_counter()
+            pdf = fn(text)
+            print(f"combined {args.combined_bills} bills, {name}: {time.perf_counter() - start:.2f}s, "
+                  f"{len(pdf) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
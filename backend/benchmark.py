@@ -0,0 +1,348 @@
+"""End-to-end benchmark: extraction, detection, /api/analyze and combined reports.
+
+Usage:
+    python ../generate_bills.py --count 200 --out ../corpus
+    python benchmark.py ../corpus --out baseline.json
+    python benchmark.py ../corpus --out after.json --compare baseline.json
+
+Stages (latency is per call; throughput is calls per wall-clock second):
+  extract[mode]   extract_data_from_pdf() on each PDF, once per --modes value
+  detect          AnomalyDetector.detect() on each extracted bill
+  detect_batch    AnomalyDetector.detect_batch() on all of them at once (per
+                  call; bills_per_s for comparison), checked against detect()
+  analyze         POST /api/analyze through an in-process ASGI client, with
+                  --concurrency requests in flight (503s are retried after
+                  Retry-After) and AI summaries answered by stub_llm.py,
+                  started on a local port
+  report_llm[N]   CombinedReportBuilder.build() for an N-bill portfolio with
+                  a stubbed report model, once per --report-sizes value
+  report_pdf[N]   render_combined_report_pdf() of that report
+
+Caches and artifacts go to a temporary directory, and the extraction cache
+is off, so every analyze request extracts its PDF. Results are written as
+JSON; --compare prints the change against an earlier run and exits with
+status 1 when any stage's p95 latency regressed by more than --threshold %.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+# --- Measurement ---
+
+def percentile(values, pct):
+    # Nearest rank, as /health reports it
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(samples_ms, wall_seconds):
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+        "throughput_per_s": round(len(samples_ms) / wall_seconds, 2) if wall_seconds else None,
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+# --- Stub models ---
+
+def start_stub_llm(latency):
+    # stub_llm reads its latency at import, so the env var is set first
+    os.environ["STUB_LLM_LATENCY"] = str(latency)
+    import uvicorn
+    import stub_llm
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub_llm.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def stub_report_model(latency):
+    # Stands in for Gemini: a fixed-shape markdown report sized like a real
+    # answer, with the prompt length folded in so chunks differ
+    async def generate(prompt):
+        await asyncio.sleep(latency)
+        rng = random.Random(len(prompt))
+        lines = ["# Executive Summary",
+                 f"The portfolio shows {rng.randint(1, 40)} billing issues worth reviewing.", "",
+                 "## Key Findings"]
+        lines += [f"- **Account {rng.randint(1000, 9999)}**: {rng.choice(['usage spike', 'rate error', 'calculation error'])} "
+                  f"of ${rng.uniform(5, 300):.2f}" for _ in range(12)]
+        lines += ["", "## Breakdown", "| Issue | Count |", "|---|---|"]
+        lines += [f"| {kind} | {rng.randint(0, 20)} |" for kind in ("Usage Spike", "Rate Error", "Calculation Error")]
+        lines += ["", "## Recommendations"]
+        lines += [f"{i}. Follow up on the flagged accounts with the utility" for i in range(1, 6)]
+        return "\n".join(lines)
+    return generate
+
+
+# --- Stages ---
+
+def bench_extract(files, modes):
+    from extraction import extract_data_from_pdf
+
+    stages, extracted = {}, []
+    for mode in modes:
+        samples, data = [], []
+        start = time.perf_counter()
+        for _, contents in files:
+            result, ms = timed(extract_data_from_pdf, contents, mode)
+            samples.append(ms)
+            data.append(result)
+        stages[f"extract[{mode}]"] = summarize(samples, time.perf_counter() - start)
+        extracted = extracted or data
+    return stages, [d for d in extracted if d]
+
+
+def bench_detect(bills, repeat):
+    from detection import AnomalyDetector
+
+    detector = AnomalyDetector()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in bills:
+            samples.append(timed(detector.detect, data)[1])
+    stages = {"detect": summarize(samples, time.perf_counter() - start)}
+
+    # The same bills as one portfolio per call; must agree with detect()
+    expected = [detector.detect(data) for data in bills]
+    result, _ = timed(detector.detect_batch, bills)
+    if list(zip(*result)) != expected:
+        raise SystemExit("detect_batch() disagrees with detect()")
+    samples = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        samples.append(timed(detector.detect_batch, bills)[1])
+    stage = summarize(samples, time.perf_counter() - start)
+    stage.update(bills=len(bills), bills_per_s=round(len(bills) * 1000 / stage["mean_ms"]) if stage["mean_ms"] else None)
+    stages["detect_batch"] = stage
+    return stages
+
+
+async def bench_analyze(main, files, concurrency):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, results, failures, retries = [], [], 0, 0
+
+    async def post(client, filename, contents):
+        # 503 means the extraction pool is full; like a real client, wait
+        # for Retry-After and try again. Latency includes the retries.
+        nonlocal failures, retries
+        async with semaphore:
+            start = time.perf_counter()
+            while True:
+                response = await client.post("/api/analyze", files={"file": (filename, contents, "application/pdf")})
+                if response.status_code != 503:
+                    break
+                retries += 1
+                await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+            samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code == 200:
+            body = response.json()
+            results.append({k: body[k] for k in ("filename", "data", "anomalies", "severity")})
+        else:
+            failures += 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(post(client, name, contents) for name, contents in files))
+        wall = time.perf_counter() - start
+
+    stage = summarize(samples, wall)
+    stage.update(failed=failures, retried=retries, concurrency=concurrency)
+    return {"analyze": stage}, results
+
+
+async def bench_reports(main, results, sizes, repeat, latency):
+    from report_rendering import render_combined_report_pdf
+
+    generate = stub_report_model(latency)
+    rng = random.Random(0)
+    stages = {}
+    for size in sizes:
+        portfolio = [dict(rng.choice(results), filename=f"bill{i}.pdf") for i in range(size)]
+        llm_samples, pdf_samples, calls = [], [], 0
+        llm_wall = pdf_wall = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            report, stats = await main.combined_report_builder.build(portfolio, generate)
+            elapsed = time.perf_counter() - start
+            llm_samples.append(elapsed * 1000)
+            llm_wall += elapsed
+            calls = stats["llm_calls"]
+
+            _, ms = timed(render_combined_report_pdf, report)
+            pdf_samples.append(ms)
+            pdf_wall += ms / 1000
+        stages[f"report_llm[{size}]"] = dict(summarize(llm_samples, llm_wall), llm_calls=calls)
+        stages[f"report_pdf[{size}]"] = summarize(pdf_samples, pdf_wall)
+    return stages
+
+
+# --- Output ---
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_stages(stages):
+    print(f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>10}")
+    for name, s in stages.items():
+        print(f"{name:<22}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+              f"{s['throughput_per_s'] or 0:>10.1f}")
+
+
+def compare(stages, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit')}):")
+    print(f"{'stage':<22}{'p50 ms':>18}{'p95 ms':>18}{'p95 change':>12}")
+    for name, s in stages.items():
+        old = baseline["stages"].get(name)
+        if not old:
+            continue
+        change = (s["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<22}{old['p50_ms']:>8.2f} ->{s['p50_ms']:>8.2f}{old['p95_ms']:>8.2f} ->{s['p95_ms']:>8.2f}"
+              f"{change:>+11.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="directory of bill PDFs (e.g. from generate_bills.py --count)")
+    parser.add_argument("--limit", type=int, help="use at most this many PDFs")
+    parser.add_argument("--stages", nargs="+", default=["extract", "detect", "analyze", "report"],
+                        choices=["extract", "detect", "analyze", "report"])
+    parser.add_argument("--modes", nargs="+", default=None, help="extraction modes (default: EXTRACTION_MODE)")
+    parser.add_argument("--detect-repeat", type=int, default=20, help="passes over the corpus for detect")
+    parser.add_argument("--concurrency", type=int, default=8, help="analyze requests in flight")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub model latency in seconds")
+    parser.add_argument("--report-sizes", type=int, nargs="+", default=[25, 500])
+    parser.add_argument("--report-repeat", type=int, default=3)
+    parser.add_argument("--out", default="benchmark.json", help="where to write the results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p95 regression threshold in percent")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")))[:args.limit]
+    if not paths:
+        parser.error(f"no PDFs in {args.corpus}")
+    files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+
+    # Isolate the app's caches and artifacts from a real deployment, and
+    # point AI summaries at the stub before main reads its configuration
+    workdir = tempfile.mkdtemp(prefix="billguard-bench-")
+    os.environ.update({
+        "EXTRACTION_CACHE_SIZE": "0",
+        "EXTRACTION_CACHE_PATH": "",
+        "SUMMARY_CACHE_PATH": "",
+        "ARTIFACT_DIR": os.path.join(workdir, "artifacts"),
+        "BILL_HISTORY_PATH": os.path.join(workdir, "history.db"),
+        "AUDIT_STORE_DIR": os.path.join(workdir, "audits"),
+        "JOB_BACKEND": "memory",
+    })
+    stub_server = None
+    if "analyze" in args.stages:
+        stub_server, stub_url = start_stub_llm(args.llm_latency)
+        os.environ.update({"ANTHROPIC_API_KEY": "stub", "ANTHROPIC_BASE_URL": stub_url})
+
+    from extraction import EXTRACTION_MODE
+    modes = args.modes or [EXTRACTION_MODE]
+
+    stages = {}
+    print(f"Benchmarking {len(files)} PDFs from {args.corpus}...")
+    extract_stages, bills = bench_extract(files, modes)
+    if "extract" in args.stages:
+        stages.update(extract_stages)
+    if "detect" in args.stages:
+        stages.update(bench_detect(bills, args.detect_repeat))
+
+    if "analyze" in args.stages or "report" in args.stages:
+        import main as app_main
+
+        async def run_app_stages():
+            results = [{"filename": name, "data": data, "anomalies": app_main.detector.detect(data)[0]}
+                       for (name, _), data in zip(files, bills)]
+            try:
+                if "analyze" in args.stages:
+                    analyze_stages, results = await bench_analyze(app_main, files, args.concurrency)
+                    stages.update(analyze_stages)
+                if "report" in args.stages:
+                    stages.update(await bench_reports(app_main, results, args.report_sizes, args.report_repeat,
+                                                      args.llm_latency))
+            finally:
+                await app_main.llm_client.close()
+                app_main.extraction_pool.shutdown()
+
+        asyncio.run(run_app_stages())
+
+    if stub_server:
+        stub_server.should_exit = True
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "corpus": os.path.abspath(args.corpus),
+            "files": len(files),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "stages": stages,
+    }
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+
+    print_stages(stages)
+    print(f"Wrote {args.out}")
+
+    if args.compare and compare(stages, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
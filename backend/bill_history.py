@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+# --- Running statistics ---
+# Welford's method: (count, mean, m2) absorbs or gives back one value in O(1),
+# so per-account stats stay current without rereading past bills. m2 is the
+# sum of squared deviations; variance = m2 / (count - 1).
+
+def welford_add(stats, x):
+    n, mean, m2 = stats
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    return n, mean, m2 + delta * (x - mean)
+
+
+def welford_remove(stats, x):
+    n, mean, m2 = stats
+    if n <= 1:
+        return 0, 0.0, 0.0
+    new_mean = (n * mean - x) / (n - 1)
+    return n - 1, new_mean, max(0.0, m2 - (x - new_mean) * (x - mean))
+
+
+def welford_std(stats):
+    n, _, m2 = stats
+    return (m2 / (n - 1)) ** 0.5 if n > 1 else 0.0
+
+
+def parse_bill_date(value):
+    # Bills print "Oct 01, 2024"; stored as ISO so rows sort by date
+    try:
+        return datetime.strptime(value, "%b %d, %Y").date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+# Fields the detector adds to a bill before evaluating rules. "history_*"
+# covers the account's readings dated before the bill and "season_*" those
+# from the same calendar month in earlier years. Neither the bill itself nor
+# anything dated after it is part of its baseline, so an older bill uploaded
+# late is not judged against its own future.
+BASELINE_FIELDS = ("history_bills", "history_mean_kwh", "history_std_kwh",
+                   "season_bills", "season_mean_kwh", "season_std_kwh")
+
+
+# Next to this module rather than the working directory, so the API and the
+# CLIs share one history wherever they are started from
+DEFAULT_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "history.db")
+
+
+class BillHistory:
+    # Per-account usage history in SQLite, keyed by (account_number,
+    # bill_date). Alongside the bills it keeps running usage stats per account
+    # and per account and calendar month, updated on every insert, together
+    # with the latest reading each covers. A baseline for the account's newest
+    # bill (the usual case: this month's bill) is then two primary-key reads
+    # however long the history is; only a late upload of an older bill needs
+    # a range scan over the readings dated before it.
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bills ("
+            " account_number TEXT NOT NULL, bill_date TEXT NOT NULL, usage_kwh REAL NOT NULL,"
+            " total_amount REAL, recorded_at REAL NOT NULL,"
+            " PRIMARY KEY (account_number, bill_date))"
+        )
+        # month = 0 holds the account's overall stats, 1-12 the seasonal profile
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usage_stats ("
+            " account_number TEXT NOT NULL, month INTEGER NOT NULL,"
+            " count INTEGER NOT NULL, mean REAL NOT NULL, m2 REAL NOT NULL,"
+            " latest_date TEXT, latest_kwh REAL,"
+            " PRIMARY KEY (account_number, month))"
+        )
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(usage_stats)")}
+        if "latest_date" not in existing:
+            # Histories from before latest_* was tracked
+            self._db.execute("ALTER TABLE usage_stats ADD COLUMN latest_date TEXT")
+            self._db.execute("ALTER TABLE usage_stats ADD COLUMN latest_kwh REAL")
+            self._db.execute(
+                "UPDATE usage_stats SET latest_date = (SELECT MAX(b.bill_date) FROM bills b"
+                " WHERE b.account_number = usage_stats.account_number"
+                " AND (usage_stats.month = 0 OR CAST(substr(b.bill_date, 6, 2) AS INTEGER) = usage_stats.month))"
+            )
+            self._db.execute(
+                "UPDATE usage_stats SET latest_kwh = (SELECT b.usage_kwh FROM bills b"
+                " WHERE b.account_number = usage_stats.account_number AND b.bill_date = usage_stats.latest_date)"
+            )
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.recorded = 0
+
+    @classmethod
+    def from_env(cls):
+        # BILL_HISTORY_PATH= (empty) turns per-account baselines off
+        path = os.getenv("BILL_HISTORY_PATH", DEFAULT_HISTORY_PATH)
+        return cls(path) if path else None
+
+    def _stats(self, account, month):
+        # ((count, mean, m2), (latest_date, latest_kwh))
+        row = self._db.execute(
+            "SELECT count, mean, m2, latest_date, latest_kwh FROM usage_stats WHERE account_number = ? AND month = ?",
+            (account, month),
+        ).fetchone()
+        return (tuple(row[:3]), tuple(row[3:])) if row else ((0, 0.0, 0.0), (None, None))
+
+    def _save_stats(self, account, month, stats, latest):
+        self._db.execute(
+            "INSERT INTO usage_stats (account_number, month, count, mean, m2, latest_date, latest_kwh)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (account_number, month) DO UPDATE SET"
+            " count = excluded.count, mean = excluded.mean, m2 = excluded.m2,"
+            " latest_date = excluded.latest_date, latest_kwh = excluded.latest_kwh",
+            (account, month, *stats, *latest),
+        )
+
+    def record(self, data):
+        # Adds one extracted bill. Re-recording the same account and date
+        # replaces the earlier reading instead of counting it twice. Returns
+        # False for bills without an account, date or usage.
+        account = data.get("account_number")
+        bill_date = parse_bill_date(data.get("bill_date"))
+        usage = data.get("usage_kwh")
+        if not account or not bill_date or not usage:
+            return False
+        month = int(bill_date[5:7])
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT usage_kwh FROM bills WHERE account_number = ? AND bill_date = ?",
+                    (account, bill_date),
+                ).fetchone()
+                if row is None or row[0] != usage:
+                    for m in (0, month):
+                        stats, latest = self._stats(account, m)
+                        if row is not None:
+                            stats = welford_remove(stats, row[0])
+                        if latest[0] is None or bill_date >= latest[0]:
+                            latest = (bill_date, usage)
+                        self._save_stats(account, m, welford_add(stats, usage), latest)
+                self._db.execute(
+                    "INSERT INTO bills (account_number, bill_date, usage_kwh, total_amount, recorded_at)"
+                    " VALUES (?, ?, ?, ?, ?) ON CONFLICT (account_number, bill_date) DO UPDATE SET"
+                    " usage_kwh = excluded.usage_kwh, total_amount = excluded.total_amount,"
+                    " recorded_at = excluded.recorded_at",
+                    (account, bill_date, usage, data.get("total_amount"), time.time()),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self.recorded += 1
+        return True
+
+    def baseline(self, data):
+        # BASELINE_FIELDS for this bill from the account's readings dated
+        # strictly before it. Bills without a readable date get none.
+        account = data.get("account_number")
+        if not account:
+            return {}
+        bill_date = parse_bill_date(data.get("bill_date"))
+        overall = season = (0, 0.0, 0.0)
+        if bill_date:
+            with self._lock:
+                self.lookups += 1
+                overall, latest = self._stats(account, 0)
+                season, season_latest = self._stats(account, int(bill_date[5:7]))
+                if latest[0] is not None and bill_date < latest[0]:
+                    # Older than the newest reading: the running stats include
+                    # its future, so add up the earlier readings instead
+                    rows = self._db.execute(
+                        "SELECT bill_date, usage_kwh FROM bills WHERE account_number = ? AND bill_date < ?",
+                        (account, bill_date),
+                    ).fetchall()
+                    overall = season = (0, 0.0, 0.0)
+                    for earlier, usage in rows:
+                        overall = welford_add(overall, usage)
+                        if earlier[5:7] == bill_date[5:7]:
+                            season = welford_add(season, usage)
+                elif bill_date == latest[0]:
+                    # The newest bill itself (a re-upload): take its reading out
+                    overall = welford_remove(overall, latest[1])
+                    season = welford_remove(season, season_latest[1])
+        return {
+            "history_bills": overall[0],
+            "history_mean_kwh": overall[1],
+            "history_std_kwh": welford_std(overall),
+            "season_bills": season[0],
+            "season_mean_kwh": season[1],
+            "season_std_kwh": welford_std(season),
+        }
+
+    def account(self, account_number, limit=24):
+        # Stats and most recent bills for one account, for the API
+        with self._lock:
+            bills = self._db.execute(
+                "SELECT bill_date, usage_kwh, total_amount FROM bills WHERE account_number = ?"
+                " ORDER BY bill_date DESC LIMIT ?",
+                (account_number, limit),
+            ).fetchall()
+            stats = self._db.execute(
+                "SELECT month, count, mean, m2 FROM usage_stats WHERE account_number = ? ORDER BY month",
+                (account_number,),
+            ).fetchall()
+        if not bills:
+            return None
+        summary = {month: {"bills": count, "mean_kwh": round(mean, 1),
+                           "std_kwh": round(welford_std((count, mean, m2)), 1)}
+                   for month, count, mean, m2 in stats if count}
+        return {
+            "account_number": account_number,
+            "overall": summary.get(0),
+            "monthly": {month: s for month, s in summary.items() if month},
+            "bills": [{"bill_date": d, "usage_kwh": u, "total_amount": t} for d, u, t in bills],
+        }
+
+    def stats(self):
+        with self._lock:
+            accounts, bills = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(count), 0) FROM usage_stats WHERE month = 0"
+            ).fetchone()
+        return {"path": self.path, "accounts": accounts, "bills": bills,
+                "recorded": self.recorded, "lookups": self.lookups}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
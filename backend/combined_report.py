@@ -0,0 +1,333 @@
+import asyncio
+import os
+from datetime import datetime
+
+
+# --- Combined report prompts ---
+# "single" sends every bill to the model in one prompt, which is fine for a
+# handful of bills. "mapreduce" summarizes bills in chunks (grouped by
+# account, in date order) in parallel, then combines the chunk summaries in
+# reduce rounds of at most `fanout` summaries, so no prompt grows with the
+# size of the portfolio. Either way the totals, counts and rates are
+# computed here, never by the model.
+
+REPORT_MODES = ("auto", "single", "mapreduce")
+
+REPORT_SECTIONS = """
+**Generate a comprehensive executive report with the following sections:**
+
+1. **Executive Summary** (3-4 sentences highlighting key findings)
+2. **Portfolio Overview** (aggregate metrics and trends)
+3. **Critical Findings** (detailed analysis of all issues found)
+4. **Financial Impact Analysis** (total overcharges, discrepancies, potential savings)
+5. {breakdown}
+6. **Recommended Actions** (prioritized action items with owners and deadlines)
+7. **Risk Assessment** (potential ongoing issues and monitoring recommendations)
+
+Format the report professionally with clear headings, bullet points, and actionable insights suitable for executive review.
+"""
+
+# Longest text kept from one bill line or one chunk summary, so a runaway
+# anomaly list or model answer can't blow the prompt bound
+BILL_LINE_MAX_CHARS = 600
+SUMMARY_MAX_CHARS = 2000
+
+# Accounts listed by name in the aggregates block
+TOP_ACCOUNTS = 10
+
+
+def parse_bill_date(value):
+    try:
+        return datetime.strptime(value, "%b %d, %Y")
+    except (TypeError, ValueError):
+        return None
+
+
+def portfolio_aggregates(results):
+    total_amount = 0
+    total_usage = 0
+    severity_counts = {}
+    issue_counts = {}
+    accounts = {}
+    dates = []
+    for result in results:
+        bill_data = result.get('data', {})
+        anomalies = result.get('anomalies', [])
+        total_amount += bill_data.get('total_amount', 0)
+        total_usage += bill_data.get('usage_kwh', 0)
+        for anomaly in anomalies:
+            severity_counts[anomaly.get('severity')] = severity_counts.get(anomaly.get('severity'), 0) + 1
+            issue_counts[anomaly['type']] = issue_counts.get(anomaly['type'], 0) + 1
+        account = accounts.setdefault(bill_data.get('account_number', 'N/A'), {"bills": 0, "issues": 0, "amount": 0})
+        account["bills"] += 1
+        account["issues"] += len(anomalies)
+        account["amount"] += bill_data.get('total_amount', 0)
+        date = parse_bill_date(bill_data.get('bill_date'))
+        if date:
+            dates.append(date)
+
+    top_accounts = sorted(accounts.items(), key=lambda item: (-item[1]["issues"], -item[1]["amount"]))[:TOP_ACCOUNTS]
+    return {
+        "bills": len(results),
+        "accounts": len(accounts),
+        "period_start": min(dates).strftime("%b %d, %Y") if dates else None,
+        "period_end": max(dates).strftime("%b %d, %Y") if dates else None,
+        "total_amount": round(total_amount, 2),
+        "total_usage_kwh": total_usage,
+        "average_rate": round(total_amount / max(1, total_usage), 3),
+        "total_issues": sum(issue_counts.values()),
+        "critical_issues": severity_counts.get('critical', 0),
+        "high_priority_issues": severity_counts.get('high', 0),
+        "bills_with_issues": sum(1 for r in results if r.get('anomalies')),
+        "issue_counts": issue_counts,
+        "top_accounts": [
+            {"account": name, "bills": a["bills"], "issues": a["issues"], "amount": round(a["amount"], 2)}
+            for name, a in top_accounts
+        ],
+    }
+
+
+def format_aggregates(agg):
+    lines = [
+        f"- Bills Analyzed: {agg['bills']} across {agg['accounts']} account(s)",
+    ]
+    if agg["period_start"]:
+        lines.append(f"- Billing Period: {agg['period_start']} to {agg['period_end']}")
+    lines += [
+        f"- Total Amount Across All Bills: ${agg['total_amount']:.2f}",
+        f"- Total Usage: {agg['total_usage_kwh']} kWh",
+        f"- Average Rate: ${agg['average_rate']:.3f}/kWh",
+        f"- Total Issues Found: {agg['total_issues']} on {agg['bills_with_issues']} bill(s)",
+        f"- Critical Issues: {agg['critical_issues']}",
+        f"- High Priority Issues: {agg['high_priority_issues']}",
+    ]
+    for issue_type, count in sorted(agg["issue_counts"].items(), key=lambda item: -item[1]):
+        lines.append(f"- {issue_type}: {count}")
+    return "\n".join(lines)
+
+
+def format_top_accounts(agg):
+    return "\n".join(
+        f"- Account {a['account']}: {a['bills']} bill(s), {a['issues']} issue(s), ${a['amount']:.2f}"
+        for a in agg["top_accounts"]
+    )
+
+
+def single_prompt(results):
+    # The original one-shot prompt: every bill in full
+    parts = [f"""
+You are a senior utility billing analyst. Generate a comprehensive, executive-level audit report for a company analyzing {len(results)} utility bills.
+
+**Company Overview:**
+- Total Bills Analyzed: {len(results)}
+- Total Issues Found: {sum(len(r.get('anomalies', [])) for r in results)}
+
+**Individual Bill Summaries:**
+"""]
+
+    for i, result in enumerate(results, 1):
+        bill_data = result.get('data', {})
+        anomalies = result.get('anomalies', [])
+        filename = result.get('filename', f'Bill {i}')
+
+        parts.append(f"\n### Bill {i}: {filename}\n")
+        parts.append(f"- Account: {bill_data.get('account_number', 'N/A')}\n")
+        parts.append(f"- Date: {bill_data.get('bill_date', 'N/A')}\n")
+        parts.append(f"- Amount: ${bill_data.get('total_amount', 0):.2f}\n")
+        parts.append(f"- Usage: {bill_data.get('usage_kwh', 0)} kWh\n")
+
+        if anomalies:
+            parts.append(f"- **Issues ({len(anomalies)}):**\n")
+            for anomaly in anomalies:
+                parts.append(f"  - {anomaly['type']}: {anomaly['detail']} ({anomaly['impact']})\n")
+        else:
+            parts.append("- Status: ✓ Verified\n")
+
+    agg = portfolio_aggregates(results)
+    parts.append(f"""
+
+**Aggregate Metrics:**
+- Total Amount Across All Bills: ${agg['total_amount']:.2f}
+- Total Usage: {agg['total_usage_kwh']} kWh
+- Average Rate: ${agg['average_rate']:.3f}/kWh
+- Critical Issues: {agg['critical_issues']}
+- High Priority Issues: {agg['high_priority_issues']}
+""")
+    parts.append(REPORT_SECTIONS.format(breakdown="**Bill-by-Bill Breakdown** (summary of each bill's status)"))
+    return "".join(parts)
+
+
+def bill_line(index, result):
+    bill_data = result.get('data', {})
+    anomalies = result.get('anomalies', [])
+    line = (f"{index}. {result.get('filename', f'Bill {index}')} | {bill_data.get('bill_date', 'N/A')}"
+            f" | ${bill_data.get('total_amount', 0):.2f} | {bill_data.get('usage_kwh', 0)} kWh | ")
+    if anomalies:
+        line += "; ".join(f"{a['type']} ({a.get('severity', '')}): {a['detail']}, {a['impact']}" for a in anomalies)
+    else:
+        line += "Verified"
+    return line[:BILL_LINE_MAX_CHARS]
+
+
+def chunk_bills(results, max_chars, max_bills):
+    # Groups bills by account, oldest first, and packs whole accounts into
+    # chunks of at most `max_chars` of bill lines and `max_bills` bills. An
+    # account too large for one chunk is split into consecutive date ranges.
+    accounts = {}
+    for index, result in enumerate(results, 1):
+        account = result.get('data', {}).get('account_number', 'N/A')
+        accounts.setdefault(account, []).append((index, result))
+
+    chunks = []
+    current, size = [], 0
+    for account in sorted(accounts):
+        bills = sorted(
+            accounts[account],
+            key=lambda item: parse_bill_date(item[1].get('data', {}).get('bill_date')) or datetime.min
+        )
+        lines = [(account, bill_line(index, result), result) for index, result in bills]
+        account_size = sum(len(line) + 1 for _, line, _ in lines)
+        # Start a fresh chunk rather than splitting an account that would fit in one
+        if current and (size + account_size > max_chars or len(current) + len(lines) > max_bills) \
+                and account_size <= max_chars and len(lines) <= max_bills:
+            chunks.append(current)
+            current, size = [], 0
+        for entry in lines:
+            if current and (size + len(entry[1]) + 1 > max_chars or len(current) >= max_bills):
+                chunks.append(current)
+                current, size = [], 0
+            current.append(entry)
+            size += len(entry[1]) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def map_prompt(chunk, number, total):
+    results = [result for _, _, result in chunk]
+    agg = portfolio_aggregates(results)
+    bills = "\n".join(f"[Account {account}] {line}" for account, line, _ in chunk)
+    return f"""You are a senior utility billing analyst reviewing part {number} of {total} of a utility bill portfolio.
+
+**Exact figures for this part (computed, do not recalculate):**
+{format_aggregates(agg)}
+
+**Bills (file | date | amount | usage | findings):**
+{bills}
+
+Summarize this part in at most 12 concise bullet points for a later portfolio report: which accounts have issues, the kind and severity of each issue, dollar impacts quoted above, and any patterns over time. Do not restate verified bills individually."""
+
+
+def reduce_prompt(summaries):
+    joined = "\n\n".join(f"### Part {i}\n{summary}" for i, summary in enumerate(summaries, 1))
+    return f"""You are a senior utility billing analyst. Combine these partial summaries of a utility bill portfolio into one summary of at most 15 concise bullet points, keeping every account with critical issues, the dollar impacts and any patterns over time.
+
+{joined}"""
+
+
+def final_prompt(agg, summaries):
+    joined = "\n\n".join(f"### Part {i}\n{summary}" for i, summary in enumerate(summaries, 1))
+    return f"""
+You are a senior utility billing analyst. Generate a comprehensive, executive-level audit report for a company analyzing {agg['bills']} utility bills.
+
+**Portfolio Metrics (exact, computed from every bill; quote them as given and do not recalculate):**
+{format_aggregates(agg)}
+
+**Accounts With The Most Issues:**
+{format_top_accounts(agg)}
+
+**Findings By Portfolio Segment:**
+{joined}
+""" + REPORT_SECTIONS.format(breakdown="**Account Breakdown** (status of the accounts and segments above)")
+
+
+def metrics_header(agg):
+    # Prepended to map-reduce reports so the headline numbers in the document
+    # are the computed ones whatever the model wrote
+    return f"**Portfolio Metrics**\n{format_aggregates(agg)}\n\n"
+
+
+class CombinedReportBuilder:
+    # `generate(prompt)` is an async callable returning the model's text.
+    def __init__(self, mode="auto", single_max_bills=50, chunk_chars=12000, max_chunk_bills=200,
+                 fanout=8, concurrency=4):
+        if mode not in REPORT_MODES:
+            raise ValueError(f"Unknown combined report mode: {mode}")
+        self.mode = mode
+        self.single_max_bills = single_max_bills
+        self.chunk_chars = chunk_chars
+        self.max_chunk_bills = max_chunk_bills
+        self.fanout = max(2, fanout)
+        self.concurrency = max(1, concurrency)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv("COMBINED_REPORT_MODE", "auto"),
+            single_max_bills=int(os.getenv("COMBINED_REPORT_SINGLE_MAX_BILLS", "50")),
+            chunk_chars=int(os.getenv("COMBINED_REPORT_CHUNK_CHARS", "12000")),
+            max_chunk_bills=int(os.getenv("COMBINED_REPORT_CHUNK_BILLS", "200")),
+            fanout=int(os.getenv("COMBINED_REPORT_FANOUT", "8")),
+            concurrency=int(os.getenv("COMBINED_REPORT_CONCURRENCY", "4")),
+        )
+
+    def resolve_mode(self, results, mode=None):
+        mode = mode or self.mode
+        if mode not in REPORT_MODES:
+            raise ValueError(f"Unknown combined report mode: {mode}")
+        if mode == "auto":
+            return "single" if len(results) <= self.single_max_bills else "mapreduce"
+        return mode
+
+    async def build(self, results, generate, progress=None, mode=None):
+        # Returns (report text, stats)
+        async def report(stage):
+            if progress:
+                await progress(stage)
+
+        mode = self.resolve_mode(results, mode)
+        agg = portfolio_aggregates(results)
+        stats = {"mode": mode, "aggregates": agg, "llm_calls": 0, "max_prompt_chars": 0}
+
+        async def call(prompt):
+            stats["llm_calls"] += 1
+            stats["max_prompt_chars"] = max(stats["max_prompt_chars"], len(prompt))
+            return await generate(prompt)
+
+        if mode == "single":
+            await report("llm")
+            return await call(single_prompt(results)), stats
+
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(prompt):
+            async with limit:
+                text = await call(prompt)
+            return text.strip()[:SUMMARY_MAX_CHARS]
+
+        chunks = chunk_bills(results, self.chunk_chars, self.max_chunk_bills)
+        stats["chunks"] = len(chunks)
+        await report(f"map 0/{len(chunks)}")
+        done = 0
+
+        async def map_one(number, chunk):
+            nonlocal done
+            summary = await bounded(map_prompt(chunk, number, len(chunks)))
+            done += 1
+            await report(f"map {done}/{len(chunks)}")
+            return summary
+
+        summaries = await asyncio.gather(*(map_one(i, chunk) for i, chunk in enumerate(chunks, 1)))
+
+        # Reduce in rounds until the summaries fit in the final prompt
+        rounds = 0
+        while len(summaries) > self.fanout:
+            rounds += 1
+            await report(f"reduce round {rounds}")
+            groups = [summaries[i:i + self.fanout] for i in range(0, len(summaries), self.fanout)]
+            summaries = await asyncio.gather(*(bounded(reduce_prompt(group)) for group in groups))
+        stats["reduce_rounds"] = rounds
+
+        await report("llm")
+        text = await call(final_prompt(agg, summaries))
+        return metrics_header(agg) + text, stats
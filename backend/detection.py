@@ -0,0 +1,105 @@
+import numpy as np
+
+from bill_history import BASELINE_FIELDS
+from rules import RuleEngine
+
+
+def to_columns(bills, names):
+    # List of extracted `data` dicts -> {column: ndarray}; anything missing
+    # counts as 0, like data.get(k, 0). Columns whose values are all ints stay
+    # int64 so messages format exactly like the scalar path ("945 kWh", not
+    # "945.0 kWh").
+    columns = {}
+    for name in names:
+        values = [bill.get(name, 0) for bill in bills]
+        if all(isinstance(v, int) for v in values):
+            columns[name] = np.array(values, dtype=np.int64)
+        else:
+            columns[name] = np.array(values, dtype=np.float64)
+    return columns
+
+
+class AnomalyDetector:
+    # Thin front end over the shared rule engine (rules.json); kept so callers
+    # in the API, the Streamlit app and scripts share one interface. With a
+    # BillHistory, bills are checked against their account's baseline
+    # (looked up per bill, only when a rule reads it).
+    def __init__(self, engine=None, history=None):
+        self.engine = engine or RuleEngine.from_env()
+        self.history = history
+
+    def _uses_baseline(self):
+        return self.history is not None and any(field in self.engine.inputs for field in BASELINE_FIELDS)
+
+    def _with_baseline(self, data):
+        if not self._uses_baseline():
+            return data
+        return {**data, **self.history.baseline(data)}
+
+    @property
+    def version(self):
+        # Changes whenever the rule config does
+        return self.engine.version
+
+    @property
+    def rule_versions(self):
+        # Stored with each result so a rule change re-runs only that rule
+        return self.engine.rule_versions
+
+    def detect(self, data):
+        return self.engine.evaluate(self._with_baseline(data))
+
+    def reaudit(self, data, anomalies, rule_versions):
+        # Re-checks a stored result against the current rules without touching
+        # the PDF. None when the result is already current, otherwise
+        # (anomalies, severity, ids of the rules evaluated).
+        if not self.engine.is_stale(anomalies, rule_versions):
+            return None
+        return self.engine.reaudit(self._with_baseline(data), anomalies, rule_versions)
+
+    def reaudit_batch(self, bills, anomalies, rule_versions):
+        # reaudit() for many stored results made under the same rule versions,
+        # column-wise like detect_batch(). Returns (anomalies, severities, ids
+        # of the rules evaluated); results already current come back as is.
+        if not bills:
+            return [], [], []
+        table = to_columns([self._with_baseline(bill) for bill in bills], self.engine.inputs)
+        return self.engine.reaudit_batch(table.__getitem__, len(bills), anomalies, rule_versions)
+
+    def detect_batch(self, table):
+        # Same checks as detect() over a whole portfolio at once. `table` is a
+        # DataFrame, a {column: array} mapping or a list of data dicts.
+        # Returns (anomalies, severities): anomalies[i] and severities[i] are
+        # exactly what detect() returns for bill i. Only flagged bills pay for
+        # building message strings. With a BillHistory, baselines are looked
+        # up from the account_number and bill_date columns, whatever the input.
+        if isinstance(table, list):
+            n = len(table)
+            table = to_columns([self._with_baseline(bill) for bill in table], self.engine.inputs)
+        elif isinstance(table, dict):
+            n = max((len(values) for values in table.values()), default=0)
+        else:
+            n = len(table)
+        if n == 0:
+            return [], []
+
+        def column(name):
+            if name in table:
+                return np.asarray(table[name])
+            return np.zeros(n, dtype=np.int64)
+
+        if not isinstance(table, dict) or (self._uses_baseline() and "history_bills" not in table):
+            # DataFrame, or columns without baselines yet
+            columns = {name: column(name) for name in self.engine.inputs if name in table}
+            if self._uses_baseline():
+                keys = [
+                    {"account_number": account, "bill_date": bill_date}
+                    for account, bill_date in zip(
+                        table["account_number"] if "account_number" in table else [None] * n,
+                        table["bill_date"] if "bill_date" in table else [None] * n,
+                    )
+                ]
+                columns.update(to_columns([self.history.baseline(key) for key in keys], BASELINE_FIELDS))
+            table = columns
+
+        return self.engine.evaluate_batch(column, n)
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import pdfplumber
+import re
+import time
+
+
+# Field table: (fields, keyword, pattern). Every pattern is anchored to the
+# single line that carries its fields, and `keyword` is a plain substring
+# test so a regex only runs on candidate lines. Rows that carry several
+# fields (the tier rows) are matched once and fill all of them.
+FIELD_RULES = [
+    (("account_number",), "Account Number:", r"Account Number:\s*(\d{4}-\d{4}-\d{4})"),
+    (("bill_date",), "Bill Date:", r"Bill Date:\s*([A-Za-z]{3} \d{2}, \d{4})"),
+    (("total_amount",), "Total Due:", r"Total Due:\s*\$(\d+\.\d{2})"),
+    # Match the meter reading line: MC-XXXX reading1 reading2 multiplier USAGE
+    (("usage_kwh",), "MC-", r"MC-\d+\s+[\d,]+\s+[\d,]+\s+[\d.]+\s+(?:<b>)?(\d+)(?:</b>)?"),
+    (("customer_charge",), "Customer Charge", r"Customer Charge.*?\$(\d+\.\d{2})"),
+    # Tier rows: "Energy Charge - Tier 1 (First 500 kWh) $0.13 500 kWh $65.00"
+    (("tier1_rate", "tier1_usage", "tier1_cost"), "Tier 1",
+     r"Tier 1.*?\$(\d+\.\d{2})\s+(\d+)\s+kWh(?:\s+\$(\d+\.\d{2}))?"),
+    (("tier2_rate", "tier2_usage", "tier2_cost"), "Tier 2",
+     r"Tier 2.*?\$(\d+\.\d{2})\s+(\d+)\s+kWh(?:\s+\$(\d+\.\d{2}))?"),
+    (("dist_charge",), "Distribution", r"Distribution.*?\$(\d+\.\d{2})"),
+    (("taxes",), "Taxes", r"Taxes.*?\$(\d+\.\d{2})"),
+]
+
+# Identifiers stay strings; everything else is a number
+TEXT_FIELDS = {"account_number", "bill_date"}
+
+# Compiled once at import; the pool workers inherit or re-import them
+COMPILED_RULES = [(fields, keyword, re.compile(pattern)) for fields, keyword, pattern in FIELD_RULES]
+
+FIELDS = [field for fields, _, _ in FIELD_RULES for field in fields]
+
+# Changes whenever the field table does, so cached extractions made with an
+# older table are never served.
+PATTERNS_VERSION = hashlib.sha256(json.dumps(FIELD_RULES, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _convert(field, val):
+    if field in TEXT_FIELDS:
+        return val
+    val = val.replace(',', '')
+    if "usage" in field:
+        return int(val)
+    return float(val)
+
+
+def extract_fields(text, found=()):
+    # Each rule jumps straight to lines containing its keyword (str.find runs
+    # in C) and runs its regex on that line only. Nothing rescans the whole
+    # document from every keyword hit the way a leading `.*?` with DOTALL did.
+    # A row whose description wrapped onto a second line doesn't match here;
+    # layout mode reads those from the table cells instead.
+    data = {}
+    for fields, keyword, regex in COMPILED_RULES:
+        if all(field in found for field in fields):
+            continue
+        pos = text.find(keyword)
+        while pos >= 0:
+            start = text.rfind("\n", 0, pos) + 1
+            end = text.find("\n", pos)
+            if end < 0:
+                end = len(text)
+            match = regex.search(text, start, end)
+            if match:
+                for field, val in zip(fields, match.groups()):
+                    if val:
+                        try:
+                            data[field] = _convert(field, val)
+                        except ValueError:
+                            pass
+                break
+            pos = text.find(keyword, end)
+
+    return data
+
+
+def finalize_fields(data):
+    # Ensure usage_kwh is set
+    if 'usage_kwh' not in data or data['usage_kwh'] == 0:
+        # Fallback: try to sum tier usages
+        t1 = data.get('tier1_usage', 0)
+        t2 = data.get('tier2_usage', 0)
+        if t1 > 0:
+            data['usage_kwh'] = t1 + t2
+
+    comp_sum = 0
+    for k in ['customer_charge', 'tier1_cost', 'tier2_cost', 'dist_charge', 'taxes']:
+        comp_sum += data.get(k, 0)
+    data['components_sum'] = round(comp_sum, 2)
+
+    return data
+
+
+# --- Layout mode ---
+# Reads the "Meter Reading Details" and "Electric Charges Detail" tables from
+# word coordinates inside cropped regions instead of regexing flattened page
+# text, so wrapped descriptions and markup inside cells don't matter. Section
+# headings are set in a larger font than body text, so they are located from
+# those few characters alone. This is for robustness, not speed: it costs a
+# little more per bill than text mode, which stays the default.
+
+SECTION_FONT_SIZE = 13
+SUMMARY_SECTIONS = ("12-Month Usage History", "Meter Reading Details", "Electric Charges Detail")
+SUMMARY_FIELDS = ("account_number", "bill_date", "total_amount")
+
+# Row keyword -> {column header: field}
+CHARGE_ROWS = [
+    ("Customer Charge", {"Amount": "customer_charge"}),
+    ("Tier 1", {"Rate/Unit": "tier1_rate", "Usage": "tier1_usage", "Amount": "tier1_cost"}),
+    ("Tier 2", {"Rate/Unit": "tier2_rate", "Usage": "tier2_usage", "Amount": "tier2_cost"}),
+    ("Distribution", {"Amount": "dist_charge"}),
+    ("Taxes", {"Amount": "taxes"}),
+]
+METER_COLUMNS = {"Total Usage (kWh)": "usage_kwh"}
+
+NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+# Words further apart than this (in points) belong to different cells
+CELL_GAP = 8
+
+
+def _section_headings(page):
+    # Pages without any heading (inserts, the payment stub) are ruled out from
+    # the raw characters, before any line grouping, since text mode parses
+    # them right after
+    large_text = "".join(char["text"] for char in page.chars if char.get("size", 0) >= SECTION_FONT_SIZE)
+    large_text = large_text.replace(" ", "")
+    if not any(name.replace(" ", "") in large_text for name in SUMMARY_SECTIONS):
+        return {}
+    large = page.filter(lambda obj: obj.get("object_type") == "char" and obj.get("size", 0) >= SECTION_FONT_SIZE)
+    headings = {}
+    for line in large.extract_text_lines():
+        for name in SUMMARY_SECTIONS:
+            if line["text"].startswith(name):
+                headings[name] = line
+    return headings
+
+
+def _table_rows(region):
+    # Group words into rows by baseline, then merge neighbouring words into
+    # cells wherever the horizontal gap is a plain space.
+    rows = []
+    for word in sorted(region.extract_words(), key=lambda w: (w["top"], w["x0"])):
+        if rows and abs(rows[-1][0] - word["top"]) <= 3:
+            rows[-1][1].append(word)
+        else:
+            rows.append((word["top"], [word]))
+
+    table = []
+    for _, words in rows:
+        cells = []
+        for word in sorted(words, key=lambda w: w["x0"]):
+            if cells and word["x0"] - cells[-1]["x1"] <= CELL_GAP:
+                cells[-1]["text"] += " " + word["text"]
+                cells[-1]["x1"] = word["x1"]
+            else:
+                cells.append({"text": word["text"], "x0": word["x0"], "x1": word["x1"]})
+        table.append(cells)
+    return table
+
+
+def _column_for(cell, header):
+    # Cells go to the header they overlap most; right-aligned numbers that
+    # don't overlap their header fall back to the nearest header centre.
+    def overlap(col):
+        return min(cell["x1"], col["x1"]) - max(cell["x0"], col["x0"])
+
+    best = max(header, key=overlap)
+    if overlap(best) > 0:
+        return best["text"]
+    center = (cell["x0"] + cell["x1"]) / 2
+    return min(header, key=lambda col: abs((col["x0"] + col["x1"]) / 2 - center))["text"]
+
+
+def _read_table(region):
+    # Returns one {header: text} dict per body row. The table ends at the
+    # first row with a single cell (the paragraph that follows it).
+    rows = _table_rows(region)
+    header = None
+    records = []
+    for cells in rows:
+        if header is None:
+            if len(cells) >= 3:
+                header = cells
+            continue
+        if len(cells) < 2:
+            break
+        records.append({_column_for(cell, header): cell["text"] for cell in cells})
+    return records
+
+
+def _store(data, field, text):
+    match = NUMBER_RE.search(text or "")
+    if match and field not in data:
+        try:
+            data[field] = _convert(field, match.group())
+        except ValueError:
+            pass
+
+
+def extract_layout_fields(page):
+    # Returns the fields found on this page, or None when the page doesn't
+    # carry the bill's section headings (the caller falls back to text mode).
+    headings = _section_headings(page)
+    if not headings:
+        return None
+
+    data = {}
+    summary_bottom = min(h["top"] for h in headings.values())
+    summary = extract_fields(page.crop((0, 0, page.width, summary_bottom)).extract_text() or "")
+    for field in SUMMARY_FIELDS:
+        if field in summary:
+            data[field] = summary[field]
+
+    meter = headings.get("Meter Reading Details")
+    charges = headings.get("Electric Charges Detail")
+
+    if meter:
+        bottom = charges["top"] if charges and charges["top"] > meter["top"] else page.height
+        for row in _read_table(page.crop((0, meter["top"], page.width, bottom))):
+            for column, field in METER_COLUMNS.items():
+                _store(data, field, row.get(column))
+
+    if charges:
+        for row in _read_table(page.crop((0, charges["top"], page.width, page.height))):
+            description = next(iter(row.values()), "")
+            for keyword, columns in CHARGE_ROWS:
+                if keyword in description:
+                    for column, field in columns.items():
+                        _store(data, field, row.get(column))
+
+    return data
+
+
+EXTRACTION_MODES = ("text", "layout")
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "text")
+
+# Once all of these are found the remaining pages (inserts, marketing, the
+# payment stub) are not parsed at all. Every charge line is included because
+# components_sum would be wrong without it, except Tier 2: a bill within the
+# Tier 1 allowance has no Tier 2 row, and a bill that has one lists it above
+# Taxes, the charges table's last (and required) row.
+TIER2_FIELDS = frozenset(("tier2_rate", "tier2_usage", "tier2_cost"))
+REQUIRED_FIELDS = frozenset(FIELDS) - TIER2_FIELDS
+
+
+def iter_pages(pdf):
+    # Pages are parsed only when the consumer asks for the next one, and each
+    # page's parsed objects are released before moving on.
+    for page in pdf.pages:
+        try:
+            yield page
+        finally:
+            page.close()
+
+
+def extract_page_fields(page, mode, found=(), timings=None):
+    # `timings`, when given, accumulates seconds spent reading the page
+    # (text_extraction) and matching fields in it (regex_matching)
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    if mode == "layout":
+        fields = extract_layout_fields(page)
+        if fields is not None:
+            timings["text_extraction"] = timings.get("text_extraction", 0.0) + time.perf_counter() - start
+            return fields
+    text = page.extract_text() or ""
+    read = time.perf_counter()
+    fields = extract_fields(text, found)
+    timings["text_extraction"] = timings.get("text_extraction", 0.0) + read - start
+    timings["regex_matching"] = timings.get("regex_matching", 0.0) + time.perf_counter() - read
+    return fields
+
+
+def extract_bill(pdf_bytes, mode=None):
+    # Returns (data, stats). data is None when the PDF can't be read; stats
+    # reports how many pages were parsed before every required field was found,
+    # and seconds spent per stage (the server turns them into metrics).
+    mode = mode or EXTRACTION_MODE
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction mode: {mode}")
+    timings = {"pdf_open": 0.0, "text_extraction": 0.0, "regex_matching": 0.0}
+    stats = {"mode": mode, "pages_parsed": 0, "page_count": 0, "timings": timings}
+    try:
+        from io import BytesIO
+        pdf_file = BytesIO(pdf_bytes)
+
+        data = {}
+        start = time.perf_counter()
+        with pdfplumber.open(pdf_file) as pdf:
+            stats["page_count"] = len(pdf.pages)
+            timings["pdf_open"] = time.perf_counter() - start
+            for page in iter_pages(pdf):
+                stats["pages_parsed"] += 1
+                for field, val in extract_page_fields(page, mode, data, timings).items():
+                    data.setdefault(field, val)
+                if REQUIRED_FIELDS.issubset(data):
+                    break
+
+        return finalize_fields(data), stats
+    except Exception as e:
+        print(f"Error extracting PDF data: {e}")
+        import traceback
+        traceback.print_exc()
+        return None, stats
+
+
+def extract_data_from_pdf(pdf_bytes, mode=None):
+    data, _ = extract_bill(pdf_bytes, mode)
+    return data
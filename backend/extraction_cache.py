@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ExtractionCache:
+    # Two-tier cache for analysis results keyed by the SHA-256 of the uploaded
+    # PDF plus the versions of whatever produced the result. The memory tier is
+    # a plain LRU; the optional SQLite tier survives restarts and is trimmed to
+    # `max_bytes` by evicting the least recently read entries.
+    def __init__(self, max_entries=256, path=None, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            self._open_disk()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("EXTRACTION_CACHE_SIZE", "256")),
+            path=os.getenv("EXTRACTION_CACHE_PATH") or None,
+            max_bytes=int(float(os.getenv("EXTRACTION_CACHE_MAX_MB", "256")) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def key(pdf_bytes, *versions):
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        return ":".join([digest, *versions])
+
+    def _open_disk(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.commit()
+        row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self._disk_bytes = row[0]
+
+    def _remember(self, key, payload):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        with self._lock:
+            self._remember(key, payload)
+            if self._db is None:
+                return
+
+            size = len(payload)
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time()),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._evict_disk()
+            self._db.commit()
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes if self._db is not None else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ExtractionPool:
+    # Runs CPU-bound PDF extraction off the event loop. Jobs beyond
+    # `workers + queue_size` in flight are rejected instead of queueing
+    # forever, so callers can answer with 503 and let clients retry. A job
+    # that times out in a process pool has its worker processes killed and the
+    # pool replaced, so a hung PDF can't hold a worker or a slot.
+    def __init__(self, workers=None, queue_size=None, timeout=30.0, executor="process"):
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown extraction executor: {executor}")
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_size = self.workers * 4 if queue_size is None else max(0, queue_size)
+        self.timeout = timeout
+        self.executor = executor
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.recycled = 0
+
+    @classmethod
+    def from_env(cls):
+        workers = os.getenv("EXTRACTION_WORKERS")
+        queue_size = os.getenv("EXTRACTION_QUEUE_SIZE")
+        timeout = os.getenv("EXTRACTION_TIMEOUT", "30")
+        return cls(
+            workers=int(workers) if workers else None,
+            queue_size=int(queue_size) if queue_size else None,
+            timeout=float(timeout) if float(timeout) > 0 else None,
+            executor=os.getenv("EXTRACTION_EXECUTOR", "process"),
+        )
+
+    @property
+    def capacity(self):
+        return self.workers + self.queue_size
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def stats(self):
+        return {
+            "executor": self.executor,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "pending": self._pending,
+            "recycled": self.recycled,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.executor == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract")
+            return self._executor
+
+    def _recycle(self, executor, kill=False):
+        # Replaces `executor` for new jobs and shuts it down. kill=True also
+        # terminates its worker processes: the only way to stop a job that is
+        # already running (ProcessPoolExecutor has no public API for it).
+        # Other jobs on the old pool then fail with BrokenProcessPool and
+        # run() resubmits them.
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.recycled += 1
+        if kill:
+            executor.killed = True
+            # CPython (3.8 through 3.13, checked by the tests) keeps the
+            # workers in `_processes`, a {pid: Process} dict. Without it the
+            # hung worker can't be stopped: say so rather than leak it quietly.
+            processes = getattr(executor, "_processes", None)
+            if processes is None:
+                print("Cannot terminate hung extraction worker: ProcessPoolExecutor has no _processes "
+                      "on this Python version; it exits once its job finishes")
+            for process in list((processes or {}).values()):
+                process.terminate()
+        # Queued jobs aren't cancelled: they fail with BrokenProcessPool (a
+        # killed pool) or still run (a thread pool), never with CancelledError
+        executor.shutdown(wait=False)
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise PoolBusy(f"Extraction queue is full ({self.capacity} jobs in flight)")
+            self._pending += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        release = True
+        try:
+            # Second attempt only for jobs whose pool was killed because of
+            # another job's timeout
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(fn, *args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM on a pathological PDF): start a
+                    # fresh pool for later jobs and have this one retried
+                    self._recycle(executor)
+                    raise PoolBusy("Extraction workers were restarted, please retry")
+                try:
+                    remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                    return await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+                except asyncio.TimeoutError:
+                    if not future.cancel():
+                        if self.executor == "process":
+                            self._recycle(executor, kill=True)
+                        else:
+                            # A thread can't be stopped, so its slot stays
+                            # taken until it finishes
+                            future.add_done_callback(self._release)
+                            release = False
+                    raise PoolTimeout(f"Extraction exceeded {self.timeout:g}s")
+                except BrokenProcessPool:
+                    if getattr(executor, "killed", False) and attempt == 0:
+                        continue
+                    self._recycle(executor)
+                    raise
+        finally:
+            if release:
+                self._release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
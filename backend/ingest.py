@@ -0,0 +1,377 @@
+"""Bulk ingestion: extract and audit a directory (or manifest) of bill PDFs.
+
+Usage:
+    python ingest.py ../generated_bills --out results.jsonl
+    python ingest.py ../corpus --db results.db --workers 8
+    python ingest.py --manifest ../corpus/manifest.jsonl --out results.jsonl --audit-dir cache/audits
+
+Extraction and anomaly detection run on a process pool. Every file's result
+(extracted data, anomalies, severity, and the field-pattern and per-rule
+versions that produced them) is written to a JSONL file or to a SQLite
+database. Failures are recorded too.
+
+Progress is checkpointed every --commit-every results. Re-running the same
+command after an interruption (Ctrl-C, crash, reboot) skips every committed
+file. For JSONL output the checkpoint sits next to the file
+(results.jsonl.checkpoint) and stores the output's committed length, so
+lines written after the last checkpoint are dropped on resume rather than
+duplicated. For --db output the bills table is the checkpoint.
+
+Detection uses the same rules as the API. The API also checks each bill's
+usage against the account's history (BILL_HISTORY_PATH); ingest does that
+only with --history, otherwise usage is judged by the fixed threshold alone
+and verdicts can differ from the API's. With --history, bills are checked
+against the readings recorded so far and then recorded themselves, as the
+API does with uploads.
+
+With --audit-dir, results are appended to the audit store only once the
+output has committed them, so a resumed run does not append them twice.
+
+Use --db for results you will want to re-audit after a rule change: it
+keeps extracted fields and detection results in separate tables, which
+reaudit.py updates without re-parsing any PDF.
+
+A status line shows files done, throughput and an ETA.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from extraction import EXTRACTION_MODE, EXTRACTION_MODES, PATTERNS_VERSION, extract_bill
+from detection import AnomalyDetector
+from bill_history import BillHistory
+
+
+# --- Worker side ---
+
+_detector = None
+
+
+def _init_worker(history_path=None):
+    global _detector
+    _detector = AnomalyDetector(history=BillHistory(history_path) if history_path else None)
+
+
+def ingest_one(root, relpath, mode):
+    # Runs in a pool process; never raises, failures come back as "error"
+    record = {"path": relpath, "sha256": None, "error": None}
+    try:
+        with open(os.path.join(root, relpath), "rb") as f:
+            contents = f.read()
+        record["sha256"] = hashlib.sha256(contents).hexdigest()
+        start = time.perf_counter()
+        data, stats = extract_bill(contents, mode)
+        record["extraction"] = dict(stats, ms=round((time.perf_counter() - start) * 1000, 2))
+        if not data:
+            record["error"] = "Failed to extract data from PDF"
+            return record
+        anomalies, severity = _detector.detect(data)
+        record.update(
+            data=data,
+            anomalies=anomalies,
+            severity=severity,
+            versions={
+                "patterns": PATTERNS_VERSION,
+                "rules": _detector.version,
+                "rule_versions": _detector.rule_versions,
+            },
+        )
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+# --- Inputs ---
+
+def list_directory(root):
+    # Relative paths of every PDF under root, in a stable order
+    paths = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(".pdf"):
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return paths
+
+
+def list_manifest(manifest):
+    # generate_bills.py manifests: one {"filename": ...} object per line,
+    # paths relative to the manifest's directory
+    with open(manifest) as f:
+        return [json.loads(line)["filename"] for line in f if line.strip()]
+
+
+# --- Outputs ---
+# Both sinks share one interface: done(path) for resuming, write(record),
+# commit() to make everything written so far durable, and close().
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path + ".checkpoint")
+        self._db.execute("CREATE TABLE IF NOT EXISTS done (path TEXT PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+        offset = int(row[0]) if row else 0
+        self._file = open(path, "ab")
+        if self._file.tell() != offset:
+            # Lines past the last checkpoint belong to files that will be redone
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        self._pending = []
+
+    def done(self, path):
+        return self._db.execute("SELECT 1 FROM done WHERE path = ?", (path,)).fetchone() is not None
+
+    def write(self, record):
+        self._file.write((json.dumps(record) + "\n").encode())
+        self._pending.append((record["path"],))
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO done (path) VALUES (?)", self._pending)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('offset', ?)",
+                             (str(self._file.tell()),))
+        self._pending = []
+
+    def close(self):
+        self.commit()
+        self._file.close()
+        self._db.close()
+
+
+class SQLiteSink:
+    # Extracted fields (bills) and detection results (audits) live in
+    # separate tables, so reaudit.py can re-run detection from the stored
+    # fields when the rules change. audits.rule_versions records the version
+    # of every rule behind the verdict.
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bills ("
+            " path TEXT PRIMARY KEY, sha256 TEXT, account_number TEXT, bill_date TEXT, error TEXT,"
+            " data TEXT, extraction TEXT, patterns_version TEXT, ingested_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS bills_account ON bills (account_number, bill_date)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS audits ("
+            " path TEXT PRIMARY KEY, severity TEXT, anomaly_count INTEGER, anomalies TEXT,"
+            " rules_version TEXT, rule_versions TEXT, audited_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS audits_rules_version ON audits (rules_version)")
+        self._migrate()
+        self._bills = []
+        self._audits = []
+
+    def _migrate(self):
+        # Databases from before the bills/audits split kept everything in one
+        # results table; move its rows over so a resumed run skips them
+        legacy = self._db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'results'").fetchone()
+        if not legacy:
+            return
+        with self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO bills SELECT path, sha256, account_number, bill_date, error, data,"
+                " extraction, json_extract(versions, '$.patterns'), ingested_at FROM results"
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO audits SELECT path, severity, anomaly_count, anomalies,"
+                " json_extract(versions, '$.rules'), json_extract(versions, '$.rule_versions'), ingested_at"
+                " FROM results WHERE error IS NULL AND data != 'null'"
+            )
+            self._db.execute("DROP TABLE results")
+        print(f"Migrated {self.path} to the bills/audits schema")
+
+    def done(self, path):
+        return self._db.execute("SELECT 1 FROM bills WHERE path = ?", (path,)).fetchone() is not None
+
+    def write(self, record):
+        data = record.get("data")
+        versions = record.get("versions") or {}
+        now = time.time()
+        self._bills.append((
+            record["path"], record["sha256"], (data or {}).get("account_number"), (data or {}).get("bill_date"),
+            record["error"], json.dumps(data), json.dumps(record.get("extraction")), versions.get("patterns"), now,
+        ))
+        if data:
+            self._audits.append((
+                record["path"], record["severity"], len(record["anomalies"]), json.dumps(record["anomalies"]),
+                versions["rules"], json.dumps(versions["rule_versions"]), now,
+            ))
+
+    def commit(self):
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO bills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self._bills)
+            self._db.executemany("INSERT OR REPLACE INTO audits VALUES (?, ?, ?, ?, ?, ?, ?)", self._audits)
+        self._bills = []
+        self._audits = []
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+
+# --- Progress ---
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    # Throughput over a sliding window of recent completions, so the ETA
+    # follows the current rate rather than the average since start
+    def __init__(self, total, interval=2.0, window=30.0):
+        self.total = total
+        self.interval = interval
+        self.window = window
+        self.done = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._samples = [(self.started, 0)]
+        self._printed = 0.0
+        self._tty = sys.stderr.isatty()
+
+    def update(self, errors=0, force=False):
+        self.done += 1
+        self.errors += errors
+        now = time.monotonic()
+        if not force and now - self._printed < self.interval:
+            return
+        self._printed = now
+        self._samples.append((now, self.done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.pop(0)
+        then, done_then = self._samples[0]
+        rate = (self.done - done_then) / (now - then) if now > then else 0.0
+        eta = format_duration((self.total - self.done) / rate) if rate else "?"
+        line = (f"{self.done:,}/{self.total:,} ({self.done / max(1, self.total):.1%}) | {rate:,.1f} files/s"
+                f" | ETA {eta} | errors {self.errors:,}")
+        print(("\r" + line) if self._tty else line, end="" if self._tty else "\n", file=sys.stderr, flush=True)
+
+    def finish(self):
+        elapsed = time.monotonic() - self.started
+        if self._tty:
+            print(file=sys.stderr)
+        print(f"Processed {self.done:,} files in {format_duration(elapsed)}"
+              f" ({self.done / elapsed if elapsed else 0:,.1f} files/s), {self.errors:,} errors", file=sys.stderr)
+
+
+# --- Driver ---
+
+def run(root, paths, sink, workers, mode, commit_every, audit_store=None, history=None):
+    progress = Progress(len(paths))
+    in_flight = set()
+    pending = iter(paths)
+    uncommitted = []
+
+    def commit():
+        # The audit store and history only see results the sink has made
+        # durable, so a resumed run never appends the same bill twice
+        sink.commit()
+        for record in uncommitted:
+            if record["error"]:
+                continue
+            if audit_store:
+                audit_store.append(record["data"], record["anomalies"], record["severity"], record["sha256"])
+            if history:
+                history.record(record["data"])
+        uncommitted.clear()
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(history.path if history else None,))
+    try:
+        while True:
+            # Keep a bounded number of files queued, so a million-file run
+            # doesn't hold a million futures
+            while len(in_flight) < workers * 4:
+                path = next(pending, None)
+                if path is None:
+                    break
+                in_flight.add(executor.submit(ingest_one, root, path, mode))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                sink.write(record)
+                uncommitted.append(record)
+                progress.update(errors=1 if record["error"] else 0)
+            if len(uncommitted) >= commit_every:
+                commit()
+    except KeyboardInterrupt:
+        print("\nInterrupted; saving progress...", file=sys.stderr)
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        # Everything handed to the sink is committed, so a resume only redoes
+        # files that were still in flight
+        commit()
+        sink.close()
+        if audit_store:
+            audit_store.close()
+        if history:
+            history.close()
+        progress.finish()
+    executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="directory to walk for *.pdf")
+    parser.add_argument("--manifest", help="ingest the files listed in a generate_bills.py manifest instead")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--out", help="JSONL results file")
+    output.add_argument("--db", help="SQLite results database")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="extraction processes")
+    parser.add_argument("--mode", choices=EXTRACTION_MODES, default=EXTRACTION_MODE)
+    parser.add_argument("--commit-every", type=int, default=500, help="results per checkpoint")
+    parser.add_argument("--audit-dir", help="also append results to an audit store (needs pyarrow)")
+    parser.add_argument("--history", help="BillHistory database for per-account baselines, as the API's"
+                                          " BILL_HISTORY_PATH; ingested bills are recorded to it")
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+    if args.manifest:
+        root = os.path.dirname(os.path.abspath(args.manifest))
+        paths = list_manifest(args.manifest)
+    else:
+        root = args.directory
+        paths = list_directory(root)
+
+    sink = JsonlSink(args.out) if args.out else SQLiteSink(args.db)
+    todo = [path for path in paths if not sink.done(path)]
+    if len(todo) < len(paths):
+        print(f"Resuming: {len(paths) - len(todo):,} of {len(paths):,} files already done", file=sys.stderr)
+    print(f"Ingesting {len(todo):,} files from {root} with {args.workers} workers ({args.mode} mode)",
+          file=sys.stderr)
+
+    audit_store = None
+    if args.audit_dir:
+        from audit_store import AuditStore
+        audit_store = AuditStore(args.audit_dir, flush_rows=max(500, args.commit_every))
+    history = BillHistory(args.history) if args.history else None
+
+    try:
+        run(root, todo, sink, args.workers, args.mode, args.commit_every, audit_store, history)
+    except KeyboardInterrupt:
+        print("Re-run the same command to resume.", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
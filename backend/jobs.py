@@ -0,0 +1,406 @@
+import asyncio
+import json
+import os
+import sqlite3
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+from metrics import ENDPOINT
+
+
+# Job lifecycle: queued -> running -> succeeded | failed. While running,
+# `stage` names the step in progress (e.g. "llm", "pdf").
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def new_job(kind, payload):
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "stage": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "payload": payload,
+        "result": None,
+    }
+
+
+def public_view(job):
+    # What status endpoints return: everything but the payload and result
+    return {k: v for k, v in job.items() if k not in ("payload", "result")}
+
+
+# --- Queue backends ---
+# Both expose the same methods: submit, claim, update, release, heartbeat,
+# get, requeue_stale, purge and close. claim(owner) atomically moves the
+# oldest queued job to "running" under a lease held by `owner` and returns
+# it, or returns None when nothing is queued. update(..., owner=...) and
+# release() only apply while that owner still holds the lease, so a worker
+# whose job was requeued from under it cannot overwrite the new run.
+
+class MemoryJobQueue:
+    # Jobs live in this process only and are lost on restart.
+    def __init__(self):
+        self._jobs = {}
+        self._owners = {}
+        self._queued = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, payload):
+        job = new_job(kind, payload)
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._queued.append(job["id"])
+        return dict(job)
+
+    def claim(self, owner=None):
+        with self._lock:
+            while self._queued:
+                job = self._jobs.get(self._queued.popleft())
+                if job and job["status"] == "queued":
+                    job.update(status="running", started_at=time.time())
+                    self._owners[job["id"]] = owner
+                    return dict(job)
+        return None
+
+    def update(self, job_id, owner=None, **fields):
+        with self._lock:
+            if job_id in self._jobs and (owner is None or self._owners.get(job_id) == owner):
+                self._jobs[job_id].update(fields)
+
+    def release(self, job_id, owner=None):
+        # Puts an interrupted running job back at the front of the queue
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job["status"] == "running" and (owner is None or self._owners.get(job_id) == owner):
+                job.update(status="queued", stage=None, started_at=None)
+                self._owners.pop(job_id, None)
+                self._queued.appendleft(job_id)
+
+    def heartbeat(self, job_ids, owner):
+        # Leases cannot go stale within a single process
+        pass
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def requeue_stale(self, heartbeat_before):
+        # Nothing survives a restart, so nothing can be stale
+        return 0
+
+    def purge(self, finished_before):
+        with self._lock:
+            old = [job_id for job_id, job in self._jobs.items()
+                   if job["status"] in TERMINAL_STATUSES and job["finished_at"] < finished_before]
+            for job_id in old:
+                del self._jobs[job_id]
+        return len(old)
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+    def close(self):
+        pass
+
+
+class SQLiteJobQueue:
+    # Jobs survive restarts and can be shared by several server processes
+    # pointing at the same file; claims are serialized by SQLite's write lock.
+    COLUMNS = ("id", "kind", "status", "stage", "error", "created_at", "started_at",
+               "finished_at", "payload", "result")
+    JSON_COLUMNS = ("payload", "result")
+
+    # Jobs left "running" by a process that died are requeued once their
+    # lease (owner, heartbeat_at) has not been renewed for a while; a job
+    # that is merely slow keeps its lease through heartbeats.
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " stage TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL,"
+            " finished_at REAL, payload TEXT, result TEXT, owner TEXT, heartbeat_at REAL)"
+        )
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._lock = threading.Lock()
+
+    def _row_to_job(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        for column in self.JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def submit(self, kind, payload):
+        job = new_job(kind, payload)
+        values = [json.dumps(job[c]) if c in self.JSON_COLUMNS else job[c] for c in self.COLUMNS]
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                values,
+            )
+        return job
+
+    def claim(self, owner=None):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status = 'queued'"
+                    " ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                job = self._row_to_job(row)
+                job.update(status="running", started_at=time.time())
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, owner = ?, heartbeat_at = ? WHERE id = ?",
+                    (job["status"], job["started_at"], owner, job["started_at"], job["id"]),
+                )
+                self._db.execute("COMMIT")
+                return job
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def update(self, job_id, owner=None, **fields):
+        if not fields:
+            return
+        columns = ", ".join(f"{c} = ?" for c in fields)
+        values = [json.dumps(v) if c in self.JSON_COLUMNS else v for c, v in fields.items()]
+        where, params = "id = ?", [job_id]
+        if owner is not None:
+            where, params = "id = ? AND owner = ?", [job_id, owner]
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE {where}", (*values, *params))
+
+    def release(self, job_id, owner=None):
+        # Puts an interrupted running job back in the queue; it keeps its
+        # created_at, so it is claimed again before newer jobs
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, started_at = NULL, owner = NULL,"
+                " heartbeat_at = NULL WHERE id = ? AND status = 'running' AND (? IS NULL OR owner = ?)",
+                (job_id, owner, owner),
+            )
+
+    def heartbeat(self, job_ids, owner):
+        # Renews the lease on jobs this owner is still running
+        if not job_ids:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                [(time.time(), job_id, owner) for job_id in job_ids],
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def requeue_stale(self, heartbeat_before):
+        # Running jobs whose lease was last renewed before the cutoff belonged
+        # to a process that died; they are picked up again
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, started_at = NULL, owner = NULL,"
+                " heartbeat_at = NULL WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?",
+                (heartbeat_before,),
+            )
+        return cursor.rowcount
+
+    def purge(self, finished_before):
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                (finished_before,),
+            )
+        return cursor.rowcount
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Next to this module rather than the working directory, like the bill history
+DEFAULT_JOB_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "jobs.db")
+
+QUEUE_BACKENDS = {
+    "memory": lambda path: MemoryJobQueue(),
+    "sqlite": lambda path: SQLiteJobQueue(path),
+}
+
+
+def job_queue_from_env():
+    backend = os.getenv("JOB_BACKEND", "memory")
+    if backend not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown job backend: {backend}")
+    return QUEUE_BACKENDS[backend](os.getenv("JOB_STORE_PATH", DEFAULT_JOB_STORE_PATH))
+
+
+class JobRunner:
+    # Runs queued jobs on `workers` asyncio tasks. Handlers are registered per
+    # job kind as `async def handler(payload, progress)` and return the job's
+    # result; `await progress(stage)` records the step in progress. Blocking
+    # work inside a handler belongs in a thread (run_in_threadpool) so the
+    # event loop stays free. Jobs are claimed under this runner's `owner` id
+    # and their leases renewed every `heartbeat_interval` seconds; running
+    # jobs whose lease is older than `stale_after` are requeued.
+    def __init__(self, queue, workers=2, poll_interval=1.0, ttl=3600, stale_after=120, heartbeat_interval=30):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.heartbeat_interval = min(heartbeat_interval, stale_after / 3)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self._running = set()
+        self._tasks = []
+        self._wake = None
+        self._changed = None
+
+    @classmethod
+    def from_env(cls, queue):
+        return cls(
+            queue,
+            workers=int(os.getenv("JOB_WORKERS", "2")),
+            ttl=float(os.getenv("JOB_TTL", "3600")),
+            stale_after=float(os.getenv("JOB_STALE_AFTER", "120")),
+        )
+
+    def handler(self, kind):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def start(self):
+        # Also called lazily from submit(), so jobs run even where startup
+        # events are not delivered
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._requeue_stale()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._heartbeat()))
+
+    def _requeue_stale(self):
+        requeued = self.queue.requeue_stale(time.time() - self.stale_after)
+        if requeued:
+            print(f"Requeued {requeued} interrupted job(s)")
+        return requeued
+
+    async def _heartbeat(self):
+        # Keeps this runner's leases fresh and picks up jobs abandoned by
+        # other processes sharing the queue
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.queue.heartbeat(list(self._running), self.owner)
+                if self._requeue_stale():
+                    self._wake.set()
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        return {"workers": self.workers, "running": bool(self._tasks), "jobs": self.queue.counts()}
+
+    async def submit(self, kind, payload):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for job kind: {kind}")
+        self.start()
+        self.queue.purge(time.time() - self.ttl)
+        job = self.queue.submit(kind, payload)
+        self._wake.set()
+        return public_view(job)
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_for_change(self, timeout):
+        # Wakes on any job update in this process; the timeout covers updates
+        # made by other processes sharing a SQLite queue
+        self.start()
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self):
+        while True:
+            job = self.queue.claim(self.owner)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._notify()
+            await self._run(job)
+
+    async def _run(self, job):
+        async def progress(stage):
+            self.queue.update(job["id"], owner=self.owner, stage=stage)
+            await self._notify()
+
+        # Metrics recorded while the job runs are labeled with its kind
+        token = ENDPOINT.set(f"job:{job['kind']}")
+        self._running.add(job["id"])
+        try:
+            result = await self.handlers[job["kind"]](job["payload"], progress)
+            self.queue.update(job["id"], owner=self.owner, status="succeeded", stage=None, result=result,
+                              finished_at=time.time())
+        except asyncio.CancelledError:
+            # Interrupted by shutdown: back in the queue for the next runner
+            self.queue.release(job["id"], self.owner)
+            raise
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            import traceback
+            traceback.print_exc()
+            self.queue.update(job["id"], owner=self.owner, status="failed", stage=None, error=str(e),
+                              finished_at=time.time())
+        finally:
+            self._running.discard(job["id"])
+            ENDPOINT.reset(token)
+        await self._notify()
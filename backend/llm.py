@@ -0,0 +1,130 @@
+import asyncio
+import os
+import random
+
+import anthropic
+
+from metrics import STAGE_SECONDS
+
+
+# Status codes worth another attempt: rate limiting and server-side errors
+# (529 is Anthropic's "overloaded").
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class LLMUnavailable(Exception):
+    pass
+
+
+class LLMClient:
+    # One AsyncAnthropic client (and its pooled httpx connections) shared by
+    # every request. At most `max_concurrency` calls are in flight; each
+    # attempt is bounded by `timeout` and failed attempts are retried with
+    # full-jitter exponential backoff. Callers get LLMUnavailable when the
+    # model can't answer and use their rule-based text instead.
+    def __init__(self, api_key=None, base_url=None, model="claude-3-sonnet-20240229",
+                 max_concurrency=8, timeout=10.0, max_retries=2, backoff=0.5, max_backoff=4.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._client = None
+        self._limit = None
+        self._in_flight = 0
+        self._counts = {"requests": 0, "succeeded": 0, "retries": 0, "timeouts": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls):
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if api_key and "your_api_key" in api_key:
+            api_key = None
+        return cls(
+            api_key=api_key,
+            base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+            model=os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229"),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            timeout=float(os.getenv("LLM_TIMEOUT", "10")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            **self._counts,
+        }
+
+    def _get_client(self):
+        # Created on first use so the connection pool and semaphore belong to
+        # the server's event loop rather than whichever loop imported this
+        # module. The semaphore also caps how many pooled connections are
+        # busy. Retries are handled in complete(), so the SDK's are off.
+        if self._client is None:
+            self._client = anthropic.AsyncAnthropic(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=anthropic.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                max_retries=0,
+            )
+            self._limit = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _retryable(self, e):
+        if isinstance(e, (anthropic.APIConnectionError, asyncio.TimeoutError)):
+            return True
+        return isinstance(e, anthropic.APIStatusError) and e.status_code in RETRY_STATUS
+
+    async def complete(self, prompt, max_tokens=100):
+        if not self.enabled:
+            raise LLMUnavailable("No Anthropic API key configured")
+
+        try:
+            client = self._get_client()
+        except Exception as e:
+            raise LLMUnavailable(f"Could not create Anthropic client: {e}") from e
+        self._counts["requests"] += 1
+        async with self._limit:
+            self._in_flight += 1
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        # wait_for backs up the httpx timeout in case a
+                        # server trickles bytes and keeps the read alive
+                        with STAGE_SECONDS.time(stage="llm_anthropic"):
+                            message = await asyncio.wait_for(
+                                client.messages.create(
+                                    model=self.model,
+                                    max_tokens=max_tokens,
+                                    messages=[{"role": "user", "content": prompt}]
+                                ),
+                                self.timeout * 2,
+                            )
+                        self._counts["succeeded"] += 1
+                        return message.content[0].text
+                    except Exception as e:
+                        if isinstance(e, (anthropic.APITimeoutError, asyncio.TimeoutError)):
+                            self._counts["timeouts"] += 1
+                        if attempt == self.max_retries or not self._retryable(e):
+                            self._counts["failed"] += 1
+                            raise LLMUnavailable(f"Summary request failed: {e}") from e
+                        self._counts["retries"] += 1
+                        # Full jitter keeps retries from a burst of failures
+                        # from arriving back at the API in lockstep
+                        await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            finally:
+                self._in_flight -= 1
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
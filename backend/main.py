@@ -1,23 +1,52 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import pdfplumber
-import re
+from typing import List, Optional
+from io import BytesIO
+import asyncio
+import hashlib
+import json
 import os
+import re
+import sys
+import time
+import zipfile
+from collections import deque
 from pathlib import Path
 from datetime import datetime
-from anthropic import Anthropic
 from dotenv import load_dotenv
 import google.generativeai as genai
 import google.generativeai as genai
 
 load_dotenv()
 
+# Sibling modules are imported flat so this works both as `python main.py`
+# and as `uvicorn backend.main:app` from the project root.
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from extraction import EXTRACTION_MODE, PATTERNS_VERSION, extract_bill
+from detection import AnomalyDetector
+from bill_history import BillHistory
+from audit_store import AuditStore
+from extraction_cache import ExtractionCache
+from extraction_pool import ExtractionPool, PoolBusy, PoolTimeout
+from llm import LLMClient, LLMUnavailable
+from batch_summaries import SummaryBatcher, SummaryParseError
+from summary_cache import SummaryCache, fingerprint
+from jobs import JobRunner, TERMINAL_STATUSES, job_queue_from_env, public_view
+from report_rendering import render_combined_report_pdf
+from combined_report import REPORT_MODES, CombinedReportBuilder
+from artifacts import ArtifactStore
+from metrics import (CACHE_HITS, CACHE_MISSES, EXTRACTION_FAILURES, STAGE_SECONDS, SUMMARY_FALLBACKS,
+                     MetricsMiddleware, observe_extraction, render as render_metrics)
+
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = 'gemini-3-pro-preview'
 
 app = FastAPI(title="BillGuard AI")
 
@@ -31,137 +60,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-endpoint request and stage latency histograms plus cache, fallback and
+# failure counters, served as Prometheus text from /metrics
+app.add_middleware(MetricsMiddleware, router=app.router)
+
 # Static files will be mounted at the end of the file after all API routes
 
-class AnomalyDetector:
-    def detect(self, data):
-        anomalies = []
-        severity = "low"
-        
-        usage = data.get('usage_kwh', 0)
-        
-        # 1. Usage Spike
-        if usage > 800:
-            anomalies.append({
-                "type": "Usage Spike",
-                "severity": "high",
-                "detail": f"Consumption of {usage} kWh exceeds baseline (500 kWh)",
-                "impact": f"Estimated ${(usage - 500) * 0.15:.2f} above normal"
-            })
-            severity = "high"
-
-        # 2. Rate Validation
-        t1_rate = data.get('tier1_rate', 0)
-        if t1_rate > 0:
-            if abs(t1_rate - 0.13) > 0.01:
-                t1_usage = data.get('tier1_usage', 0)
-                anomalies.append({
-                    "type": "Rate Error",
-                    "severity": "critical",
-                    "detail": f"Tier 1 rate ${t1_rate:.2f}/kWh (expected $0.13/kWh)",
-                    "impact": f"Overcharge of ${(t1_rate - 0.13) * t1_usage:.2f}"
-                })
-                severity = "critical"
-
-        # 3. Calculation Verification
-        components = data.get('components_sum', 0)
-        total = data.get('total_amount', 0)
-        if components > 0 and total > 0:
-            diff = abs(total - components)
-            if diff > 1.0:
-                anomalies.append({
-                    "type": "Calculation Error",
-                    "severity": "critical",
-                    "detail": f"Line items total ${components:.2f}, billed ${total:.2f}",
-                    "impact": f"Discrepancy of ${diff:.2f}"
-                })
-                severity = "critical"
-
-        return anomalies, severity
-
-def extract_data_from_pdf(pdf_bytes):
-    try:
-        from io import BytesIO
-        pdf_file = BytesIO(pdf_bytes)
-        
-        with pdfplumber.open(pdf_file) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
-        
-        data = {}
-        patterns = {
-            "account_number": r"Account Number:\s*(\d{4}-\d{4}-\d{4})",
-            "bill_date": r"Bill Date:\s*([A-Za-z]{3} \d{2}, \d{4})",
-            "total_amount": r"Total Due:\s*\$(\d+\.\d{2})",
-            # Match the meter reading line: MC-XXXX reading1 reading2 multiplier USAGE
-            "usage_kwh": r"MC-\d+\s+[\d,]+\s+[\d,]+\s+[\d.]+\s+(?:<b>)?(\d+)(?:</b>)?",
-            "customer_charge": r"Customer Charge.*?\$(\d+\.\d{2})",
-            # Tier 1 format: "Tier 1 (First 500 kWh) $0.13 500 kWh $65.00"
-            "tier1_rate": r"Tier 1.*?\$(\d+\.\d{2})\s+\d+\s+kWh",
-            "tier1_usage": r"Tier 1.*?\$\d+\.\d{2}\s+(\d+)\s+kWh",
-            "tier1_cost": r"Tier 1.*?\$\d+\.\d{2}\s+\d+\s+kWh\s+\$(\d+\.\d{2})",
-            # Tier 2 format similar
-            "tier2_rate": r"Tier 2.*?\$(\d+\.\d{2})\s+\d+\s+kWh",
-            "tier2_usage": r"Tier 2.*?\$\d+\.\d{2}\s+(\d+)\s+kWh",
-            "tier2_cost": r"Tier 2.*?\$\d+\.\d{2}\s+\d+\s+kWh\s+\$(\d+\.\d{2})",
-            "dist_charge": r"Distribution.*?\$(\d+\.\d{2})",
-            "taxes": r"Taxes.*?\$(\d+\.\d{2})",
-        }
-        
-        for key, pattern in patterns.items():
-            match = re.search(pattern, text, re.MULTILINE | re.DOTALL)
-            if match:
-                val = next((g for g in match.groups() if g is not None), None)
-                if val:
-                    val = val.replace(',', '')
-                    try:
-                        if "usage" in key:
-                            data[key] = int(val)
-                        else:
-                            data[key] = float(val)
-                    except:
-                        pass
-        
-        # Ensure usage_kwh is set
-        if 'usage_kwh' not in data or data['usage_kwh'] == 0:
-            # Fallback: try to sum tier usages
-            t1 = data.get('tier1_usage', 0)
-            t2 = data.get('tier2_usage', 0)
-            if t1 > 0:
-                data['usage_kwh'] = t1 + t2
-        
-        comp_sum = 0
-        for k in ['customer_charge', 'tier1_cost', 'tier2_cost', 'dist_charge', 'taxes']:
-            comp_sum += data.get(k, 0)
-        data['components_sum'] = round(comp_sum, 2)
-        
-        return data
-    except Exception as e:
-        print(f"Error extracting PDF data: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+# PDF extraction is CPU-bound, so it runs on a worker pool instead of the event loop
+extraction_pool = ExtractionPool.from_env()
 
-def get_ai_summary(data, anomalies):
-    if not anomalies:
-        return "No irregularities detected. Bill aligns with expected rates and usage patterns."
-    
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    anomaly_text = "\n".join([f"- {a['type']}: {a['detail']}" for a in anomalies])
-    
-    if api_key and "your_api_key" not in api_key:
-        try:
-            client = Anthropic(api_key=api_key)
-            message = client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=100,
-                messages=[{"role": "user", "content": f"Summarize these billing issues in 2 sentences:\n{anomaly_text}"}]
-            )
-            return message.content[0].text
-        except:
-            pass
-    
+# Upper bound on bills per /api/analyze/batch request (zip members included)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+# ...and on their total size once unzipped
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_MB", "256")) * 1024 * 1024
+
+# Re-uploaded bills are answered from a cache keyed by the PDF's SHA-256
+extraction_cache = ExtractionCache.from_env()
+
+# Shared async client for AI summaries: pooled connections, bounded
+# concurrency, timeouts and retries
+llm_client = LLMClient.from_env()
+
+# LLM summaries are reused across bills with the same anomaly fingerprint
+# (issue types plus bucketed magnitudes); reports, which quote the bill's
+# exact figures, only for the exact same prompt
+summary_cache = SummaryCache.from_env()
+
+# Batch uploads pack many bills' summaries into one model call
+summary_batcher = SummaryBatcher.from_env(llm_client)
+
+# Long-running report generation runs as background jobs; clients poll or
+# stream the job instead of holding the request open
+job_queue = job_queue_from_env()
+job_runner = JobRunner.from_env(job_queue)
+combined_report_builder = CombinedReportBuilder.from_env()
+
+# Rendered report PDFs are kept on disk and downloaded from
+# /api/reports/{id}.pdf rather than sent base64-encoded inside JSON
+artifact_store = ArtifactStore.from_env()
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def shutdown_extraction_pool():
+    await job_runner.stop()
+    job_queue.close()
+    extraction_pool.shutdown()
+    extraction_cache.close()
+    summary_cache.close()
+    await llm_client.close()
+    if bill_history:
+        bill_history.close()
+    if audit_store:
+        audit_store.close()
+
+# Every analyzed bill is recorded per account, so usage spikes are judged
+# against the account's earlier bills once it has a few (None when
+# BILL_HISTORY_PATH is empty)
+bill_history = BillHistory.from_env()
+
+MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+# Audit results are also appended to partitioned Parquet files, so portfolio
+# aggregates are columnar scans instead of re-posted results (None when
+# AUDIT_STORE_DIR is empty or pyarrow is missing)
+audit_store = AuditStore.from_env()
+
+# One detector (and rule engine) serves every request; rules.json edits are
+# picked up without a restart
+detector = AnomalyDetector(history=bill_history)
+
+def rule_based_summary(anomaly_text):
     if "Rate Error" in anomaly_text:
         return "Tier 1 rate incorrectly applied. Contact billing department for rate correction and refund."
     elif "Calculation Error" in anomaly_text:
@@ -171,36 +142,263 @@ def get_ai_summary(data, anomalies):
     return "Multiple issues detected. Manual review recommended."
 
 
+async def get_ai_summary(data, anomalies, batched=False):
+    # batched=True lets the summary share a model call with other bills being
+    # analyzed at the same time; bills the batched answer didn't cover are
+    # asked for on their own.
+    if not anomalies:
+        return "No irregularities detected. Bill aligns with expected rates and usage patterns."
+    
+    anomaly_text = "\n".join([f"- {a['type']}: {a['detail']}" for a in anomalies])
+    
+    if llm_client.enabled:
+        prompt = f"Summarize these billing issues in 2 sentences:\n{anomaly_text}"
+        key = fingerprint("summary", anomalies, model=llm_client.model)
+        try:
+            if batched and summary_batcher.enabled:
+                try:
+                    summary, cached = await summary_cache.get_or_compute(key, lambda: summary_batcher.summarize(anomaly_text))
+                    (CACHE_HITS if cached else CACHE_MISSES).inc(cache="summary")
+                    return summary
+                except SummaryParseError as e:
+                    print(f"Summarizing bill on its own: {e}")
+            summary, cached = await summary_cache.get_or_compute(key, lambda: llm_client.complete(prompt))
+            (CACHE_HITS if cached else CACHE_MISSES).inc(cache="summary")
+            return summary
+        except LLMUnavailable as e:
+            print(f"Falling back to rule-based summary: {e}")
+            SUMMARY_FALLBACKS.inc(reason="error")
+    else:
+        SUMMARY_FALLBACKS.inc(reason="disabled")
+    
+    return rule_based_summary(anomaly_text)
+
+
 @app.get("/health")
 async def health():
-    return {"message": "BillGuard AI API", "status": "running"}
+    return {
+        "message": "BillGuard AI API",
+        "status": "running",
+        "extraction_pool": extraction_pool.stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "llm": llm_client.stats(),
+        "summary_cache": summary_cache.stats(),
+        "summary_batches": summary_batcher.stats(),
+        "jobs": job_runner.stats(),
+        "report_stream": report_stream_stats(),
+        "artifacts": artifact_store.stats(),
+        "bill_history": bill_history.stats() if bill_history else None,
+        "audit_store": audit_store.stats() if audit_store else None,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/rules")
+async def get_rules():
+    return {
+        "config": detector.engine.config,
+        **detector.engine.stats()
+    }
+
+@app.get("/api/history/{account_number}")
+async def get_account_history(account_number: str):
+    history = bill_history.account(account_number) if bill_history else None
+    if history is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "No bill history for this account"}
+        )
+    return history
+
+@app.get("/api/portfolio/aggregates")
+async def get_portfolio_aggregates(start: Optional[str] = None, end: Optional[str] = None,
+                                   account: Optional[str] = None):
+    # start/end are inclusive months (YYYY-MM); every filter is optional
+    if audit_store is None:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Audit store is disabled"}
+        )
+    for month in (start, end):
+        if month and not MONTH_RE.match(month):
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Invalid month {month!r}, expected YYYY-MM"}
+            )
+    return await run_in_threadpool(audit_store.aggregates, start, end, account)
+
+@app.post("/api/rules/reload")
+async def reload_rules():
+    try:
+        version = detector.engine.reload()
+    except Exception as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid rules config: {e}"}
+        )
+    return {"version": version}
+
+class AnalysisError(Exception):
+    def __init__(self, status_code, message, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers
+
+
+async def analyze_contents(contents):
+    # Shared by the single and batch endpoints: cache lookup, extraction on the
+    # worker pool and anomaly detection. Returns (data, anomalies, severity,
+    # extraction stats).
+    #
+    # Cache entries outlive rule changes: the key covers only what extraction
+    # depends on, and each entry records the rule versions behind its verdict.
+    # A hit made under older rules re-runs just the changed rules on the
+    # stored fields; the PDF is never parsed again.
+    cache_key = ExtractionCache.key(contents, PATTERNS_VERSION, EXTRACTION_MODE)
+    cached = extraction_cache.get(cache_key)
+    if cached:
+        CACHE_HITS.inc(cache="extraction")
+        with STAGE_SECONDS.time(stage="anomaly_detection"):
+            reaudited = detector.reaudit(cached["data"], cached["anomalies"], cached.get("rule_versions"))
+        if reaudited:
+            anomalies, severity, _ = reaudited
+            cached = {**cached, "anomalies": anomalies, "severity": severity,
+                      "rule_versions": detector.rule_versions}
+            extraction_cache.put(cache_key, cached)
+            if audit_store:
+                # A full buffer is written (and maybe compacted) to Parquet
+                # inside append(), so it stays off the event loop
+                await run_in_threadpool(audit_store.append, cached["data"], anomalies, severity,
+                                        document=cache_key.split(":")[0])
+        return cached["data"], cached["anomalies"], cached["severity"], cached.get("extraction")
+
+    CACHE_MISSES.inc(cache="extraction")
+
+    # Extract data
+    try:
+        data, stats = await extraction_pool.run(extract_bill, contents)
+    except PoolBusy:
+        EXTRACTION_FAILURES.inc(reason="busy")
+        raise AnalysisError(503, "Server is busy extracting other bills, please retry shortly", {"Retry-After": "1"})
+    except PoolTimeout:
+        EXTRACTION_FAILURES.inc(reason="timeout")
+        raise AnalysisError(504, "PDF extraction timed out")
+    if not data:
+        EXTRACTION_FAILURES.inc(reason="unreadable")
+        raise AnalysisError(400, "Failed to extract data from PDF")
+    observe_extraction(stats)
+
+    # Detect anomalies against the account's earlier bills, then add this
+    # bill to it. Cached re-uploads above skip both: the bill is already
+    # recorded, and its verdict only changes when the rules do.
+    with STAGE_SECONDS.time(stage="anomaly_detection"):
+        anomalies, severity = detector.detect(data)
+    if bill_history:
+        bill_history.record(data)
+    if audit_store:
+        await run_in_threadpool(audit_store.append, data, anomalies, severity, document=cache_key.split(":")[0])
+    extraction_cache.put(cache_key, {"data": data, "anomalies": anomalies, "severity": severity,
+                                     "rule_versions": detector.rule_versions, "extraction": stats})
+    return data, anomalies, severity, stats
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def expand_uploads(uploads, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_BYTES):
+    # Flatten uploaded PDFs and zip archives into (filename, bytes) pairs.
+    # Archives that cannot be opened become a single failed entry. Limits are
+    # checked against each archive's directory (member count and declared
+    # sizes, which zipfile won't read past) before anything is inflated, so
+    # a zip bomb is rejected without being decompressed. Raises BatchTooLarge.
+    files = []
+    total_bytes = 0
+    for filename, contents in uploads:
+        if not (filename or "").lower().endswith(".zip") and not zipfile.is_zipfile(BytesIO(contents)):
+            files.append((filename, contents, None))
+            total_bytes += len(contents)
+            continue
+        try:
+            with zipfile.ZipFile(BytesIO(contents)) as archive:
+                members = [
+                    info for info in archive.infolist()
+                    if not info.is_dir() and info.filename.lower().endswith(".pdf")
+                    and not info.filename.startswith("__MACOSX/")
+                ]
+                if len(files) + len(members) > max_files:
+                    raise BatchTooLarge(f"Batch contains {len(files) + len(members)}+ bills, the limit is {max_files}")
+                total_bytes += sum(info.file_size for info in members)
+                if total_bytes > max_bytes:
+                    raise BatchTooLarge(f"Batch unpacks to more than {max_bytes // (1024 * 1024)} MB")
+                for info in members:
+                    files.append((f"{filename}/{info.filename}", archive.read(info), None))
+        except zipfile.BadZipFile as e:
+            files.append((filename, None, f"Invalid zip archive: {e}"))
+    if len(files) > max_files:
+        raise BatchTooLarge(f"Batch contains {len(files)} bills, the limit is {max_files}")
+    if total_bytes > max_bytes:
+        raise BatchTooLarge(f"Batch unpacks to more than {max_bytes // (1024 * 1024)} MB")
+    return files
+
+
+def summarize_batch(results):
+    succeeded = [r for r in results if "error" not in r]
+    all_anomalies = [a for r in succeeded for a in r["anomalies"]]
+
+    total_amount = sum(r["data"].get("total_amount", 0) for r in succeeded)
+    total_usage = sum(r["data"].get("usage_kwh", 0) for r in succeeded)
+
+    severity_counts = {}
+    for r in succeeded:
+        severity_counts[r["severity"]] = severity_counts.get(r["severity"], 0) + 1
+    issue_counts = {}
+    for a in all_anomalies:
+        issue_counts[a["type"]] = issue_counts.get(a["type"], 0) + 1
+
+    return {
+        "bills": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "total_amount": round(total_amount, 2),
+        "total_usage_kwh": total_usage,
+        "average_rate": round(total_amount / max(1, total_usage), 4),
+        "total_issues": len(all_anomalies),
+        "pages_parsed": sum((r.get("extraction") or {}).get("pages_parsed", 0) for r in succeeded),
+        "page_count": sum((r.get("extraction") or {}).get("page_count", 0) for r in succeeded),
+        "critical_issues": sum(1 for a in all_anomalies if a.get("severity") == "critical"),
+        "high_priority_issues": sum(1 for a in all_anomalies if a.get("severity") == "high"),
+        "severity_counts": severity_counts,
+        "issue_counts": issue_counts,
+    }
+
 
 @app.post("/api/analyze")
 async def analyze_bill(file: UploadFile = File(...)):
     try:
         contents = await file.read()
         
-        # Extract data
-        data = extract_data_from_pdf(contents)
-        if not data:
+        try:
+            data, anomalies, severity, stats = await analyze_contents(contents)
+        except AnalysisError as e:
             return JSONResponse(
-                status_code=400,
-                content={"error": "Failed to extract data from PDF"}
+                status_code=e.status_code,
+                headers=e.headers,
+                content={"error": str(e)}
             )
         
-        # Detect anomalies
-        detector = AnomalyDetector()
-        anomalies, severity = detector.detect(data)
-        
         # Get AI summary
-        ai_summary = get_ai_summary(data, anomalies)
+        ai_summary = await get_ai_summary(data, anomalies)
         
         return {
             "filename": file.filename,
             "data": data,
             "anomalies": anomalies,
             "severity": severity,
-            "ai_summary": ai_summary
+            "ai_summary": ai_summary,
+            "extraction": stats
         }
     
     except Exception as e:
@@ -209,15 +407,98 @@ async def analyze_bill(file: UploadFile = File(...)):
             content={"error": str(e)}
         )
 
-@app.post("/api/generate-report")
-async def generate_report(data: dict):
+def format_stream_event(event, payload, fmt):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps({"event": event, **payload}) + "\n"
+
+
+async def stream_batch(jobs, fmt):
+    # Emit each bill as soon as it finishes, then the portfolio summary.
+    # `jobs` are (index, coroutine) pairs; the index lets clients map results
+    # back to upload order.
+    async def indexed(index, job):
+        return index, await job
+
+    tasks = [asyncio.ensure_future(indexed(index, job)) for index, job in jobs]
+    results = []
     try:
-        bill_data = data.get("bill_data", {})
-        anomalies = data.get("anomalies", [])
-        filename = data.get("filename", "Unknown")
-        
-        # Build context for Gemini
-        context = f"""
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            results.append(result)
+            yield format_stream_event("result", {"index": index, **result}, fmt)
+        yield format_stream_event("summary", summarize_batch(results), fmt)
+    finally:
+        # Client went away mid-stream: stop the bills that haven't started
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...), stream: Optional[str] = None):
+    try:
+        if stream not in (None, "ndjson", "sse"):
+            return JSONResponse(
+                status_code=400,
+                content={"error": "stream must be 'ndjson' or 'sse'"}
+            )
+
+        uploads = [(f.filename, await f.read()) for f in files]
+        try:
+            # Inflating archives is CPU-bound, so it stays off the event loop
+            bills = await run_in_threadpool(expand_uploads, uploads)
+        except BatchTooLarge as e:
+            return JSONResponse(
+                status_code=413,
+                content={"error": str(e)}
+            )
+
+        # Don't let one batch take more than the pool's workers at a time, so
+        # single uploads still find room in the queue.
+        limit = asyncio.Semaphore(extraction_pool.workers)
+
+        async def analyze_one(filename, contents, error):
+            if error:
+                return {"filename": filename, "error": error, "status_code": 400}
+            try:
+                async with limit:
+                    data, anomalies, severity, stats = await analyze_contents(contents)
+                ai_summary = await get_ai_summary(data, anomalies, batched=True)
+            except AnalysisError as e:
+                return {"filename": filename, "error": str(e), "status_code": e.status_code}
+            except Exception as e:
+                return {"filename": filename, "error": str(e), "status_code": 500}
+            return {
+                "filename": filename,
+                "data": data,
+                "anomalies": anomalies,
+                "severity": severity,
+                "ai_summary": ai_summary,
+                "extraction": stats
+            }
+
+        if stream:
+            return StreamingResponse(
+                stream_batch([(i, analyze_one(*bill)) for i, bill in enumerate(bills)], stream),
+                media_type="text/event-stream" if stream == "sse" else "application/x-ndjson",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        results = await asyncio.gather(*(analyze_one(*bill) for bill in bills))
+        return {
+            "results": results,
+            "summary": summarize_batch(results)
+        }
+
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+def build_report_context(bill_data, anomalies, filename):
+    # Build context for Gemini
+    context = f"""
 You are a senior utility billing analyst. Generate a professional, industry-grade audit report for the following utility bill.
 
 **Bill Information:**
@@ -230,16 +511,16 @@ You are a senior utility billing analyst. Generate a professional, industry-grad
 
 **Detected Issues:**
 """
-        
-        if anomalies:
-            for i, anomaly in enumerate(anomalies, 1):
-                context += f"\n{i}. **{anomaly['type']}** (Severity: {anomaly['severity'].upper()})\n"
-                context += f"   - Detail: {anomaly['detail']}\n"
-                context += f"   - Financial Impact: {anomaly['impact']}\n"
-        else:
-            context += "\nNo anomalies detected. Bill appears accurate.\n"
-        
-        context += """
+    
+    if anomalies:
+        for i, anomaly in enumerate(anomalies, 1):
+            context += f"\n{i}. **{anomaly['type']}** (Severity: {anomaly['severity'].upper()})\n"
+            context += f"   - Detail: {anomaly['detail']}\n"
+            context += f"   - Financial Impact: {anomaly['impact']}\n"
+    else:
+        context += "\nNo anomalies detected. Bill appears accurate.\n"
+    
+    context += """
 
 **Generate a comprehensive report with the following sections:**
 
@@ -252,6 +533,26 @@ You are a senior utility billing analyst. Generate a professional, industry-grad
 
 Format the report professionally with clear headings and bullet points. Be specific and actionable.
 """
+    
+    return context
+
+
+def report_cache_key(context):
+    # The report quotes the dollar and kWh figures from its prompt verbatim,
+    # so unlike summaries it is only reused for the exact same prompt: a
+    # corrected reissue of a bill gets a new report
+    digest = hashlib.sha256(f"{GEMINI_MODEL}\n{context}".encode()).hexdigest()
+    return f"report:{digest}"
+
+
+@app.post("/api/generate-report")
+async def generate_report(data: dict):
+    try:
+        bill_data = data.get("bill_data", {})
+        anomalies = data.get("anomalies", [])
+        filename = data.get("filename", "Unknown")
+        
+        context = build_report_context(bill_data, anomalies, filename)
         
         # Call Gemini API
         if not GEMINI_API_KEY:
@@ -260,11 +561,18 @@ Format the report professionally with clear headings and bullet points. Be speci
                 content={"error": "Gemini API key not configured"}
             )
         
-        model = genai.GenerativeModel('gemini-3-pro-preview')
-        response = model.generate_content(context)
+        async def generate():
+            model = genai.GenerativeModel(GEMINI_MODEL)
+            with STAGE_SECONDS.time(stage="llm_gemini"):
+                response = await run_in_threadpool(model.generate_content, context)
+            return response.text
+        
+        report, cached = await summary_cache.get_or_compute(report_cache_key(context), generate)
+        (CACHE_HITS if cached else CACHE_MISSES).inc(cache="report")
         
         return {
-            "report": response.text,
+            "report": report,
+            "cached": cached,
             "generated_at": datetime.now().isoformat()
         }
     
@@ -277,8 +585,154 @@ Format the report professionally with clear headings and bullet points. Be speci
             content={"error": str(e)}
         )
 
+
+# Time to first token and total generation time of recent streamed reports
+# (cached answers excluded), reported under /health
+report_stream_timings = deque(maxlen=1000)
+report_stream_counts = {"requests": 0, "cached": 0, "failed": 0}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report_stream_stats():
+    ttft = [t["ttft_ms"] for t in report_stream_timings]
+    total = [t["total_ms"] for t in report_stream_timings]
+    return {
+        **report_stream_counts,
+        "ttft_ms_p50": percentile(ttft, 50),
+        "ttft_ms_p95": percentile(ttft, 95),
+        "total_ms_p50": percentile(total, 50),
+        "total_ms_p95": percentile(total, 95),
+    }
+
+
+@app.post("/api/generate-report/stream")
+async def generate_report_stream(data: dict):
+    # Same report as /api/generate-report, sent as server-sent events while
+    # Gemini writes it: "chunk" events carry text as it arrives, then a
+    # "done" event reports timings (or an "error" event).
+    bill_data = data.get("bill_data", {})
+    anomalies = data.get("anomalies", [])
+    filename = data.get("filename", "Unknown")
+    
+    if not GEMINI_API_KEY:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Gemini API key not configured"}
+        )
+    
+    context = build_report_context(bill_data, anomalies, filename)
+    key = report_cache_key(context)
+    
+    async def events():
+        report_stream_counts["requests"] += 1
+        start = time.perf_counter()
+        first_token = None
+        parts = []
+        cached = summary_cache.get(key)
+        try:
+            if cached is not None:
+                report_stream_counts["cached"] += 1
+                CACHE_HITS.inc(cache="report")
+                first_token = time.perf_counter()
+                parts.append(cached)
+                yield format_stream_event("chunk", {"text": cached}, "sse")
+            else:
+                CACHE_MISSES.inc(cache="report")
+                model = genai.GenerativeModel(GEMINI_MODEL)
+                response = await run_in_threadpool(model.generate_content, context, stream=True)
+                # Each chunk is fetched in a thread so the event loop keeps
+                # serving other requests while Gemini generates
+                async for chunk in iterate_in_threadpool(iter(response)):
+                    text = chunk.text
+                    if not text:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(text)
+                    yield format_stream_event("chunk", {"text": text}, "sse")
+                summary_cache.put(key, "".join(parts))
+        except Exception as e:
+            report_stream_counts["failed"] += 1
+            print(f"Error streaming report: {e}")
+            import traceback
+            traceback.print_exc()
+            yield format_stream_event("error", {"error": str(e)}, "sse")
+            return
+        
+        end = time.perf_counter()
+        timing = {
+            "ttft_ms": round(((first_token or end) - start) * 1000, 1),
+            "total_ms": round((end - start) * 1000, 1),
+        }
+        if cached is None:
+            # A streamed call lasts until its last chunk
+            STAGE_SECONDS.observe(end - start, stage="llm_gemini")
+            report_stream_timings.append(timing)
+            print(f"Streamed report for {filename}: first token {timing['ttft_ms']} ms, total {timing['total_ms']} ms")
+        yield format_stream_event("done", {
+            "cached": cached is not None,
+            "chunks": len(parts),
+            "generated_at": datetime.now().isoformat(),
+            **timing
+        }, "sse")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@job_runner.handler("combined_report")
+async def run_combined_report(payload, progress):
+    results = payload["results"]
+    
+    # Call Gemini API: once for small portfolios, map-reduce over account
+    # chunks for large ones
+    async def generate(prompt):
+        model = genai.GenerativeModel(GEMINI_MODEL)
+        with STAGE_SECONDS.time(stage="llm_gemini"):
+            response = await run_in_threadpool(model.generate_content, prompt)
+        return response.text
+    
+    report, stats = await combined_report_builder.build(results, generate, progress, payload.get("mode"))
+    
+    # Generate PDF
+    await progress("pdf")
+    with STAGE_SECONDS.time(stage="pdf_rendering"):
+        pdf_bytes = await run_in_threadpool(render_combined_report_pdf, report)
+    pdf_id = await run_in_threadpool(artifact_store.put, pdf_bytes)
+    
+    return {
+        "report": report,
+        "pdf_url": f"/api/reports/{pdf_id}.pdf",
+        "pdf_bytes": len(pdf_bytes),
+        "generated_at": datetime.now().isoformat(),
+        "bills_analyzed": len(results),
+        "total_issues": stats["aggregates"]["total_issues"],
+        "mode": stats["mode"],
+        "aggregates": stats["aggregates"],
+        "llm_calls": stats["llm_calls"]
+    }
+
+
+def job_links(job):
+    return {
+        **job,
+        "status_url": f"/api/jobs/{job['id']}",
+        "result_url": f"/api/jobs/{job['id']}/result",
+        "events_url": f"/api/jobs/{job['id']}/events",
+    }
+
+
 @app.post("/api/generate-combined-report")
 async def generate_combined_report(data: dict):
+    # Queues the report and answers 202 with the job's URLs right away
     try:
         results = data.get("results", [])
         
@@ -288,135 +742,24 @@ async def generate_combined_report(data: dict):
                 content={"error": "No bills provided"}
             )
         
-        # Build comprehensive context for Gemini
-        context = f"""
-You are a senior utility billing analyst. Generate a comprehensive, executive-level audit report for a company analyzing {len(results)} utility bills.
-
-**Company Overview:**
-- Total Bills Analyzed: {len(results)}
-- Total Issues Found: {sum(len(r.get('anomalies', [])) for r in results)}
-
-**Individual Bill Summaries:**
-"""
-        
-        total_amount = 0
-        total_usage = 0
-        all_anomalies = []
-        
-        for i, result in enumerate(results, 1):
-            bill_data = result.get('data', {})
-            anomalies = result.get('anomalies', [])
-            filename = result.get('filename', f'Bill {i}')
-            
-            total_amount += bill_data.get('total_amount', 0)
-            total_usage += bill_data.get('usage_kwh', 0)
-            all_anomalies.extend(anomalies)
-            
-            context += f"\n### Bill {i}: {filename}\n"
-            context += f"- Account: {bill_data.get('account_number', 'N/A')}\n"
-            context += f"- Date: {bill_data.get('bill_date', 'N/A')}\n"
-            context += f"- Amount: ${bill_data.get('total_amount', 0):.2f}\n"
-            context += f"- Usage: {bill_data.get('usage_kwh', 0)} kWh\n"
-            
-            if anomalies:
-                context += f"- **Issues ({len(anomalies)}):**\n"
-                for anomaly in anomalies:
-                    context += f"  - {anomaly['type']}: {anomaly['detail']} ({anomaly['impact']})\n"
-            else:
-                context += "- Status: ✓ Verified\n"
-        
-        context += f"""
-
-**Aggregate Metrics:**
-- Total Amount Across All Bills: ${total_amount:.2f}
-- Total Usage: {total_usage} kWh
-- Average Rate: ${(total_amount / max(1, total_usage)):.3f}/kWh
-- Critical Issues: {sum(1 for a in all_anomalies if a.get('severity') == 'critical')}
-- High Priority Issues: {sum(1 for a in all_anomalies if a.get('severity') == 'high')}
-
-**Generate a comprehensive executive report with the following sections:**
-
-1. **Executive Summary** (3-4 sentences highlighting key findings)
-2. **Portfolio Overview** (aggregate metrics and trends)
-3. **Critical Findings** (detailed analysis of all issues found)
-4. **Financial Impact Analysis** (total overcharges, discrepancies, potential savings)
-5. **Bill-by-Bill Breakdown** (summary of each bill's status)
-6. **Recommended Actions** (prioritized action items with owners and deadlines)
-7. **Risk Assessment** (potential ongoing issues and monitoring recommendations)
-
-Format the report professionally with clear headings, bullet points, and actionable insights suitable for executive review.
-"""
-        
-        # Call Gemini API
         if not GEMINI_API_KEY:
             return JSONResponse(
                 status_code=400,
                 content={"error": "Gemini API key not configured"}
             )
         
-        model = genai.GenerativeModel('gemini-3-pro-preview')
-        response = model.generate_content(context)
-        
-        # Generate PDF
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        from io import BytesIO
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor='#1e40af',
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        story.append(Paragraph("BillGuard AI - Combined Audit Report", title_style))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Report content
-        report_text = response.text
-        paragraphs = report_text.split('\n')
-        
-        for para in paragraphs:
-            if para.strip():
-                if para.startswith('**') and para.endswith('**'):
-                    # Heading
-                    story.append(Paragraph(para.replace('**', ''), styles['Heading2']))
-                elif para.startswith('#'):
-                    # Heading
-                    story.append(Paragraph(para.replace('#', '').strip(), styles['Heading3']))
-                else:
-                    # Normal text
-                    story.append(Paragraph(para, styles['BodyText']))
-                story.append(Spacer(1, 0.1*inch))
-        
-        doc.build(story)
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
-        
-        # Return PDF as base64
-        import base64
-        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+        mode = data.get("mode")
+        if mode is not None and mode not in REPORT_MODES:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"mode must be one of {', '.join(REPORT_MODES)}"}
+            )
         
-        return {
-            "report": response.text,
-            "pdf": pdf_base64,
-            "generated_at": datetime.now().isoformat(),
-            "bills_analyzed": len(results),
-            "total_issues": len(all_anomalies)
-        }
+        job = await job_runner.submit("combined_report", {"results": results, "mode": mode})
+        return JSONResponse(status_code=202, content=job_links(job))
     
     except Exception as e:
-        print(f"Error generating combined report: {e}")
+        print(f"Error queueing combined report: {e}")
         import traceback
         traceback.print_exc()
         return JSONResponse(
@@ -424,6 +767,155 @@ Format the report professionally with clear headings, bullet points, and actiona
             content={"error": str(e)}
         )
 
+
+def job_not_found(job_id):
+    return JSONResponse(
+        status_code=404,
+        content={"error": f"Job {job_id} not found"}
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        return job_not_found(job_id)
+    return job_links(public_view(job))
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        return job_not_found(job_id)
+    if job["status"] == "failed":
+        return JSONResponse(
+            status_code=500,
+            content={"error": job["error"]}
+        )
+    if job["status"] != "succeeded":
+        # Not ready yet: same body as the status endpoint
+        return JSONResponse(status_code=202, content=job_links(public_view(job)))
+    return job["result"]
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    # Server-sent events: a "status" event whenever the job's status or stage
+    # changes, then a final "result" or "error" event.
+    if not job_queue.get(job_id):
+        return job_not_found(job_id)
+    
+    async def events():
+        last = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield format_stream_event("error", {"error": f"Job {job_id} not found"}, "sse")
+                return
+            view = public_view(job)
+            if (view["status"], view["stage"]) != last:
+                last = (view["status"], view["stage"])
+                yield format_stream_event("status", view, "sse")
+            if job["status"] == "succeeded":
+                yield format_stream_event("result", job["result"], "sse")
+                return
+            if job["status"] == "failed":
+                yield format_stream_event("error", {"error": job["error"]}, "sse")
+                return
+            await job_runner.wait_for_change(timeout=1.0)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def parse_byte_range(header, size):
+    # Single "bytes=start-end" ranges only (what browsers and download
+    # managers send); returns (start, end) inclusive, None to serve the whole
+    # file, or "unsatisfiable".
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        elif end:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(end)), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+
+def read_file_range(path, start, end, chunk_size=64 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@app.api_route("/api/reports/{artifact_id}.pdf", methods=["GET", "HEAD"])
+async def download_report_pdf(artifact_id: str, request: Request):
+    # Streams a rendered report from the artifact store. The id is the PDF's
+    # SHA-256, so it is also a strong ETag: If-None-Match answers 304 and
+    # Range / If-Range resume partial downloads.
+    path = artifact_store.path(artifact_id)
+    if not path:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Report PDF not found or expired"}
+        )
+    
+    size = os.path.getsize(path)
+    etag = f'"{artifact_id}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400, immutable",
+        "Content-Disposition": 'inline; filename="BillGuard-Combined-Report.pdf"',
+    }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = parse_byte_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        # The client's partial copy is of a different file: send it all
+        byte_range = None
+    if byte_range == "unsatisfiable":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="application/pdf")
+    return StreamingResponse(
+        read_file_range(path, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/pdf"
+    )
+
 # --- Static frontend (Vite build) ---
 # Mount static files AFTER all API routes so API routes take priority
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
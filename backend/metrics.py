@@ -0,0 +1,180 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from starlette.routing import Match
+
+
+# Prometheus text-format metrics, kept in process. Every series carries an
+# `endpoint` label: the route template of the request being served (e.g.
+# "/api/jobs/{job_id}"), "job:<kind>" inside background jobs, and
+# "background" for anything else. A summary model call shared by several
+# requests is labeled with the request that opened its batch. Each uvicorn
+# worker process keeps its own series, so scrape every worker (or run one
+# worker per container).
+
+ENDPOINT = contextvars.ContextVar("metrics_endpoint", default="background")
+
+# 100 µs (a regex pass over one page) up to a minute (a long LLM report)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = ("endpoint",) + tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = (ENDPOINT.get(),) + tuple(labels[name] for name in self.labels[1:])
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    # Per series: one count per bucket (made cumulative when rendered), the
+    # sum and the count, so an observation is a bisect and three additions
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = ("endpoint",) + tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = (ENDPOINT.get(),) + tuple(labels[name] for name in self.labels[1:])
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "billguard_stage_duration_seconds",
+    "Time spent per pipeline stage: pdf_open, text_extraction and regex_matching (per bill), "
+    "anomaly_detection, llm_anthropic and llm_gemini (per call) and pdf_rendering",
+    labels=("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "billguard_http_request_duration_seconds",
+    "HTTP request time, streamed responses until their last byte",
+    labels=("method", "status"),
+)
+CACHE_HITS = Counter("billguard_cache_hits_total", "Answers served from a cache", labels=("cache",))
+CACHE_MISSES = Counter("billguard_cache_misses_total", "Cache lookups that had to compute", labels=("cache",))
+SUMMARY_FALLBACKS = Counter(
+    "billguard_summary_fallbacks_total",
+    "Bills given the rule-based summary instead of an AI one (reason: disabled or error)",
+    labels=("reason",),
+)
+EXTRACTION_FAILURES = Counter(
+    "billguard_extraction_failures_total",
+    "PDFs that could not be extracted (reason: unreadable, busy or timeout)",
+    labels=("reason",),
+)
+
+METRICS = (STAGE_SECONDS, REQUEST_SECONDS, CACHE_HITS, CACHE_MISSES, SUMMARY_FALLBACKS, EXTRACTION_FAILURES)
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def observe_extraction(stats):
+    # extract_bill runs in a pool process, so its stage timings come back in
+    # its stats and are recorded here, in the server process
+    for stage, seconds in (stats or {}).get("timings", {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: resolves the route template before the handler
+    # runs, so everything the request does (threadpool calls and tasks it
+    # starts included) is labeled with it, and times the whole response.
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    def endpoint(self, scope):
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "") or "/"
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = ENDPOINT.set(self.endpoint(scope))
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], status=str(status[0]))
+            ENDPOINT.reset(token)
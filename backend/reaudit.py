@@ -0,0 +1,150 @@
+"""Incremental re-audit: bring stored results up to date after a rule change.
+
+Usage:
+    python ingest.py ../corpus --db results.db     # extract and audit once
+    # ...edit rules.json, e.g. tier1_rate's expected_rate or calculation's tolerance...
+    python reaudit.py results.db --dry-run         # what would change
+    python reaudit.py results.db                   # apply
+    python reaudit.py results.db --audit-dir cache/audits
+
+Works on an ingest.py --db database, whose extracted fields (bills) are kept
+apart from detection results (audits), and audits.rule_versions records the
+version of each rule behind every verdict. Detection is re-run from the stored
+fields, so no PDF is opened:
+  - only results produced under a different rules config are read (an
+    indexed lookup on audits.rules_version)
+  - on those, only rules that were added or changed since are evaluated.
+    Anomalies from unchanged rules are kept and removed rules' are dropped
+  - results made under the same rule versions are re-audited together,
+    column-wise, as AnomalyDetector.detect_batch() does
+
+Give --history when the results were ingested with it, so changed usage
+rules are judged against the same per-account baselines.
+
+The API does the same for its extraction cache: a re-upload after a rule
+change re-runs only the changed rules on the cached fields.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+
+from bill_history import BillHistory
+from detection import AnomalyDetector
+from rules import RuleEngine
+
+
+def reaudit(db, detector, batch=1000, dry_run=False, audit_store=None, show=10):
+    conn = sqlite3.connect(db)
+    version = detector.version
+    rule_versions = json.dumps(detector.rule_versions)
+    stats = {"stale": 0, "rules_evaluated": Counter(), "changed": 0,
+             "severity": Counter(), "samples": []}
+    last = ""
+    start = time.perf_counter()
+    while True:
+        # Keyset pagination, so rows updated along the way (or not, on a dry
+        # run) are never read twice
+        rows = conn.execute(
+            "SELECT a.path, b.sha256, b.data, a.anomalies, a.severity, a.rule_versions FROM audits a"
+            " JOIN bills b USING (path) WHERE a.rules_version IS NOT ? AND a.path > ?"
+            " ORDER BY a.path LIMIT ?",
+            (version, last, batch),
+        ).fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        # Results made under the same rule versions need the same rules
+        # re-run, so each such group is re-audited column-wise in one pass
+        groups = {}
+        for path, sha256, data, anomalies, severity, stored_versions in rows:
+            anomalies = json.loads(anomalies)
+            tagged = all("rule" in anomaly for anomaly in anomalies)
+            groups.setdefault((stored_versions, tagged), []).append(
+                (path, sha256, json.loads(data), anomalies, severity)
+            )
+        updates = []
+        now = time.time()
+        for (stored_versions, _), group in groups.items():
+            stats["stale"] += len(group)
+            paths, hashes, bills, old, severities = zip(*group)
+            new, new_severities, evaluated = detector.reaudit_batch(
+                list(bills), list(old), json.loads(stored_versions or "null")
+            )
+            for rule_id in evaluated:
+                stats["rules_evaluated"][rule_id] += len(group)
+            for path, sha256, data, old_anomalies, severity, anomalies, new_severity in zip(
+                paths, hashes, bills, old, severities, new, new_severities
+            ):
+                if anomalies != old_anomalies or new_severity != severity:
+                    stats["changed"] += 1
+                    stats["severity"][f"{severity} -> {new_severity}"] += 1
+                    if len(stats["samples"]) < show:
+                        stats["samples"].append(
+                            (path, [a["type"] for a in old_anomalies], [a["type"] for a in anomalies])
+                        )
+                    if audit_store:
+                        # Documents are identified by content hash, as the
+                        # API and ingest.py record them
+                        audit_store.append(data, anomalies, new_severity, sha256)
+                updates.append((new_severity, len(anomalies), json.dumps(anomalies), version, rule_versions, now, path))
+        if not dry_run:
+            with conn:
+                conn.executemany(
+                    "UPDATE audits SET severity = ?, anomaly_count = ?, anomalies = ?, rules_version = ?,"
+                    " rule_versions = ?, audited_at = ? WHERE path = ?",
+                    updates,
+                )
+    conn.close()
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", help="ingest.py --db results database")
+    parser.add_argument("--rules", help="rules config (default: RULES_PATH or backend/rules.json)")
+    parser.add_argument("--batch", type=int, default=1000, help="results read and updated per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--audit-dir", help="also append changed verdicts to an audit store (needs pyarrow)")
+    parser.add_argument("--show", type=int, default=10, help="changed bills to list")
+    parser.add_argument("--history", help="BillHistory database for per-account baselines, as ingest.py --history")
+    args = parser.parse_args()
+
+    # No hot reload: every result written in this run gets the same versions
+    engine = RuleEngine(args.rules or os.getenv("RULES_PATH") or None, reload_interval=float("inf"))
+    history = BillHistory(args.history) if args.history else None
+    detector = AnomalyDetector(engine, history=history)
+    print(f"Rules {engine.path} (version {engine.version})")
+
+    audit_store = None
+    if args.audit_dir and not args.dry_run:
+        from audit_store import AuditStore
+        audit_store = AuditStore(args.audit_dir)
+
+    try:
+        stats = reaudit(args.db, detector, args.batch, args.dry_run, audit_store, args.show)
+    finally:
+        if audit_store:
+            audit_store.close()
+        if history:
+            history.close()
+
+    if not stats["stale"]:
+        print("All results are current; nothing to re-audit.")
+        return
+    print(f"{stats['stale']:,} results from older rules re-audited in {stats['elapsed']:.2f}s"
+          f"{' (dry run, nothing written)' if args.dry_run else ''}")
+    for rule_id, count in sorted(stats["rules_evaluated"].items()):
+        print(f"  {rule_id}: evaluated on {count:,} bills")
+    print(f"  {stats['changed']:,} verdicts changed")
+    for transition, count in stats["severity"].most_common():
+        print(f"    severity {transition}: {count:,}")
+    for path, old, new in stats["samples"]:
+        print(f"    {path}: {old or 'no issues'} -> {new or 'no issues'}")
+
+
+if __name__ == "__main__":
+    main()
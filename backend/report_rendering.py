@@ -0,0 +1,269 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import (
+    HRFlowable, Paragraph, Preformatted, SimpleDocTemplate, Spacer, Table, TableStyle,
+)
+
+
+# --- Styles ---
+# Built once at import and shared by every render; ReportLab only reads them.
+
+def build_styles():
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        'ReportTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor='#1e40af',
+        spaceAfter=30,
+        alignment=TA_CENTER
+    ))
+    styles.add(ParagraphStyle('ReportBullet', parent=styles['BodyText'], spaceBefore=0, spaceAfter=2))
+    styles.add(ParagraphStyle('ReportCell', parent=styles['BodyText'], fontSize=9, leading=11))
+    return styles
+
+
+STYLES = build_styles()
+
+HEADING_STYLES = {1: STYLES['Heading2'], 2: STYLES['Heading2'], 3: STYLES['Heading3']}
+
+TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e0e7ff')),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+
+# --- Markdown -> flowables ---
+# Covers what the models actually write in these reports: #/##/### headings,
+# lines that are entirely **bold** (used as headings), -/*/+ and numbered
+# lists with indentation, | pipe | tables |, --- rules, ``` code blocks, and
+# **bold**, *italic* and `code` inline. Everything else is body text, with
+# consecutive lines joined into one paragraph. Text is XML-escaped, so stray
+# "<" or "&" in model output can't break ReportLab's paragraph parser.
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+BOLD_LINE_RE = re.compile(r"^\*\*([^*].*?)\*\*:?$")
+LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+
+INLINE_RULES = [
+    (re.compile(r"`([^`]+)`"), r'<font face="Courier">\1</font>'),
+    (re.compile(r"\*\*(.+?)\*\*"), r"<b>\1</b>"),
+    (re.compile(r"__(.+?)__"), r"<b>\1</b>"),
+    (re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?![*\w])"), r"<i>\1</i>"),
+]
+
+
+def inline_markup(text):
+    text = escape(text)
+    for pattern, replacement in INLINE_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _table_cells(line):
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+BULLET_STYLES = {}
+
+
+def _bullet_style(depth):
+    # One indented style per nesting depth, created on first use and reused
+    if depth not in BULLET_STYLES:
+        BULLET_STYLES[depth] = ParagraphStyle(
+            f'ReportBullet{depth}', parent=STYLES['ReportBullet'],
+            leftIndent=18 * (depth + 1), bulletIndent=18 * depth + 6,
+        )
+    return BULLET_STYLES[depth]
+
+
+def _list_flowables(items):
+    # items: [(indent, marker, text)]. Plain Paragraphs with bulletText lay out
+    # several times faster than ListFlowable and are enough for these lists.
+    flowables = []
+    indents = []
+    counters = []
+    for indent, marker, text in items:
+        while indents and indent < indents[-1]:
+            indents.pop()
+            counters.pop()
+        if not indents or indent > indents[-1]:
+            indents.append(indent)
+            counters.append(None)
+        if marker[0].isdigit():
+            # Numbered items keep the model's first number ("5. Breakdown")
+            counters[-1] = int(marker[:-1]) if counters[-1] is None else counters[-1] + 1
+            bullet = f"{counters[-1]}."
+        else:
+            bullet = "\u2022"
+        flowables.append(Paragraph(inline_markup(text), _bullet_style(len(indents) - 1), bulletText=bullet))
+    return flowables
+
+
+def markdown_to_flowables(text):
+    flowables = []
+    paragraph = []
+    lines = text.replace("\r\n", "\n").split("\n")
+    i = 0
+
+    def flush_paragraph():
+        if paragraph:
+            flowables.append(Paragraph(inline_markup(" ".join(paragraph)), STYLES['BodyText']))
+            flowables.append(Spacer(1, 0.1*inch))
+            paragraph.clear()
+
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        if not stripped:
+            flush_paragraph()
+            i += 1
+            continue
+
+        if stripped.startswith("```"):
+            flush_paragraph()
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code.append(lines[i])
+                i += 1
+            flowables.append(Preformatted("\n".join(code), STYLES['Code']))
+            i += 1
+            continue
+
+        heading = HEADING_RE.match(stripped)
+        bold_line = BOLD_LINE_RE.match(stripped)
+        if heading or bold_line:
+            flush_paragraph()
+            if heading:
+                style = HEADING_STYLES.get(len(heading.group(1)), STYLES['Heading4'])
+                flowables.append(Paragraph(inline_markup(heading.group(2).strip("* ")), style))
+            else:
+                flowables.append(Paragraph(inline_markup(bold_line.group(1)), STYLES['Heading2']))
+            i += 1
+            continue
+
+        if RULE_RE.match(stripped):
+            flush_paragraph()
+            flowables.append(HRFlowable(width="100%", thickness=0.5, color=colors.HexColor('#cbd5e1'),
+                                        spaceBefore=4, spaceAfter=8))
+            i += 1
+            continue
+
+        if stripped.startswith("|") and i + 1 < len(lines) and TABLE_SEPARATOR_RE.match(lines[i + 1]):
+            flush_paragraph()
+            rows = [_table_cells(stripped)]
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                rows.append(_table_cells(lines[i]))
+                i += 1
+            width = max(len(row) for row in rows)
+            data = [[Paragraph(inline_markup(cell), STYLES['ReportCell']) for cell in row + [""] * (width - len(row))]
+                    for row in rows]
+            table = Table(data, repeatRows=1, hAlign='LEFT')
+            table.setStyle(TABLE_STYLE)
+            flowables.append(table)
+            flowables.append(Spacer(1, 0.1*inch))
+            continue
+
+        if LIST_RE.match(line):
+            flush_paragraph()
+            items = []
+            while i < len(lines):
+                match = LIST_RE.match(lines[i])
+                if match:
+                    indent, marker, item = match.groups()
+                    items.append((len(indent.expandtabs(4)), marker, item))
+                elif lines[i].strip() and items and lines[i].startswith(" "):
+                    # Wrapped continuation of the previous item
+                    indent, marker, item = items[-1]
+                    items[-1] = (indent, marker, f"{item} {lines[i].strip()}")
+                else:
+                    break
+                i += 1
+            flowables.extend(_list_flowables(items))
+            flowables.append(Spacer(1, 0.1*inch))
+            continue
+
+        paragraph.append(stripped)
+        i += 1
+
+    flush_paragraph()
+    return flowables
+
+
+# --- Templates ---
+
+class ReportTemplate:
+    # Page layout for one kind of report: title, margins and a footer with the
+    # page number. Created once; render() builds a fresh document and fresh
+    # flowables each call (flowables hold layout state, so they aren't shared
+    # between renders running in different threads).
+    def __init__(self, title, footer="BillGuard AI"):
+        self.title = title
+        self.title_markup = escape(title)
+        self.footer = footer
+
+    def _draw_footer(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(doc.leftMargin, 0.3*inch, self.footer)
+        canvas.drawRightString(doc.pagesize[0] - doc.rightMargin, 0.3*inch, f"Page {doc.page}")
+        canvas.restoreState()
+
+    def render(self, report_text):
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch,
+                                title=self.title)
+        story = [Paragraph(self.title_markup, STYLES['ReportTitle']), Spacer(1, 0.2*inch)]
+        story += markdown_to_flowables(report_text)
+        doc.build(story, onFirstPage=self._draw_footer, onLaterPages=self._draw_footer)
+        pdf_bytes = buffer.getvalue()
+        buffer.close()
+        return pdf_bytes
+
+
+TEMPLATES = {
+    "combined": ReportTemplate("BillGuard AI - Combined Audit Report"),
+    "bill": ReportTemplate("BillGuard AI - Bill Audit Report"),
+}
+
+
+def render_report_pdf(report_text, template="combined"):
+    # CPU-bound; callers on the event loop run it in a thread
+    return TEMPLATES[template].render(report_text)
+
+
+def render_combined_report_pdf(report_text):
+    return render_report_pdf(report_text, "combined")
+
+
+def _render_bill(report_text):
+    return render_report_pdf(report_text, "bill")
+
+
+def render_many(reports, workers=None, template="bill"):
+    # Renders many reports at once on a process pool (ReportLab layout is
+    # pure Python, so threads would serialize on the GIL). Returns the PDFs
+    # in the same order as `reports`.
+    reports = list(reports)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(reports) <= 1:
+        return [render_report_pdf(text, template) for text in reports]
+    fn = _render_bill if template == "bill" else render_combined_report_pdf
+    with ProcessPoolExecutor(max_workers=min(workers, len(reports))) as pool:
+        return list(pool.map(fn, reports, chunksize=max(1, len(reports) // (workers * 4))))
@@ -0,0 +1,400 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from bill_history import BASELINE_FIELDS
+
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+
+# --- Rule types ---
+# Each type is compiled from one config entry. `inputs` lists the data fields
+# it reads; evaluate() handles one bill and evaluate_columns() a whole table
+# (returning the flag mask plus anomalies for flagged rows, in row order).
+
+class UsageThresholdRule:
+    # Flags usage above a fixed threshold. With a "history" block the bill is
+    # compared to the account's own baseline instead, whenever the account has
+    # at least `min_bills` earlier bills: the same calendar month's profile
+    # first, then the account's overall record. A spike must be more than
+    # `z_threshold` standard deviations and `min_ratio` times above the mean.
+    # Baselines arrive as history_* / season_* fields added by the detector.
+    def __init__(self, config):
+        self.threshold = config["threshold_kwh"]
+        self.baseline = config["baseline_kwh"]
+        self.excess_rate = config["excess_rate"]
+        history = config.get("history")
+        self.history = history is not None
+        if history is not None:
+            self.min_bills = history.get("min_bills", 3)
+            self.z_threshold = history.get("z_threshold", 3.0)
+            self.min_ratio = history.get("min_ratio", 1.25)
+        self.inputs = ("usage_kwh",) + (BASELINE_FIELDS if self.history else ())
+
+    def _account_baseline(self, data):
+        for basis, prefix in (("seasonal", "season"), ("account", "history")):
+            count = data.get(f"{prefix}_bills", 0)
+            if count >= self.min_bills:
+                return basis, count, data.get(f"{prefix}_mean_kwh", 0), data.get(f"{prefix}_std_kwh", 0)
+        return None
+
+    def evaluate(self, data):
+        usage = data.get('usage_kwh', 0)
+        if self.history:
+            baseline = self._account_baseline(data)
+            if baseline:
+                basis, count, mean, std = baseline
+                if usage > mean + self.z_threshold * std and usage > mean * self.min_ratio:
+                    return self.history_anomaly(usage, basis, count, mean)
+                return None
+        if usage > self.threshold:
+            return self.anomaly(usage)
+        return None
+
+    def evaluate_columns(self, column):
+        usage = column("usage_kwh")
+        mask = usage > self.threshold
+        if not self.history:
+            return mask, [self.anomaly(u) for u in usage[mask].tolist()]
+
+        seasonal = column("season_bills") >= self.min_bills
+        account = ~seasonal & (column("history_bills") >= self.min_bills)
+        count = np.where(seasonal, column("season_bills"), column("history_bills"))
+        mean = np.where(seasonal, column("season_mean_kwh"), column("history_mean_kwh"))
+        std = np.where(seasonal, column("season_std_kwh"), column("history_std_kwh"))
+        spike = (usage > mean + self.z_threshold * std) & (usage > mean * self.min_ratio)
+        has_baseline = seasonal | account
+        mask = np.where(has_baseline, spike, mask)
+
+        anomalies = []
+        for i in np.flatnonzero(mask).tolist():
+            u = usage[i].item()
+            if has_baseline[i]:
+                basis = "seasonal" if seasonal[i] else "account"
+                anomalies.append(self.history_anomaly(u, basis, count[i].item(), mean[i].item()))
+            else:
+                anomalies.append(self.anomaly(u))
+        return mask, anomalies
+
+    def anomaly(self, usage):
+        return {
+            "type": "Usage Spike",
+            "severity": self.severity,
+            "detail": f"Consumption of {usage} kWh exceeds baseline ({self.baseline} kWh)",
+            "impact": f"Estimated ${(usage - self.baseline) * self.excess_rate:.2f} above normal"
+        }
+
+    def history_anomaly(self, usage, basis, count, mean):
+        where = "for this month" if basis == "seasonal" else "overall"
+        return {
+            "type": "Usage Spike",
+            "severity": self.severity,
+            "detail": f"Consumption of {usage} kWh is {usage / mean:.1f}x this account's average "
+                      f"{where} ({mean:.0f} kWh over {count} bills)",
+            "impact": f"Estimated ${(usage - mean) * self.excess_rate:.2f} above normal"
+        }
+
+
+class TariffRateRule:
+    # Uses the printed tier rate when the bill has one, otherwise derives it
+    # from the tier's cost and usage (the Streamlit extractor doesn't read the
+    # rate column).
+    def __init__(self, config):
+        tier = config.get("tier", 1)
+        self.tier = tier
+        self.expected = config["expected_rate"]
+        self.tolerance = config["tolerance"]
+        self.rate_field = f"tier{tier}_rate"
+        self.usage_field = f"tier{tier}_usage"
+        self.cost_field = f"tier{tier}_cost"
+        self.inputs = (self.rate_field, self.usage_field, self.cost_field)
+
+    def evaluate(self, data):
+        rate = data.get(self.rate_field, 0)
+        usage = data.get(self.usage_field, 0)
+        if not rate > 0:
+            cost = data.get(self.cost_field, 0)
+            if not (usage > 0 and cost > 0):
+                return None
+            rate = cost / usage
+        if abs(rate - self.expected) > self.tolerance:
+            return self.anomaly(rate, usage)
+        return None
+
+    def evaluate_columns(self, column):
+        printed = column(self.rate_field)
+        usage = column(self.usage_field)
+        cost = column(self.cost_field)
+        derivable = (usage > 0) & (cost > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            derived = np.where(derivable, cost / np.where(usage > 0, usage, 1), 0)
+        rate = np.where(printed > 0, printed, derived)
+        mask = ((printed > 0) | derivable) & (np.abs(rate - self.expected) > self.tolerance)
+        return mask, [self.anomaly(r, u) for r, u in zip(rate[mask].tolist(), usage[mask].tolist())]
+
+    def anomaly(self, rate, usage):
+        return {
+            "type": "Rate Error",
+            "severity": self.severity,
+            "detail": f"Tier {self.tier} rate ${rate:.2f}/kWh (expected ${self.expected:.2f}/kWh)",
+            "impact": f"Overcharge of ${(rate - self.expected) * usage:.2f}"
+        }
+
+
+class CalculationRule:
+    def __init__(self, config):
+        self.tolerance = config["tolerance"]
+        self.inputs = ("components_sum", "total_amount")
+
+    def evaluate(self, data):
+        components = data.get('components_sum', 0)
+        total = data.get('total_amount', 0)
+        if components > 0 and total > 0:
+            diff = abs(total - components)
+            if diff > self.tolerance:
+                return self.anomaly(components, total, diff)
+        return None
+
+    def evaluate_columns(self, column):
+        components = column("components_sum")
+        total = column("total_amount")
+        diff = np.abs(total - components)
+        mask = (components > 0) & (total > 0) & (diff > self.tolerance)
+        return mask, [self.anomaly(c, t, d) for c, t, d in
+                      zip(components[mask].tolist(), total[mask].tolist(), diff[mask].tolist())]
+
+    def anomaly(self, components, total, diff):
+        return {
+            "type": "Calculation Error",
+            "severity": self.severity,
+            "detail": f"Line items total ${components:.2f}, billed ${total:.2f}",
+            "impact": f"Discrepancy of ${diff:.2f}"
+        }
+
+
+RULE_TYPES = {
+    "usage_threshold": UsageThresholdRule,
+    "tariff_rate": TariffRateRule,
+    "calculation": CalculationRule,
+}
+
+
+def compile_rule(config):
+    rule_type = RULE_TYPES.get(config.get("type"))
+    if rule_type is None:
+        raise ValueError(f"Unknown rule type: {config.get('type')}")
+    rule = rule_type(config)
+    rule.id = config["id"]
+    rule.severity = config.get("severity", "high")
+    if rule.severity not in SEVERITY_RANK:
+        raise ValueError(f"Unknown severity for rule {rule.id}: {rule.severity}")
+    # Per-rule version, so a change to one rule can be told apart from the rest
+    rule.version = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+    # A rule that stays quiet on an empty bill can't fire on a bill that has
+    # none of its inputs, so re-audits can skip those bills
+    rule.needs_inputs = rule.evaluate({}) is None
+    return rule
+
+
+class RuleEngine:
+    # Loads rules from a JSON config and compiles them into a plan: an ordered
+    # tuple of rule objects with their thresholds bound. The config file is
+    # re-checked at most every `reload_interval` seconds and a changed file is
+    # swapped in without a restart; a broken file keeps the previous plan.
+    def __init__(self, path=None, reload_interval=1.0):
+        self.path = path or DEFAULT_RULES_PATH
+        self.reload_interval = reload_interval
+        self.config = None
+        self.version = None
+        self.loaded_at = None
+        self.last_error = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        # (plan, per-rule [count, total_ns]) swapped as one object so a reload
+        # never pairs a new plan with old timings
+        self._compiled = ((), {})
+        self.reload()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("RULES_PATH") or None,
+            reload_interval=float(os.getenv("RULES_RELOAD_INTERVAL", "1")),
+        )
+
+    def reload(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path) as f:
+                config = json.load(f)
+            plan = tuple(compile_rule(rule) for rule in config["rules"])
+            self._compiled = (plan, {rule.id: [0, 0] for rule in plan})
+            self.config = config
+            self.version = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+            self._mtime = mtime
+            self.loaded_at = time.time()
+            self.last_error = None
+        return self.version
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime != self._mtime:
+                # Don't retry a broken file until it changes again
+                self._mtime = mtime
+                self.reload()
+                print(f"Reloaded anomaly rules from {self.path} (version {self.version})")
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error reloading anomaly rules: {e}")
+
+    @property
+    def plan(self):
+        return self._compiled[0]
+
+    @property
+    def inputs(self):
+        return sorted({field for rule in self.plan for field in rule.inputs})
+
+    @property
+    def rule_versions(self):
+        return {rule.id: rule.version for rule in self.plan}
+
+    def is_stale(self, anomalies, rule_versions):
+        # Whether a stored result was produced by a different plan. A result
+        # whose anomalies carry no "rule" tag predates per-rule versions, so
+        # it is always treated as stale.
+        self.maybe_reload()
+        if rule_versions != self.rule_versions:
+            return True
+        return any("rule" not in anomaly for anomaly in anomalies)
+
+    def evaluate(self, data):
+        self.maybe_reload()
+        plan, timings = self._compiled
+        anomalies = []
+        severity = "low"
+        for rule in plan:
+            start = time.perf_counter_ns()
+            anomaly = rule.evaluate(data)
+            timing = timings[rule.id]
+            timing[0] += 1
+            timing[1] += time.perf_counter_ns() - start
+            if anomaly:
+                anomaly["rule"] = rule.id
+                anomalies.append(anomaly)
+                if SEVERITY_RANK[anomaly["severity"]] > SEVERITY_RANK[severity]:
+                    severity = anomaly["severity"]
+        return anomalies, severity
+
+    def reaudit(self, data, anomalies, rule_versions):
+        # Brings a stored result up to the current plan without re-extracting
+        # the bill. Anomalies from rules whose version is unchanged are kept,
+        # removed rules' anomalies are dropped, and only new or changed rules
+        # are evaluated, skipping any whose inputs the bill doesn't have.
+        # Returns (anomalies, severity, ids of the rules evaluated); anomalies
+        # stay in plan order, as evaluate() returns them.
+        self.maybe_reload()
+        plan, timings = self._compiled
+        if any("rule" not in anomaly for anomaly in anomalies):
+            rule_versions = {}
+        rule_versions = rule_versions or {}
+        kept = {anomaly["rule"]: anomaly for anomaly in anomalies}
+        result = []
+        evaluated = []
+        severity = "low"
+        for rule in plan:
+            if rule_versions.get(rule.id) == rule.version:
+                anomaly = kept.get(rule.id)
+            elif rule.needs_inputs and not any(field in data for field in rule.inputs):
+                anomaly = None
+            else:
+                start = time.perf_counter_ns()
+                anomaly = rule.evaluate(data)
+                timing = timings[rule.id]
+                timing[0] += 1
+                timing[1] += time.perf_counter_ns() - start
+                evaluated.append(rule.id)
+                if anomaly:
+                    anomaly["rule"] = rule.id
+            if anomaly:
+                result.append(anomaly)
+                if SEVERITY_RANK[anomaly["severity"]] > SEVERITY_RANK[severity]:
+                    severity = anomaly["severity"]
+        return result, severity, evaluated
+
+    def evaluate_batch(self, column, n):
+        # `column(name)` returns the named column as an ndarray of length n
+        self.maybe_reload()
+        plan, timings = self._compiled
+        anomalies = [[] for _ in range(n)]
+        rank = np.zeros(n, dtype=np.int8)
+        for rule in plan:
+            start = time.perf_counter_ns()
+            mask, flagged = rule.evaluate_columns(column)
+            for i, anomaly in zip(np.flatnonzero(mask).tolist(), flagged):
+                anomaly["rule"] = rule.id
+                anomalies[i].append(anomaly)
+            rank = np.where(mask, np.maximum(rank, SEVERITY_RANK[rule.severity]), rank)
+            timing = timings[rule.id]
+            timing[0] += n
+            timing[1] += time.perf_counter_ns() - start
+        names = np.array(sorted(SEVERITY_RANK, key=SEVERITY_RANK.get))
+        return anomalies, names[rank].tolist()
+
+    def reaudit_batch(self, column, n, anomalies, rule_versions):
+        # reaudit() for n stored results that share `rule_versions`, with the
+        # new or changed rules evaluated column-wise as in evaluate_batch().
+        # Returns (anomalies, severities, ids of the rules evaluated).
+        self.maybe_reload()
+        plan, timings = self._compiled
+        if any("rule" not in anomaly for row in anomalies for anomaly in row):
+            rule_versions = {}
+        rule_versions = rule_versions or {}
+        stale = [rule for rule in plan if rule_versions.get(rule.id) != rule.version]
+        current = {rule.id for rule in plan if rule not in stale}
+        by_rule = [{a["rule"]: a for a in row if a.get("rule") in current} for row in anomalies]
+        for rule in stale:
+            start = time.perf_counter_ns()
+            mask, flagged = rule.evaluate_columns(column)
+            for i, anomaly in zip(np.flatnonzero(mask).tolist(), flagged):
+                anomaly["rule"] = rule.id
+                by_rule[i][rule.id] = anomaly
+            timing = timings[rule.id]
+            timing[0] += n
+            timing[1] += time.perf_counter_ns() - start
+
+        results, severities = [], []
+        for found in by_rule:
+            row = [found[rule.id] for rule in plan if rule.id in found]
+            results.append(row)
+            severities.append(max((a["severity"] for a in row), key=SEVERITY_RANK.get, default="low"))
+        return results, severities, [rule.id for rule in stale]
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+            "rules": {
+                rule_id: {
+                    "evaluations": count,
+                    "total_ms": round(total_ns / 1e6, 3),
+                    "mean_us": round(total_ns / count / 1e3, 3) if count else None,
+                }
+                for rule_id, (count, total_ns) in self._compiled[1].items()
+            },
+        }
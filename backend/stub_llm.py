@@ -0,0 +1,96 @@
+"""Local stand-in for the Anthropic Messages API, for testing and load runs.
+
+Usage:
+    uvicorn stub_llm:app --port 8787
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 ANTHROPIC_API_KEY=stub uvicorn main:app
+
+Behaviour is controlled with environment variables:
+    STUB_LLM_LATENCY       seconds to wait before answering (default 0.2)
+    STUB_LLM_JITTER        extra random latency, up to this many seconds (default 0)
+    STUB_LLM_FAILURE_RATE  fraction of requests answered with a 529 (default 0)
+    STUB_LLM_FAIL_FIRST    answer this many requests with a 529 before any other (default 0)
+    STUB_LLM_DROP_RATE     fraction of bills left out of batched answers (default 0)
+
+Batched prompts (bills listed under "[B1]", "[B2]", ... headers) are answered
+with a JSON object mapping each bill id to its summary.
+"""
+import asyncio
+import json
+import os
+import random
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Stub LLM")
+
+LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0.2"))
+JITTER = float(os.getenv("STUB_LLM_JITTER", "0"))
+FAILURE_RATE = float(os.getenv("STUB_LLM_FAILURE_RATE", "0"))
+DROP_RATE = float(os.getenv("STUB_LLM_DROP_RATE", "0"))
+FAIL_FIRST = int(os.getenv("STUB_LLM_FAIL_FIRST", "0"))
+
+# max_in_flight is the most requests the stub has been answering at once
+counts = {"requests": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    counts["requests"] += 1
+    counts["in_flight"] += 1
+    counts["max_in_flight"] = max(counts["max_in_flight"], counts["in_flight"])
+    try:
+        await asyncio.sleep(LATENCY + random.uniform(0, JITTER))
+    finally:
+        counts["in_flight"] -= 1
+
+    if counts["requests"] <= FAIL_FIRST or random.random() < FAILURE_RATE:
+        counts["failed"] += 1
+        return JSONResponse(
+            status_code=529,
+            content={"type": "error", "error": {"type": "overloaded_error", "message": "Stub overloaded"}}
+        )
+
+    # Deterministic answer built from the prompt so callers can check it
+    prompt = body["messages"][-1]["content"]
+    if isinstance(prompt, list):
+        prompt = " ".join(block.get("text", "") for block in prompt)
+    bills = {}
+    current = None
+    for line in prompt.splitlines():
+        if line.startswith("[") and line.endswith("]"):
+            current = line[1:-1]
+            bills[current] = []
+        elif line.startswith("- "):
+            bills.setdefault(current, []).append(line[2:].split(":")[0])
+
+    if not bills or None in bills:
+        text = summary(bills.get(None, []))
+    else:
+        text = json.dumps({
+            bill_id: summary(issues)
+            for bill_id, issues in bills.items()
+            if random.random() >= DROP_RATE
+        })
+
+    return {
+        "id": f"msg_stub_{uuid.uuid4().hex[:12]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4},
+    }
+
+
+def summary(issues):
+    return f"Stub summary of {len(issues)} issue(s): {', '.join(issues) or 'none'}."
+
+
+@app.get("/stats")
+async def stats():
+    return counts
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+def bucket(value, digits=2):
+    # Round to `digits` significant figures, so 948 and 952 kWh (or a $10.00
+    # and $10.40 overcharge) land in the same bucket.
+    if not value:
+        return 0
+    return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+
+def fingerprint(kind, anomalies, metrics=None, digits=2, **context):
+    # Normalized description of what the LLM is asked about: anomaly types and
+    # severities plus the bucketed numbers quoted in their detail and impact
+    # text, the bucketed bill metrics, and any exact-match context (model,
+    # account, ...). Anomaly order doesn't matter.
+    normalized = sorted(
+        (
+            a.get("type", ""),
+            a.get("severity", ""),
+            [bucket(float(n.replace(",", "")), digits)
+             for n in NUMBER_RE.findall(f"{a.get('detail', '')} {a.get('impact', '')}")],
+        )
+        for a in anomalies
+    )
+    payload = {
+        "anomalies": normalized,
+        "metrics": {k: bucket(float(v), digits) for k, v in sorted((metrics or {}).items())},
+        "context": context,
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{kind}:{digest}"
+
+
+class SummaryCache:
+    # Cache for LLM-written summaries and reports keyed by fingerprint(). Bills
+    # with the same kinds of issues at similar magnitudes reuse one answer
+    # instead of paying for another LLM round-trip. Entries expire after `ttl`
+    # seconds; the memory tier is an LRU of `max_entries`, and the optional
+    # SQLite tier survives restarts. Concurrent misses for the same key share
+    # one computation.
+    def __init__(self, max_entries=1024, ttl=7 * 24 * 3600, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._db = None
+        self._counts = {}
+        if path:
+            self._open_disk()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("SUMMARY_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600))),
+            path=os.getenv("SUMMARY_CACHE_PATH") or None,
+        )
+
+    def _open_disk(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS summaries_accessed ON summaries (accessed)")
+        self._db.execute("DELETE FROM summaries WHERE expires <= ?", (time.time(),))
+        self._db.commit()
+
+    def _count(self, key, outcome):
+        kind = key.split(":", 1)[0]
+        counts = self._counts.setdefault(kind, {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "coalesced": 0})
+        counts[outcome] += 1
+
+    def _remember(self, key, value, expires):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self._count(key, "hits")
+                    return value
+                # Counted as a miss too; the disk copy has expired as well
+                del self._memory[key]
+                self._count(key, "expired")
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires FROM summaries WHERE key = ? AND expires > ?", (key, now)
+                ).fetchone()
+                if row:
+                    self._db.execute("UPDATE summaries SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self._count(key, "hits")
+                    self._count(key, "disk_hits")
+                    return value
+
+            self._count(key, "misses")
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            self._db.execute("DELETE FROM summaries WHERE expires <= ?", (now,))
+            self._db.execute(
+                "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self._db.commit()
+
+    async def get_or_compute(self, key, compute):
+        # Returns (value, cached). `compute` is an async callable run as its
+        # own task, so a caller that disconnects doesn't cancel it for the
+        # others waiting on the same key. If it raises, nothing is stored and
+        # every waiter sees the exception.
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        task = self._pending.get(key)
+        shared = task is not None
+        if shared:
+            self._count(key, "coalesced")
+        else:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._pending[key] = task
+        return await asyncio.shield(task), shared
+
+    async def _compute(self, key, compute):
+        try:
+            value = await compute()
+            self.put(key, value)
+            return value
+        finally:
+            self._pending.pop(key, None)
+
+    def stats(self):
+        stats = {"memory_entries": len(self._memory), "ttl": self.ttl, "persistent": self._db is not None}
+        for kind, counts in self._counts.items():
+            # Coalesced lookups missed the cache but waited on an identical
+            # request already in flight, so they didn't cost an LLM call either
+            lookups = counts["hits"] + counts["misses"]
+            saved = counts["hits"] + counts["coalesced"]
+            stats[kind] = {**counts, "hit_rate": round(saved / lookups, 3) if lookups else None}
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,4 +1,4 @@
-import requests, json, base64
+import requests, json, time
 
 url = 'http://127.0.0.1:8000/api/generate-combined-report'
 payload = {
@@ -22,12 +22,19 @@ payload = {
 
 headers = {'Content-Type': 'application/json'}
 resp = requests.post(url, data=json.dumps(payload), headers=headers)
+# Poll the background job until the report is ready
+if resp.status_code == 202:
+    result_url = 'http://127.0.0.1:8000' + resp.json()['result_url']
+    resp = requests.get(result_url)
+    while resp.status_code == 202:
+        time.sleep(1)
+        resp = requests.get(result_url)
 print('Status:', resp.status_code)
 print('Response:', resp.json())
 if resp.status_code == 200:
     data = resp.json()
-    if 'pdf' in data:
-        pdf_bytes = base64.b64decode(data['pdf'])
+    if 'pdf_url' in data:
+        pdf = requests.get('http://127.0.0.1:8000' + data['pdf_url'])
         with open('combined_report_test.pdf', 'wb') as f:
-            f.write(pdf_bytes)
+            f.write(pdf.content)
         print('PDF saved as combined_report_test.pdf')
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+# Backend modules are imported flat, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py builds its stores from the environment at import: keep them in
+# memory or in a scratch directory, and every model call offline
+for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_BASE_URL", "GEMINI_API_KEY"):
+    os.environ.pop(name, None)
+os.environ.update(BILL_HISTORY_PATH="", AUDIT_STORE_DIR="", EXTRACTION_CACHE_PATH="", SUMMARY_CACHE_PATH="",
+                  JOB_BACKEND="memory", EXTRACTION_WORKERS="1",
+                  ARTIFACT_DIR=os.path.join(tempfile.mkdtemp(), "artifacts"))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def shutdown_extraction_pool():
+    yield
+    if "main" in sys.modules:
+        sys.modules["main"].extraction_pool.shutdown()
+
+
+@pytest.fixture(scope="session")
+def stub_url():
+    # stub_llm.py served over real HTTP on a free local port
+    import uvicorn
+    import stub_llm
+
+    server = uvicorn.Server(uvicorn.Config(stub_llm.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def stub(stub_url, monkeypatch):
+    # The stub module with fresh counts and no latency, failures or drops;
+    # tests set the STUB_LLM_* behaviour they need on it
+    import stub_llm
+
+    monkeypatch.setattr(stub_llm, "counts", {"requests": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0})
+    for name, value in (("LATENCY", 0.0), ("JITTER", 0.0), ("FAILURE_RATE", 0.0), ("DROP_RATE", 0.0),
+                        ("FAIL_FIRST", 0)):
+        monkeypatch.setattr(stub_llm, name, value)
+    return stub_llm
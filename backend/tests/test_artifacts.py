@@ -0,0 +1,83 @@
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from artifacts import DEFAULT_ARTIFACT_DIR, ArtifactStore
+
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 8
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    monkeypatch.setattr(main, "artifact_store", store)
+    client = TestClient(main.app)
+    client.artifact_id = store.put(PDF)
+    client.url = f"/api/reports/{client.artifact_id}.pdf"
+    return client
+
+
+def test_default_dir_does_not_depend_on_the_working_directory():
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert DEFAULT_ARTIFACT_DIR == os.path.join(backend, "cache", "artifacts")
+
+
+def test_directory_is_created_on_first_put(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    assert not os.path.exists(store.root)
+    assert store.stats() == {"files": 0, "bytes": 0} and store.purge() == 0
+    assert store.path("0" * 64) is None
+    assert store.path(store.put(PDF))
+
+
+def test_unused_artifacts_are_purged_after_ttl(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"), ttl=60)
+    old, fresh = store.put(b"old"), store.put(b"fresh")
+    stale = time.time() - 120
+    os.utime(store.path(old), (stale, stale))
+    store.put(PDF)
+    assert store.path(old) is None and store.path(fresh)
+    assert store.stats()["files"] == 2
+
+
+def test_full_download_and_conditional_get(client):
+    response = client.get(client.url)
+    assert response.status_code == 200 and response.content == PDF
+    assert response.headers["etag"] == f'"{client.artifact_id}"'
+    assert response.headers["content-length"] == str(len(PDF))
+
+    response = client.get(client.url, headers={"If-None-Match": f'"other", "{client.artifact_id}"'})
+    assert response.status_code == 304 and not response.content
+    assert client.get(client.url, headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get("/api/reports/" + "0" * 64 + ".pdf").status_code == 404
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=2000-", 2000, len(PDF) - 1),
+    ("bytes=-16", len(PDF) - 16, len(PDF) - 1),
+    ("bytes=100-999999", 100, len(PDF) - 1),
+])
+def test_single_range_is_served_partially(client, header, start, end):
+    response = client.get(client.url, headers={"Range": header})
+    assert response.status_code == 206
+    assert response.content == PDF[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(PDF)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+def test_unsatisfiable_range(client):
+    response = client.get(client.url, headers={"Range": f"bytes={len(PDF)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(PDF)}"
+
+
+def test_if_range_only_resumes_the_same_file(client):
+    same = client.get(client.url, headers={"Range": "bytes=0-9", "If-Range": f'"{client.artifact_id}"'})
+    assert same.status_code == 206 and same.content == PDF[:10]
+    other = client.get(client.url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert other.status_code == 200 and other.content == PDF
@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from audit_store import AuditStore
+
+
+def bill(account, date, total):
+    return {"account_number": account, "bill_date": date, "total_amount": total, "usage_kwh": 500}
+
+
+CRITICAL = [{"type": "Calculation Error", "severity": "critical", "detail": "", "impact": ""}]
+
+
+def test_reaudited_bill_counts_its_latest_audit(tmp_path):
+    store = AuditStore(str(tmp_path))
+    store.append(bill("A", "Oct 01, 2024", 100.0), [], "low")
+    store.append(bill("B", "Oct 01, 2024", 50.0), [], "low")
+    store.append(bill("A", "Oct 01, 2024", 999.0), CRITICAL, "critical")
+
+    result = store.aggregates()
+    assert result["bills"] == 2
+    assert result["total_amount"] == 1049.0
+    assert result["critical_issues"] == 1
+    store.close()
+
+
+def test_latest_audit_wins_across_flushes(tmp_path):
+    store = AuditStore(str(tmp_path), flush_rows=1)
+    for total in (10.0, 20.0, 30.0):
+        store.append(bill("A", "Oct 01, 2024", total), [], "low")
+    store.append(bill("A", "Nov 01, 2024", 5.0), [], "low")
+
+    assert store.aggregates()["total_amount"] == 35.0
+    assert store.aggregates(start_month="2024-11")["total_amount"] == 5.0
+    store.close()
+
+
+def test_api_appends_off_the_event_loop(tmp_path, monkeypatch):
+    pytest.importorskip("reportlab")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from generate_bills import create_bill, random_bills
+    import main
+
+    with open(create_bill(random_bills(1, seed=2)[0], output_dir=str(tmp_path)), "rb") as f:
+        contents = f.read()
+    appended = []
+
+    class RecordingStore:
+        def append(self, data, anomalies, severity, document=None):
+            appended.append((threading.current_thread(), document))
+
+    monkeypatch.setattr(main, "audit_store", RecordingStore())
+
+    async def analyze_twice():
+        await main.analyze_contents(contents)
+        # A cache hit made under other rule versions is re-audited and appended again
+        key = main.ExtractionCache.key(contents, main.PATTERNS_VERSION, main.EXTRACTION_MODE)
+        main.extraction_cache.put(key, {**main.extraction_cache.get(key), "rule_versions": {}})
+        await main.analyze_contents(contents)
+
+    asyncio.run(analyze_twice())
+    assert len(appended) == 2
+    for thread, document in appended:
+        assert thread is not threading.main_thread()
+        assert document == hashlib.sha256(contents).hexdigest()
@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import main
+from batch_summaries import SummaryBatcher
+from llm import LLMClient
+from summary_cache import SummaryCache
+
+KINDS = ("Rate Error", "Calculation Error", "Usage Spike")
+
+
+def bill_anomalies(i):
+    # One issue per bill, with a type only that bill has
+    kind = KINDS[i % len(KINDS)]
+    return [{"type": f"{kind} {i}", "severity": "high", "detail": f"bill {i}", "impact": "$1.00"}]
+
+
+def stub_summary(i):
+    return f"Stub summary of 1 issue(s): {bill_anomalies(i)[0]['type']}."
+
+
+def run_bills(stub_url, monkeypatch, count, llm_options=None, **batcher_options):
+    # Summarizes `count` bills concurrently through main.get_ai_summary, as a
+    # batch upload does; returns (summaries, batcher, elapsed seconds)
+    llm = LLMClient(api_key="stub", base_url=stub_url, backoff=0.01, **(llm_options or {}))
+    batcher = SummaryBatcher(llm, **batcher_options)
+    monkeypatch.setattr(main, "llm_client", llm)
+    monkeypatch.setattr(main, "summary_batcher", batcher)
+    monkeypatch.setattr(main, "summary_cache", SummaryCache())
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(main.get_ai_summary({}, bill_anomalies(i), batched=True)
+                                          for i in range(count)))
+        finally:
+            await llm.close()
+
+    start = time.perf_counter()
+    summaries = asyncio.run(scenario())
+    return summaries, batcher, time.perf_counter() - start
+
+
+def test_full_batch_is_sent_without_lingering(stub, stub_url, monkeypatch):
+    summaries, batcher, elapsed = run_bills(stub_url, monkeypatch, 6, max_bills=3, linger=10)
+    assert summaries == [stub_summary(i) for i in range(6)]
+    assert batcher.stats()["batches"] == 2 and stub.counts["requests"] == 2
+    assert elapsed < 5
+
+
+def test_token_budget_splits_batches(stub, stub_url, monkeypatch):
+    # Each bill's text is ~10 tokens, so a 30-token budget fits two
+    summaries, batcher, _ = run_bills(stub_url, monkeypatch, 6, max_bills=20, max_tokens=30, linger=0.05)
+    assert summaries == [stub_summary(i) for i in range(6)]
+    assert batcher.stats()["batches"] == 3 and batcher.stats()["mean_batch_size"] == 2
+
+
+def test_partial_batch_is_sent_after_linger(stub, stub_url, monkeypatch):
+    summaries, batcher, elapsed = run_bills(stub_url, monkeypatch, 2, max_bills=20, linger=0.3)
+    assert summaries == [stub_summary(i) for i in range(2)]
+    assert batcher.stats()["batches"] == 1
+    assert elapsed >= 0.3
+
+
+def test_bills_missing_from_the_answer_are_asked_for_alone(stub, stub_url, monkeypatch):
+    stub.DROP_RATE = 1.0
+    summaries, batcher, _ = run_bills(stub_url, monkeypatch, 4, max_bills=4, linger=10)
+    assert summaries == [stub_summary(i) for i in range(4)]
+    assert batcher.stats()["parse_failures"] == 4
+    # One batched call, then one call per bill
+    assert stub.counts["requests"] == 5
+
+
+def test_failed_batch_falls_back_for_its_own_bills_only(stub, stub_url, monkeypatch):
+    # Calls are made one at a time, so the first batch (bills 0 and 1) is the
+    # one the stub fails
+    stub.FAIL_FIRST = 1
+    summaries, batcher, _ = run_bills(stub_url, monkeypatch, 4, llm_options={"max_retries": 0, "max_concurrency": 1},
+                                      max_bills=2, linger=10)
+    for i in (0, 1):
+        assert summaries[i] == main.rule_based_summary(f"- {bill_anomalies(i)[0]['type']}: bill {i}")
+    assert summaries[2:] == [stub_summary(2), stub_summary(3)]
+    assert batcher.stats()["failed_batches"] == 1
@@ -0,0 +1,35 @@
+import io
+import zipfile
+
+import pytest
+
+from main import BatchTooLarge, expand_uploads
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, contents in members.items():
+            archive.writestr(name, contents)
+    return buffer.getvalue()
+
+
+def test_expands_pdf_members():
+    archive = make_zip({"a.pdf": b"%PDF-a", "notes.txt": b"x", "__MACOSX/._a.pdf": b"x"})
+    files = expand_uploads([("bills.zip", archive), ("b.pdf", b"%PDF-b")])
+    assert files == [("bills.zip/a.pdf", b"%PDF-a", None), ("b.pdf", b"%PDF-b", None)]
+
+
+def test_rejects_oversized_archive_before_inflating(monkeypatch):
+    archive = make_zip({"bomb.pdf": b"\0" * (4 * 1024 * 1024)})
+    assert len(archive) < 64 * 1024
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda *args: pytest.fail("member was inflated"))
+    with pytest.raises(BatchTooLarge):
+        expand_uploads([("bomb.zip", archive)], max_bytes=1024 * 1024)
+
+
+def test_rejects_too_many_members_before_inflating(monkeypatch):
+    archive = make_zip({f"{i}.pdf": b"%PDF" for i in range(5)})
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda *args: pytest.fail("member was inflated"))
+    with pytest.raises(BatchTooLarge):
+        expand_uploads([("many.zip", archive)], max_files=4)
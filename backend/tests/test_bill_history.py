@@ -0,0 +1,66 @@
+import os
+
+from bill_history import DEFAULT_HISTORY_PATH, BillHistory
+
+
+def test_baseline_only_uses_earlier_readings(tmp_path):
+    history = BillHistory(str(tmp_path / "history.db"))
+    for date, usage in [("Jan 01, 2023", 400), ("Feb 01, 2023", 500), ("Jan 01, 2024", 600),
+                        ("Feb 01, 2024", 5000), ("Mar 01, 2024", 9000)]:
+        history.record({"account_number": "A", "bill_date": date, "usage_kwh": usage})
+
+    # Recorded last, but dated before the later spikes
+    baseline = history.baseline({"account_number": "A", "bill_date": "Feb 01, 2024"})
+    assert baseline["history_bills"] == 3
+    assert baseline["history_mean_kwh"] == 500
+    assert baseline["history_std_kwh"] == 100
+    assert (baseline["season_bills"], baseline["season_mean_kwh"]) == (1, 500)
+
+    assert history.baseline({"account_number": "A", "bill_date": "Jan 01, 2023"})["history_bills"] == 0
+    assert history.baseline({"account_number": "A", "bill_date": "not a date"})["history_bills"] == 0
+    history.close()
+
+
+def test_default_path_does_not_depend_on_the_working_directory():
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert DEFAULT_HISTORY_PATH == os.path.join(backend, "cache", "history.db")
+
+
+def readings():
+    return [("Jan 01, 2023", 400), ("Feb 01, 2023", 500), ("Jan 01, 2024", 600), ("Feb 01, 2024", 800)]
+
+
+def test_latest_bill_baseline_comes_from_running_stats(tmp_path):
+    history = BillHistory(str(tmp_path / "history.db"))
+    for date, usage in readings():
+        history.record({"account_number": "A", "bill_date": date, "usage_kwh": usage})
+
+    statements = []
+    history._db.set_trace_callback(statements.append)
+    # This month's bill, and a re-upload of the newest recorded one
+    upcoming = history.baseline({"account_number": "A", "bill_date": "Jan 01, 2025"})
+    reupload = history.baseline({"account_number": "A", "bill_date": "Feb 01, 2024"})
+    history._db.set_trace_callback(None)
+    assert not [sql for sql in statements if "FROM bills" in sql]
+
+    assert (upcoming["history_bills"], upcoming["history_mean_kwh"]) == (4, 575)
+    assert (upcoming["season_bills"], upcoming["season_mean_kwh"]) == (2, 500)
+    assert (reupload["history_bills"], reupload["history_mean_kwh"]) == (3, 500)
+    assert (reupload["season_bills"], reupload["season_mean_kwh"]) == (1, 500)
+    assert reupload["history_std_kwh"] == 100
+    history.close()
+
+
+def test_history_without_latest_columns_is_migrated(tmp_path):
+    path = str(tmp_path / "history.db")
+    history = BillHistory(path)
+    for date, usage in readings():
+        history.record({"account_number": "A", "bill_date": date, "usage_kwh": usage})
+    history._db.execute("ALTER TABLE usage_stats DROP COLUMN latest_date")
+    history._db.execute("ALTER TABLE usage_stats DROP COLUMN latest_kwh")
+    history.close()
+
+    history = BillHistory(path)
+    baseline = history.baseline({"account_number": "A", "bill_date": "Feb 01, 2024"})
+    assert (baseline["history_bills"], baseline["season_bills"]) == (3, 1)
+    history.close()
@@ -0,0 +1,192 @@
+import asyncio
+import random
+
+import pytest
+
+from combined_report import (
+    SUMMARY_MAX_CHARS, CombinedReportBuilder, chunk_bills, format_aggregates, parse_bill_date,
+    portfolio_aggregates,
+)
+
+
+def portfolio(count, accounts=12, seed=4):
+    rng = random.Random(seed)
+    results = []
+    for i in range(count):
+        anomalies = [
+            {"type": rng.choice(["Usage Spike", "Rate Mismatch", "Math Error"]),
+             "severity": rng.choice(["critical", "high", "medium"]),
+             "detail": f"Detail {i}", "impact": f"${rng.uniform(1, 90):.2f}"}
+            for _ in range(rng.choice([0, 0, 1, 2]))
+        ]
+        results.append({
+            "filename": f"bill_{i}.pdf",
+            "data": {"account_number": f"ACCT-{rng.randrange(accounts):03d}",
+                     "bill_date": f"{rng.choice(['Jan', 'Apr', 'Jul', 'Oct'])} 01, {rng.randint(2019, 2024)}",
+                     "total_amount": round(rng.uniform(40, 900), 2), "usage_kwh": rng.randint(100, 3000)},
+            "anomalies": anomalies,
+        })
+    return results
+
+
+def legacy_prompt(results):
+    # The combined report prompt as it was built before map-reduce
+    context = f"""
+You are a senior utility billing analyst. Generate a comprehensive, executive-level audit report for a company analyzing {len(results)} utility bills.
+
+**Company Overview:**
+- Total Bills Analyzed: {len(results)}
+- Total Issues Found: {sum(len(r.get('anomalies', [])) for r in results)}
+
+**Individual Bill Summaries:**
+"""
+    total_amount = 0
+    total_usage = 0
+    all_anomalies = []
+    for i, result in enumerate(results, 1):
+        bill_data = result.get('data', {})
+        anomalies = result.get('anomalies', [])
+        filename = result.get('filename', f'Bill {i}')
+        total_amount += bill_data.get('total_amount', 0)
+        total_usage += bill_data.get('usage_kwh', 0)
+        all_anomalies.extend(anomalies)
+        context += f"\n### Bill {i}: {filename}\n"
+        context += f"- Account: {bill_data.get('account_number', 'N/A')}\n"
+        context += f"- Date: {bill_data.get('bill_date', 'N/A')}\n"
+        context += f"- Amount: ${bill_data.get('total_amount', 0):.2f}\n"
+        context += f"- Usage: {bill_data.get('usage_kwh', 0)} kWh\n"
+        if anomalies:
+            context += f"- **Issues ({len(anomalies)}):**\n"
+            for anomaly in anomalies:
+                context += f"  - {anomaly['type']}: {anomaly['detail']} ({anomaly['impact']})\n"
+        else:
+            context += "- Status: ✓ Verified\n"
+    context += f"""
+
+**Aggregate Metrics:**
+- Total Amount Across All Bills: ${total_amount:.2f}
+- Total Usage: {total_usage} kWh
+- Average Rate: ${(total_amount / max(1, total_usage)):.3f}/kWh
+- Critical Issues: {sum(1 for a in all_anomalies if a.get('severity') == 'critical')}
+- High Priority Issues: {sum(1 for a in all_anomalies if a.get('severity') == 'high')}
+
+**Generate a comprehensive executive report with the following sections:**
+
+1. **Executive Summary** (3-4 sentences highlighting key findings)
+2. **Portfolio Overview** (aggregate metrics and trends)
+3. **Critical Findings** (detailed analysis of all issues found)
+4. **Financial Impact Analysis** (total overcharges, discrepancies, potential savings)
+5. **Bill-by-Bill Breakdown** (summary of each bill's status)
+6. **Recommended Actions** (prioritized action items with owners and deadlines)
+7. **Risk Assessment** (potential ongoing issues and monitoring recommendations)
+
+Format the report professionally with clear headings, bullet points, and actionable insights suitable for executive review.
+"""
+    return context
+
+
+class RecordingModel:
+    def __init__(self, reply="- finding"):
+        self.prompts = []
+        self.reply = reply
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        await asyncio.sleep(0)
+        return self.reply
+
+
+@pytest.mark.parametrize("count", [1, 7, 50])
+def test_single_mode_sends_the_legacy_prompt(count):
+    results = portfolio(count)
+    model = RecordingModel("The report")
+    report, stats = asyncio.run(CombinedReportBuilder().build(results, model))
+    assert stats["mode"] == "single" and stats["llm_calls"] == 1
+    assert model.prompts == [legacy_prompt(results)]
+    assert report == "The report"
+
+
+def test_chunks_respect_limits_and_keep_accounts_together():
+    results = portfolio(300, accounts=20)
+    chunks = chunk_bills(results, max_chars=3000, max_bills=25)
+    assert sorted(id(result) for chunk in chunks for _, _, result in chunk) == sorted(map(id, results))
+    for chunk in chunks:
+        assert len(chunk) <= 25
+        assert sum(len(line) + 1 for _, line, _ in chunk) <= 3000
+        # Oldest first within each account
+        for account in {account for account, _, _ in chunk}:
+            dates = [parse_bill_date(r["data"]["bill_date"]) for a, _, r in chunk if a == account]
+            assert dates == sorted(dates)
+
+    # An account is split only when it can't fit in one chunk on its own
+    sizes = {}
+    for result in results:
+        sizes[result["data"]["account_number"]] = sizes.get(result["data"]["account_number"], 0) + 1
+    spans = {}
+    for number, chunk in enumerate(chunks):
+        for account, _, _ in chunk:
+            spans.setdefault(account, set()).add(number)
+    for account, numbers in spans.items():
+        if sizes[account] <= 25:
+            assert len(numbers) == 1, account
+        else:
+            assert numbers == set(range(min(numbers), max(numbers) + 1)), account
+
+
+def test_oversized_account_is_split_into_date_ranges():
+    results = portfolio(60, accounts=1)
+    chunks = chunk_bills(results, max_chars=100000, max_bills=10)
+    assert [len(chunk) for chunk in chunks] == [10] * 6
+    dates = [parse_bill_date(result["data"]["bill_date"]) for chunk in chunks for _, _, result in chunk]
+    assert dates == sorted(dates)
+
+
+@pytest.mark.parametrize("chunks, fanout, rounds, reduce_calls", [
+    (5, 8, 0, 0),
+    (8, 8, 0, 0),
+    (9, 8, 1, 2),
+    (20, 4, 2, 5 + 2),
+    (27, 3, 2, 9 + 3),
+])
+def test_reduce_rounds_follow_fanout(chunks, fanout, rounds, reduce_calls):
+    results = portfolio(chunks * 5)
+    for i, result in enumerate(results):
+        # One bill per account, so each chunk holds exactly five bills
+        result["data"]["account_number"] = f"ACCT-{i:03d}"
+    builder = CombinedReportBuilder(mode="mapreduce", max_chunk_bills=5, fanout=fanout)
+    model = RecordingModel()
+    stages = []
+
+    async def progress(stage):
+        stages.append(stage)
+
+    _, stats = asyncio.run(builder.build(results, model, progress))
+    assert stats["chunks"] == chunks
+    assert stats["reduce_rounds"] == rounds
+    assert stats["llm_calls"] == chunks + reduce_calls + 1
+    assert sum(stage.startswith("reduce round") for stage in stages) == rounds
+    assert stages[-1] == "llm" and f"map {chunks}/{chunks}" in stages
+
+
+def test_computed_aggregates_appear_verbatim():
+    results = portfolio(400)
+    # A runaway model answer is truncated before it is fed forward
+    model = RecordingModel("x" * (SUMMARY_MAX_CHARS * 3))
+    builder = CombinedReportBuilder(single_max_bills=50, chunk_chars=4000, fanout=4)
+    report, stats = asyncio.run(builder.build(results, model))
+    assert stats["mode"] == "mapreduce"
+
+    agg = portfolio_aggregates(results)
+    assert stats["aggregates"] == agg
+    assert agg["total_amount"] == round(sum(r["data"]["total_amount"] for r in results), 2)
+    assert agg["total_issues"] == sum(len(r["anomalies"]) for r in results)
+    block = format_aggregates(agg)
+    assert f"- Total Amount Across All Bills: ${agg['total_amount']:.2f}" in block
+    assert report.startswith(f"**Portfolio Metrics**\n{block}\n\n")
+    assert block in model.prompts[-1]
+    assert all(len(prompt) < 4000 + (builder.fanout + 1) * SUMMARY_MAX_CHARS for prompt in model.prompts)
+
+    # Each map prompt quotes the figures of its own chunk
+    for chunk in chunk_bills(results, builder.chunk_chars, builder.max_chunk_bills):
+        expected = format_aggregates(portfolio_aggregates([result for _, _, result in chunk]))
+        assert any(expected in prompt for prompt in model.prompts)
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from bill_history import BASELINE_FIELDS, BillHistory
+from detection import AnomalyDetector, to_columns
+
+
+def portfolio(count=120, seed=7):
+    # Three accounts with monthly bills; some spikes, wrong rates and totals
+    rng = random.Random(seed)
+    bills = []
+    for i in range(count):
+        usage = rng.choice([rng.randint(300, 700), rng.randint(900, 2000)])
+        tier1_usage = min(usage, 500)
+        tier1_rate = rng.choice([0.13, 0.13, 0.13, 0.16])
+        tier1_cost = round(tier1_usage * tier1_rate, 2)
+        components = round(12.5 + tier1_cost + max(0, usage - 500) * 0.15, 2)
+        bills.append({
+            "account_number": f"0000-0000-000{i % 3}",
+            "bill_date": f"{['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'][i // 3 % 6]} 01, {2020 + i // 18}",
+            "usage_kwh": usage,
+            "tier1_rate": tier1_rate,
+            "tier1_usage": tier1_usage,
+            "tier1_cost": tier1_cost,
+            "components_sum": components,
+            "total_amount": round(components + rng.choice([0, 0, 0, 25.0]), 2),
+        })
+    return bills
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = BillHistory(str(tmp_path / "history.db"))
+    for bill in portfolio():
+        history.record(bill)
+    yield history
+    history.close()
+
+
+def as_inputs(bills, detector):
+    pd = pytest.importorskip("pandas")
+    # Extracted fields only; baselines are the detector's to look up
+    names = sorted((set(detector.engine.inputs) - set(BASELINE_FIELDS)) | {"account_number", "bill_date"})
+    columns = {name: [bill.get(name, 0) for bill in bills] for name in names}
+    return {"list": bills, "dict": columns, "dataframe": pd.DataFrame(columns)}
+
+
+@pytest.mark.parametrize("with_history", [False, True])
+def test_detect_batch_matches_detect(with_history, request):
+    detector = AnomalyDetector(history=request.getfixturevalue("history") if with_history else None)
+    bills = portfolio()
+    expected = [detector.detect(bill) for bill in bills]
+    assert any(anomalies for anomalies, _ in expected)
+    for kind, table in as_inputs(bills, detector).items():
+        anomalies, severities = detector.detect_batch(table)
+        assert list(zip(anomalies, severities)) == expected, kind
+
+
+def test_detect_batch_accepts_empty_input(history):
+    for detector in (AnomalyDetector(), AnomalyDetector(history=history)):
+        assert detector.detect_batch([]) == ([], [])
+        assert detector.detect_batch({}) == ([], [])
+        assert detector.detect_batch(to_columns([], detector.engine.inputs)) == ([], [])
@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("reportlab")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import pdfplumber
+
+from generate_bills import create_bill, random_bills
+from extraction import _section_headings, extract_bill, extract_fields
+
+
+@pytest.fixture(scope="module")
+def bills(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("bills"))
+    paths = [create_bill(bill, output_dir=root) for bill in random_bills(6, seed=5)]
+    return [open(path, "rb").read() for path in paths]
+
+
+def test_layout_mode_matches_text_mode(bills):
+    for contents in bills:
+        assert extract_bill(contents, "layout")[0] == extract_bill(contents, "text")[0]
+
+
+def test_layout_mode_skips_line_grouping_on_pages_without_headings(bills, monkeypatch):
+    grouped = []
+    original = pdfplumber.page.Page.filter
+
+    def counting_filter(page, test_function):
+        grouped.append(page.page_number)
+        return original(page, test_function)
+
+    monkeypatch.setattr(pdfplumber.page.Page, "filter", counting_filter)
+    without_headings = 0
+    for contents in bills:
+        with pdfplumber.open(io.BytesIO(contents)) as pdf:
+            for page in pdf.pages:
+                grouped.clear()
+                if not _section_headings(page):
+                    without_headings += 1
+                    assert not grouped
+    assert without_headings
+
+
+def test_single_tier_bill_stops_before_its_inserts(tmp_path):
+    bill = next(bill for bill in random_bills(30, seed=0, layouts=["multi_page"])
+                if not any("Tier 2" in row[0] for row in bill["charges"]))
+    with open(create_bill(bill, output_dir=str(tmp_path)), "rb") as f:
+        contents = f.read()
+    for mode in ("text", "layout"):
+        data, stats = extract_bill(contents, mode)
+        assert "tier2_usage" not in data and "taxes" in data
+        assert stats["pages_parsed"] < stats["page_count"], mode
+
+
+def test_text_mode_rows_do_not_borrow_the_next_line():
+    text = ("Customer Charge\n"
+            "Energy Charge - Tier 1 (First 500 kWh) $0.13 500 kWh $65.00\n"
+            "Taxes $4.10")
+    data = extract_fields(text)
+    assert "customer_charge" not in data
+    assert (data["tier1_rate"], data["tier1_usage"], data["tier1_cost"], data["taxes"]) == (0.13, 500, 65.0, 4.1)
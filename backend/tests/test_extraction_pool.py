@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from extraction_pool import ExtractionPool, PoolBusy, PoolTimeout
+
+
+def sleep_then(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def test_timed_out_job_frees_its_worker_and_slot():
+    pool = ExtractionPool(workers=1, queue_size=0, timeout=0.5)
+
+    async def scenario():
+        first = await pool.run(worker_pid)
+        with pytest.raises(PoolTimeout):
+            await pool.run(sleep_then, 60, None)
+        assert pool.pending == 0
+        # With one worker and no queue, a leaked slot would make this PoolBusy
+        assert await pool.run(sleep_then, 0, "ok") == "ok"
+        return first
+
+    try:
+        hung_pid = asyncio.run(scenario())
+        assert pool.recycled == 1
+        time.sleep(0.2)
+        with pytest.raises(ProcessLookupError):
+            os.kill(hung_pid, 0)
+    finally:
+        pool.shutdown()
+
+
+def test_jobs_sharing_a_recycled_pool_are_resubmitted():
+    pool = ExtractionPool(workers=2, timeout=1.0)
+
+    async def other():
+        # Still running when the hung job's pool is killed at t=1s
+        await asyncio.sleep(0.8)
+        return await pool.run(sleep_then, 0.4, "done")
+
+    async def scenario():
+        return await asyncio.gather(pool.run(sleep_then, 60, None), other(), return_exceptions=True)
+
+    try:
+        hung, result = asyncio.run(scenario())
+        assert isinstance(hung, PoolTimeout)
+        assert result == "done"
+        assert pool.recycled == 1
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+def test_process_pool_still_exposes_its_workers():
+    # _recycle(kill=True) relies on this private attribute; a Python upgrade
+    # that drops it fails here instead of leaking hung workers
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        pid = executor.submit(worker_pid).result()
+        assert isinstance(executor._processes, dict)
+        [process] = executor._processes.values()
+        assert isinstance(process, multiprocessing.process.BaseProcess) and process.pid == pid
+    finally:
+        executor.shutdown()
+
+
+def test_killing_a_pool_without_worker_handles_is_reported(capsys):
+    pool = ExtractionPool(workers=1)
+
+    class Executor:
+        def shutdown(self, wait=True):
+            self.shut_down = True
+
+    executor = Executor()
+    pool._recycle(executor, kill=True)
+    assert executor.shut_down and executor.killed
+    assert "Cannot terminate hung extraction worker" in capsys.readouterr().out
+
+
+def test_broken_pool_at_submit_is_busy_and_replaced():
+    pool = ExtractionPool(workers=1)
+
+    class BrokenExecutor:
+        def submit(self, fn, *args):
+            raise BrokenProcessPool("A child process terminated abruptly")
+
+        def shutdown(self, wait=True):
+            pass
+
+    pool._executor = BrokenExecutor()
+    try:
+        with pytest.raises(PoolBusy):
+            asyncio.run(pool.run(worker_pid))
+        assert (pool.recycled, pool.pending) == (1, 0)
+        assert asyncio.run(pool.run(sleep_then, 0, "ok")) == "ok"
+    finally:
+        pool.shutdown()
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("reportlab")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from generate_bills import create_bill, random_bills
+from bill_history import BillHistory
+from ingest import SQLiteSink, list_directory, run
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("bills"))
+    for bill in random_bills(6, seed=11):
+        create_bill(bill, output_dir=root)
+    return root
+
+
+class RecordingSink(SQLiteSink):
+    def __init__(self, path, events):
+        super().__init__(path)
+        self.events = events
+        self.written = []
+
+    def write(self, record):
+        super().write(record)
+        self.written.append(record["sha256"])
+
+    def commit(self):
+        super().commit()
+        self.events.append(("commit", list(self.written)))
+
+
+class RecordingAuditStore:
+    def __init__(self, events):
+        self.events = events
+
+    def append(self, data, anomalies, severity, document=None):
+        self.events.append(("append", document))
+
+    def close(self):
+        pass
+
+
+def test_audit_store_only_sees_committed_results(corpus, tmp_path):
+    events = []
+    sink = RecordingSink(str(tmp_path / "results.db"), events)
+    run(corpus, list_directory(corpus), sink, 1, "text", 4, RecordingAuditStore(events))
+
+    committed = set()
+    appended = []
+    for kind, value in events:
+        if kind == "commit":
+            committed.update(value)
+        else:
+            assert value in committed
+            appended.append(value)
+    assert len(appended) == 6
+
+
+def test_history_records_ingested_bills(corpus, tmp_path):
+    history = BillHistory(str(tmp_path / "history.db"))
+    run(corpus, list_directory(corpus), SQLiteSink(str(tmp_path / "results.db")), 1, "text", 100, None, history)
+    history = BillHistory(str(tmp_path / "history.db"))
+    assert history.stats()["bills"] == 6
+    history.close()
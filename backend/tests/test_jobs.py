@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import jobs
+from jobs import JobRunner, MemoryJobQueue, SQLiteJobQueue, job_queue_from_env
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path):
+    queue = MemoryJobQueue() if request.param == "memory" else SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    queue.close()
+
+
+def test_job_interrupted_by_shutdown_runs_on_the_next_runner(queue):
+    started = []
+
+    async def scenario():
+        first = JobRunner(queue, workers=1, poll_interval=0.05)
+
+        @first.handler("slow")
+        async def slow(payload, progress):
+            started.append(payload)
+            await asyncio.sleep(60)
+
+        job = await first.submit("slow", {})
+        for _ in range(100):
+            if started:
+                break
+            await asyncio.sleep(0.01)
+        await first.stop()
+        assert queue.get(job["id"])["status"] == "queued"
+
+        second = JobRunner(queue, workers=1, poll_interval=0.05)
+
+        @second.handler("slow")
+        async def quick(payload, progress):
+            return "done"
+
+        second.start()
+        for _ in range(100):
+            if queue.get(job["id"])["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.02)
+        await second.stop()
+        return queue.get(job["id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "succeeded"
+    assert job["result"] == "done"
+
+
+def test_running_job_with_a_live_lease_is_not_requeued(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    ours, theirs = SQLiteJobQueue(path), SQLiteJobQueue(path)
+    job = ours.submit("report", {})
+    assert ours.claim("a")["id"] == job["id"]
+
+    # Started long ago but still heartbeating: left alone
+    ours.update(job["id"], started_at=time.time() - 3600)
+    ours.heartbeat([job["id"]], "a")
+    assert theirs.requeue_stale(time.time() - 60) == 0
+    assert theirs.get(job["id"])["status"] == "running"
+
+    # Lease expired: requeued, and the old owner can no longer finish it
+    assert theirs.requeue_stale(time.time() + 1) == 1
+    assert theirs.claim("b")["id"] == job["id"]
+    ours.update(job["id"], owner="a", status="failed", error="late")
+    ours.heartbeat([job["id"]], "a")
+    assert theirs.requeue_stale(time.time() - 60) == 0
+    assert theirs.get(job["id"])["status"] == "running"
+    ours.close()
+    theirs.close()
+
+
+def test_sqlite_store_default_does_not_depend_on_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("JOB_BACKEND", "sqlite")
+    monkeypatch.delenv("JOB_STORE_PATH", raising=False)
+    monkeypatch.setitem(jobs.QUEUE_BACKENDS, "sqlite", lambda path: path)
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert job_queue_from_env() == os.path.join(backend, "cache", "jobs.db")
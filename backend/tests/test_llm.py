@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+import main
+from llm import LLMClient, LLMUnavailable
+from summary_cache import SummaryCache
+
+
+def client(stub_url, **options):
+    return LLMClient(api_key="stub", base_url=stub_url, backoff=0.01, **options)
+
+
+def test_overloaded_answer_is_retried(stub, stub_url):
+    stub.FAIL_FIRST = 1
+    llm = client(stub_url, max_retries=2)
+
+    async def scenario():
+        try:
+            return await llm.complete("Summarize these billing issues in 2 sentences:\n- Rate Error: x")
+        finally:
+            await llm.close()
+
+    assert asyncio.run(scenario()) == "Stub summary of 1 issue(s): Rate Error."
+    assert stub.counts["requests"] == 2 and stub.counts["failed"] == 1
+    assert llm.stats()["retries"] == 1 and llm.stats()["succeeded"] == 1
+
+
+def test_exhausted_retries_fall_back_to_rule_based_text(stub, stub_url, monkeypatch):
+    stub.FAILURE_RATE = 1.0
+    llm = client(stub_url, max_retries=2)
+    monkeypatch.setattr(main, "llm_client", llm)
+    monkeypatch.setattr(main, "summary_cache", SummaryCache())
+    anomalies = [{"type": "Rate Error", "severity": "critical", "detail": "Tier 1 at $0.16", "impact": "$15.00"}]
+
+    async def scenario():
+        try:
+            return await main.get_ai_summary({}, anomalies)
+        finally:
+            await llm.close()
+
+    assert asyncio.run(scenario()) == main.rule_based_summary("- Rate Error: Tier 1 at $0.16")
+    assert stub.counts["requests"] == 3
+    assert llm.stats()["failed"] == 1
+
+
+def test_slow_answer_times_out(stub, stub_url):
+    stub.LATENCY = 2.0
+    llm = client(stub_url, timeout=0.2, max_retries=0)
+
+    async def scenario():
+        try:
+            with pytest.raises(LLMUnavailable):
+                await llm.complete("Summarize")
+        finally:
+            await llm.close()
+
+    start = time.perf_counter()
+    asyncio.run(scenario())
+    assert time.perf_counter() - start < 1.5
+    assert llm.stats()["timeouts"] == 1
+
+
+def test_calls_in_flight_are_capped(stub, stub_url):
+    stub.LATENCY = 0.2
+    llm = client(stub_url, max_concurrency=2)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(llm.complete(f"- Issue {i}: x") for i in range(6)))
+        finally:
+            await llm.close()
+
+    assert len(asyncio.run(scenario())) == 6
+    assert stub.counts["requests"] == 6
+    assert stub.counts["max_in_flight"] == 2
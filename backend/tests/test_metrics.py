@@ -0,0 +1,172 @@
+import asyncio
+import json
+import re
+
+import httpx
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+import main
+from batch_summaries import SummaryBatcher
+from jobs import JobRunner, MemoryJobQueue
+from metrics import ENDPOINT, Counter, Histogram, MetricsMiddleware
+
+
+METRIC_NAME = r"[a-zA-Z_:][a-zA-Z0-9_:]*"
+LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"'
+SAMPLE_RE = re.compile(rf'^({METRIC_NAME})(?:\{{({LABEL}(?:,{LABEL})*)\}})? (\S+)$')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    # Checks the Prometheus text format (HELP and TYPE before each family,
+    # sample names matching their family, cumulative buckets ending at +Inf
+    # with the series count) and returns {(name, labels): value}
+    assert text.endswith("\n")
+    samples = {}
+    family = kind = None
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            family, kind = line.split(" ")[2], None
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name == family and kind in ("counter", "histogram")
+            continue
+        match = SAMPLE_RE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        labels = tuple(LABEL_RE.findall(labels or ""))
+        allowed = {family} if kind == "counter" else {f"{family}_bucket", f"{family}_sum", f"{family}_count"}
+        assert name in allowed, line
+        value = float(value)
+        if name.endswith("_bucket"):
+            series = tuple(pair for pair in labels if pair[0] != "le")
+            assert value >= buckets.get(series, (0, None))[0], line
+            buckets[series] = (value, dict(labels)["le"])
+        if name.endswith("_count") and kind == "histogram":
+            assert buckets.pop(labels) == (value, "+Inf"), line
+        samples[(name, labels)] = value
+    assert not buckets
+    return samples
+
+
+def series(samples, name, **labels):
+    return {key[1]: value for key, value in samples.items()
+            if key[0] == name and set(labels.items()) <= set(key[1])}
+
+
+def request_count(client, **labels):
+    samples = parse(client.get("/metrics").text)
+    return sum(series(samples, "billguard_http_request_duration_seconds_count", **labels).values())
+
+
+def test_requests_are_labeled_with_their_route_template():
+    client = TestClient(main.app)
+    labels = {"endpoint": "/api/jobs/{job_id}", "method": "GET", "status": "404"}
+    before = request_count(client, **labels)
+    for job_id in ("a", "b", "c"):
+        assert client.get(f"/api/jobs/{job_id}").status_code == 404
+    assert request_count(client, **labels) == before + 3
+
+    unmatched = request_count(client, endpoint="unmatched")
+    assert client.get("/no/such/route").status_code == 404
+    assert request_count(client, endpoint="unmatched") == unmatched + 1
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    assert "# TYPE billguard_stage_duration_seconds histogram" in response.text
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_escaped_total", "Escaping", labels=("reason",))
+    counter.inc(reason='a "quoted"\nback\\slash')
+    samples = parse("\n".join(counter.render()) + "\n")
+    assert samples == {("test_escaped_total", (("endpoint", "background"),
+                                               ("reason", 'a \\"quoted\\"\\nback\\\\slash'))): 1.0}
+
+
+class FakeClient:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.calls = 0
+
+    async def complete(self, prompt, max_tokens=None):
+        self.calls += 1
+        self.histogram.observe(0.01, stage="llm")
+        return json.dumps({f"B{i}": f"summary {i}" for i in range(1, prompt.count("[B") + 1)})
+
+
+def probe_app(histogram, batcher):
+    async def threaded(request):
+        await run_in_threadpool(histogram.observe, 0.01, stage="thread")
+        return PlainTextResponse("ok")
+
+    async def summarize(request):
+        name = request.path_params.get("name", "first")
+        if name == "second":
+            # Join the batch the first request opened
+            while not batcher._entries:
+                await asyncio.sleep(0.001)
+        return PlainTextResponse(await batcher.summarize(f"- Issue for {name}"))
+
+    app = Starlette(routes=[Route("/threaded", threaded), Route("/summarize/first", summarize),
+                            Route("/summarize/{name}", summarize)])
+    return MetricsMiddleware(app, app.router)
+
+
+def endpoints(histogram, stage):
+    return {key[0]: series[2] for key, series in histogram._series.items() if key[1] == stage}
+
+
+def test_threadpool_and_batched_calls_keep_the_request_label():
+    histogram = Histogram("test_probe_seconds", "Probe", labels=("stage",))
+    client = FakeClient(histogram)
+    batcher = SummaryBatcher(client, max_bills=2, linger=5)
+    app = probe_app(histogram, batcher)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            assert (await http.get("/threaded")).text == "ok"
+            # The second request fills the batch; the call still belongs to the first
+            first, second = await asyncio.gather(http.get("/summarize/first"), http.get("/summarize/second"))
+            assert (first.text, second.text) == ("summary 1", "summary 2")
+            # Sent by the linger timer
+            batcher.linger = 0.01
+            assert (await http.get("/summarize/alone")).text == "summary 1"
+
+    asyncio.run(scenario())
+    assert client.calls == 2
+    assert endpoints(histogram, "thread") == {"/threaded": 1}
+    assert endpoints(histogram, "llm") == {"/summarize/first": 1, "/summarize/{name}": 1}
+
+
+def test_job_metrics_are_labeled_with_the_job_kind():
+    histogram = Histogram("test_job_seconds", "Probe", labels=("stage",))
+
+    async def scenario():
+        runner = JobRunner(MemoryJobQueue(), workers=1, poll_interval=0.01)
+
+        @runner.handler("probe")
+        async def probe(payload, progress):
+            await run_in_threadpool(histogram.observe, 0.01, stage="job")
+            return "done"
+
+        runner.start()
+        token = ENDPOINT.set("/api/submit")
+        try:
+            job = await runner.submit("probe", {})
+        finally:
+            ENDPOINT.reset(token)
+        for _ in range(200):
+            if runner.queue.get(job["id"])["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(scenario())
+    assert endpoints(histogram, "job") == {"job:probe": 1}
@@ -0,0 +1,137 @@
+import json
+import random
+import sqlite3
+
+import pytest
+
+from detection import AnomalyDetector
+from ingest import SQLiteSink
+from reaudit import reaudit
+from rules import DEFAULT_RULES_PATH, RuleEngine
+
+
+def bills(count=60, seed=3):
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        usage = rng.randint(300, 1400)
+        tier1_usage, tier2_usage = min(usage, 500), max(0, usage - 500)
+        tier1_rate = rng.choice([0.13, 0.135, 0.14])
+        tier2_rate = rng.choice([0.15, 0.15, 0.17])
+        components = round(12.5 + tier1_usage * tier1_rate + tier2_usage * tier2_rate, 2)
+        result.append({
+            "account_number": f"0000-0000-000{i % 4}",
+            "bill_date": f"Mar 01, {2000 + i}",
+            "usage_kwh": usage,
+            "tier1_rate": tier1_rate,
+            "tier1_usage": tier1_usage,
+            "tier1_cost": round(tier1_usage * tier1_rate, 2),
+            "tier2_rate": tier2_rate,
+            "tier2_usage": tier2_usage,
+            "tier2_cost": round(tier2_usage * tier2_rate, 2),
+            "components_sum": components,
+            "total_amount": round(components + rng.choice([0, 0, 0.7, 3.0]), 2),
+        })
+    return result
+
+
+def record(path, data, detector):
+    anomalies, severity = detector.detect(data)
+    return {
+        "path": path, "sha256": f"sha-{path}", "error": None, "data": data, "anomalies": anomalies,
+        "severity": severity, "extraction": {}, "versions": {"patterns": "p", "rules": detector.version,
+                                       "rule_versions": detector.rule_versions},
+    }
+
+
+@pytest.fixture
+def changed_rules(tmp_path):
+    with open(DEFAULT_RULES_PATH) as f:
+        config = json.load(f)
+    for rule in config["rules"]:
+        if rule["id"] == "tier1_rate":
+            rule["expected_rate"] = 0.14
+    config["rules"].append({"id": "tier2_rate", "type": "tariff_rate", "severity": "high", "tier": 2,
+                            "expected_rate": 0.15, "tolerance": 0.01})
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(config))
+    return AnomalyDetector(RuleEngine(str(path), reload_interval=float("inf")))
+
+
+def stored(db):
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT path, anomalies, severity, rules_version FROM audits ORDER BY path").fetchall()
+    conn.close()
+    return rows
+
+
+def test_reaudit_matches_full_detection_under_new_rules(tmp_path, changed_rules):
+    db = str(tmp_path / "results.db")
+    sink = SQLiteSink(db)
+    portfolio = bills()
+    for i, data in enumerate(portfolio):
+        sink.write(record(f"{i:03d}.pdf", data, AnomalyDetector()))
+    sink.close()
+
+    appended = []
+
+    class AuditStore:
+        def append(self, data, anomalies, severity, document=None):
+            appended.append(document)
+
+    stats = reaudit(db, changed_rules, batch=25, audit_store=AuditStore())
+    assert stats["stale"] == len(portfolio)
+    # Same document ids as ingest.py and the API record: content hashes
+    assert appended and all(document.startswith("sha-") for document in appended)
+    assert set(stats["rules_evaluated"]) == {"tier1_rate", "tier2_rate"}
+    assert stats["changed"] > 0
+    for (path, anomalies, severity, version), data in zip(stored(db), portfolio):
+        assert (json.loads(anomalies), severity) == changed_rules.detect(data), path
+        assert version == changed_rules.version
+    assert reaudit(db, changed_rules)["stale"] == 0
+
+
+def test_reaudit_batch_matches_scalar_reaudit(changed_rules):
+    detector = AnomalyDetector()
+    portfolio = bills()
+    old = [detector.detect(data)[0] for data in portfolio]
+    anomalies, severities, evaluated = changed_rules.reaudit_batch(portfolio, old, detector.rule_versions)
+    for data, before, after, severity in zip(portfolio, old, anomalies, severities):
+        expected = changed_rules.reaudit(data, before, detector.rule_versions)
+        assert (after, severity) == expected[:2]
+    assert sorted(evaluated) == ["tier1_rate", "tier2_rate"]
+
+
+def test_legacy_results_table_is_migrated(tmp_path, changed_rules):
+    db = str(tmp_path / "results.db")
+    detector = AnomalyDetector()
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE results (path TEXT PRIMARY KEY, sha256 TEXT, account_number TEXT, bill_date TEXT,"
+        " severity TEXT, anomaly_count INTEGER, error TEXT, data TEXT, anomalies TEXT, extraction TEXT,"
+        " versions TEXT, ingested_at REAL)"
+    )
+    portfolio = bills(10)
+    for i, data in enumerate(portfolio):
+        anomalies, severity = detector.detect(data)
+        for anomaly in anomalies:
+            # Results of that era carried no rule tags
+            anomaly.pop("rule")
+        versions = {"patterns": "p", "rules": detector.version, "rule_versions": detector.rule_versions}
+        conn.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?, '{}', ?, 0)", (
+            f"{i:03d}.pdf", "x", data["account_number"], data["bill_date"], severity, len(anomalies),
+            json.dumps(data), json.dumps(anomalies), json.dumps(versions),
+        ))
+    conn.execute("INSERT INTO results VALUES ('bad.pdf', 'x', NULL, NULL, NULL, 0, 'unreadable', 'null',"
+                 " 'null', 'null', 'null', 0)")
+    conn.commit()
+    conn.close()
+
+    sink = SQLiteSink(db)
+    assert all(sink.done(f"{i:03d}.pdf") for i in range(10)) and sink.done("bad.pdf")
+    sink.close()
+    assert len(stored(db)) == 10
+
+    reaudit(db, changed_rules)
+    for (path, anomalies, severity, _), data in zip(stored(db), portfolio):
+        assert (json.loads(anomalies), severity) == changed_rules.detect(data), path
@@ -0,0 +1,104 @@
+import io
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+import pdfplumber
+from reportlab.platypus import HRFlowable, Paragraph, Preformatted, Table
+
+from report_rendering import inline_markup, markdown_to_flowables, render_many, render_report_pdf
+
+
+REPORT = """# Audit Report
+**Executive Summary**
+
+Usage < 500 kWh & rate > $0.14/kWh on **2 bills**,
+with *one* `tier2_rate` mismatch.
+
+1. Review charges
+   - Tier 1 & Tier 2
+     * nested <deeper> item
+   - Taxes
+2. Contact the utility
+   continued on a wrapped line
+5. Escalate
+
+| Account | Issue | Impact |
+|---------|:-----:|-------:|
+| 1234 & 5678 | Rate < expected | $12.00 |
+| 9999 | Spike |
+
+---
+
+```
+total = tier1 + tier2 < 100 & taxes
+  <indented>
+```
+"""
+
+
+def text_of(pdf_bytes):
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return "\n".join(page.extract_text() or "" for page in pdf.pages)
+
+
+def test_inline_markup_escapes_before_formatting():
+    assert inline_markup("a < b & c > d") == "a &lt; b &amp; c &gt; d"
+    assert inline_markup("**<bold>** and *it* and `x<y`") == (
+        '<b>&lt;bold&gt;</b> and <i>it</i> and <font face="Courier">x&lt;y</font>'
+    )
+    # Arithmetic asterisks are not italics
+    assert inline_markup("2 * 3 * 4") == "2 * 3 * 4"
+
+
+def test_blocks_become_the_right_flowables():
+    flowables = markdown_to_flowables(REPORT)
+    paragraphs = [f for f in flowables if isinstance(f, Paragraph)]
+    headings = [p.text for p in paragraphs if p.style.name.startswith("Heading")]
+    assert headings == ["Audit Report", "Executive Summary"]
+
+    # Consecutive body lines join into one paragraph
+    body = [p for p in paragraphs if p.style.name == "BodyText"]
+    assert len(body) == 1 and "&lt; 500 kWh &amp; rate" in body[0].text and "<i>one</i>" in body[0].text
+
+    items = [(p.style.leftIndent, p.bulletText, p.text) for p in paragraphs if p.bulletText]
+    assert items == [
+        (18, "1.", "Review charges"),
+        (36, "•", "Tier 1 &amp; Tier 2"),
+        (54, "•", "nested &lt;deeper&gt; item"),
+        (36, "•", "Taxes"),
+        (18, "2.", "Contact the utility continued on a wrapped line"),
+        (18, "3.", "Escalate"),
+    ]
+
+    [table] = [f for f in flowables if isinstance(f, Table)]
+    cells = [[cell.text for cell in row] for row in table._cellvalues]
+    assert cells == [["Account", "Issue", "Impact"],
+                     ["1234 &amp; 5678", "Rate &lt; expected", "$12.00"],
+                     ["9999", "Spike", ""]]
+    assert sum(isinstance(f, HRFlowable) for f in flowables) == 1
+
+    [code] = [f for f in flowables if isinstance(f, Preformatted)]
+    assert code.lines == ["total = tier1 + tier2 < 100 & taxes", "  <indented>"]
+
+
+@pytest.mark.parametrize("template", ["combined", "bill"])
+def test_awkward_markdown_renders_to_pdf(template):
+    pdf = render_report_pdf(REPORT, template)
+    assert pdf.startswith(b"%PDF")
+    text = text_of(pdf)
+    assert "Usage < 500 kWh & rate > $0.14/kWh" in text
+    assert "nested <deeper> item" in text
+    assert "1234 & 5678" in text and "<indented>" in text
+
+
+def test_unterminated_blocks_and_stray_markup_render():
+    pdf = render_report_pdf("**unclosed bold < &\n\n```\nno closing fence <\n| a | b |\n|---|---|")
+    assert "no closing fence <" in text_of(pdf)
+
+
+def test_render_many_keeps_order():
+    reports = [f"# Report {i}\n\nBody {i} & more" for i in range(3)]
+    pdfs = render_many(reports, workers=2)
+    assert [f"Report {i}" in text_of(pdf) for i, pdf in enumerate(pdfs)] == [True] * 3
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import build_report_context, report_cache_key
+from summary_cache import SummaryCache
+
+
+BILL = {"account_number": "1234-5678-9012", "bill_date": "Oct 01, 2024", "total_amount": 1234.56,
+        "usage_kwh": 1540}
+ANOMALIES = [{"type": "Usage Spike", "severity": "high", "detail": "Usage of 1540 kWh", "impact": "$156.00"}]
+
+
+def report_key(bill):
+    return report_cache_key(build_report_context(bill, ANOMALIES, "bill.pdf"))
+
+
+def test_corrected_reissue_gets_its_own_report():
+    assert report_key(BILL) == report_key(dict(BILL))
+    assert report_key(BILL) != report_key({**BILL, "total_amount": 1210.00})
+    assert report_key(BILL) != report_key({**BILL, "usage_kwh": 1510})
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    # Stands in for genai.GenerativeModel: streams `parts`, raising `error`
+    # after them if set
+    parts = ["## Executive Summary\n", "", "Usage spiked ", "in October."]
+    error = None
+    calls = []
+
+    def __init__(self, name):
+        pass
+
+    def generate_content(self, context, stream=False):
+        FakeModel.calls.append(stream)
+        if not stream:
+            return FakeChunk("".join(self.parts))
+        return self.chunks()
+
+    def chunks(self):
+        for part in self.parts:
+            yield FakeChunk(part)
+        if self.error:
+            raise self.error
+
+
+def sse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(main.genai, "GenerativeModel", FakeModel)
+    monkeypatch.setattr(main, "summary_cache", SummaryCache())
+    monkeypatch.setattr(FakeModel, "calls", [])
+    return TestClient(main.app)
+
+
+REQUEST = {"bill_data": BILL, "anomalies": ANOMALIES, "filename": "bill.pdf"}
+
+
+def test_streamed_report_is_cached_for_both_endpoints(gemini):
+    events = sse_events(gemini.post("/api/generate-report/stream", json=REQUEST).text)
+    # Empty chunks are skipped
+    assert [event for event, _ in events] == ["chunk", "chunk", "chunk", "done"]
+    assert "".join(payload["text"] for _, payload in events[:-1]) == "".join(FakeModel.parts)
+    done = events[-1][1]
+    assert (done["cached"], done["chunks"]) == (False, 3)
+    assert done["ttft_ms"] <= done["total_ms"]
+
+    again = sse_events(gemini.post("/api/generate-report/stream", json=REQUEST).text)
+    assert again[0] == ("chunk", {"text": "".join(FakeModel.parts)})
+    assert again[1][0] == "done" and (again[1][1]["cached"], again[1][1]["chunks"]) == (True, 1)
+
+    response = gemini.post("/api/generate-report", json=REQUEST).json()
+    assert (response["report"], response["cached"]) == ("".join(FakeModel.parts), True)
+    assert FakeModel.calls == [True]
+
+
+def test_stream_error_is_reported_and_not_cached(gemini, monkeypatch):
+    monkeypatch.setattr(FakeModel, "error", RuntimeError("quota exceeded"))
+    events = sse_events(gemini.post("/api/generate-report/stream", json=REQUEST).text)
+    assert [event for event, _ in events] == ["chunk", "chunk", "chunk", "error"]
+    assert events[-1][1] == {"error": "quota exceeded"}
+
+    monkeypatch.setattr(FakeModel, "error", None)
+    events = sse_events(gemini.post("/api/generate-report/stream", json=REQUEST).text)
+    assert events[-1][1]["cached"] is False
+    assert FakeModel.calls == [True, True]
+
+
+def test_stream_without_api_key(gemini, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "GEMINI_API_KEY", None)
+    response = gemini.post("/api/generate-report/stream", json=REQUEST)
+    assert response.status_code == 400 and response.json() == {"error": "Gemini API key not configured"}
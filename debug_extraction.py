@@ -1,39 +1,232 @@
-import pdfplumber
-import re
+"""Extraction accuracy and speed harness against a ground-truth manifest.
+
+Usage:
+    python generate_bills.py --count 500 --seed 1 --out corpus
+    python debug_extraction.py corpus                       # every mode
+    python debug_extraction.py corpus --out baseline.json
+    python debug_extraction.py corpus --compare baseline.json
+    python debug_extraction.py generated_bills --show bill1_normal.pdf
+
+Every PDF listed in the directory's manifest.jsonl (written by
+generate_bills.py) is extracted once per mode in extraction.EXTRACTION_MODES.
+The harness reports, side by side per mode:
+  - field-level precision and recall. A wrong value counts as both a false
+    positive and a false negative, and a field the bill doesn't have (e.g.
+    tier 2 on a bill under 500 kWh) counts as a false positive.
+  - the share of bills with every field right, overall and per layout
+  - milliseconds per bill and per parsed page
+
+--compare exits with status 1 if any mode lost precision or recall on any
+field compared with the earlier run. A faster extractor only counts if it
+is as accurate. --show prints one bill's raw page text and what each mode
+extracted from it.
+"""
+import argparse
+import json
 import os
+import sys
+import time
+
+import pdfplumber
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from extraction import EXTRACTION_MODES, FIELDS, extract_bill
+
 
-def debug_pdf(filename):
-    path = os.path.join("generated_bills", filename)
-    print(f"--- Debugging {filename} ---")
-    
-    try:
-        with pdfplumber.open(path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
-                
-        print("RAW TEXT OUTPUT:")
-        print("--------------------------------------------------")
-        print(text)
-        print("--------------------------------------------------")
-        
-        # Test robust regex patterns
-        patterns = {
-            # Look for Meter ID followed by readings and multiplier 1.0 then the usage
-            "meter_row_usage": r"MC-\d+\s+[\d,]+\s+[\d,]+\s+1\.0\s+(\d+)",
-            "usage_kwh_original": r"(?:Total Usage \(kWh\)\s*(\d+)|MC-\d+.*?(\d+)\s*$)",
+def same(expected, actual):
+    if isinstance(expected, float) or isinstance(actual, float):
+        try:
+            return abs(float(expected) - float(actual)) < 0.005
+        except (TypeError, ValueError):
+            return False
+    return expected == actual
+
+
+def load_manifest(directory, path=None, limit=None):
+    path = path or os.path.join(directory, "manifest.jsonl")
+    if not os.path.exists(path):
+        sys.exit(f"No manifest at {path}; generate the corpus with generate_bills.py")
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return entries[:limit]
+
+
+def score_mode(directory, entries, mode, errors, max_errors):
+    counts = {field: {"tp": 0, "fp": 0, "fn": 0} for field in FIELDS}
+    by_layout = {}
+    elapsed = pages = page_count = exact = 0
+    for entry in entries:
+        with open(os.path.join(directory, entry["filename"]), "rb") as f:
+            contents = f.read()
+        start = time.perf_counter()
+        data, stats = extract_bill(contents, mode)
+        elapsed += time.perf_counter() - start
+        pages += stats["pages_parsed"]
+        page_count += stats["page_count"]
+        data = data or {}
+
+        expected = entry["fields"]
+        wrong = {}
+        for field in FIELDS:
+            if field in expected and field in data and same(expected[field], data[field]):
+                counts[field]["tp"] += 1
+                continue
+            if field in data:
+                counts[field]["fp"] += 1
+            if field in expected:
+                counts[field]["fn"] += 1
+            if field in data or field in expected:
+                wrong[field] = (expected.get(field), data.get(field))
+
+        layout = by_layout.setdefault(entry.get("layout", "standard"), [0, 0])
+        layout[1] += 1
+        if not wrong:
+            exact += 1
+            layout[0] += 1
+        elif len(errors) < max_errors:
+            errors.append((mode, entry["filename"], wrong))
+
+    fields = {}
+    for field, c in counts.items():
+        if c["tp"] + c["fp"] + c["fn"] == 0:
+            continue
+        fields[field] = {
+            **c,
+            "precision": round(c["tp"] / (c["tp"] + c["fp"]), 4) if c["tp"] + c["fp"] else None,
+            "recall": round(c["tp"] / (c["tp"] + c["fn"]), 4) if c["tp"] + c["fn"] else None,
         }
-        
-        print("\nREGEX MATCHES:")
-        for key, pattern in patterns.items():
-            match = re.search(pattern, text, re.MULTILINE)
-            if match:
-                print(f"{key}: MATCH -> {match.groups()}")
-            else:
-                print(f"{key}: NO MATCH")
-                
-    except Exception as e:
-        print(f"Error: {e}")
+    tp = sum(c["tp"] for c in counts.values())
+    fp = sum(c["fp"] for c in counts.values())
+    fn = sum(c["fn"] for c in counts.values())
+    return {
+        "bills": len(entries),
+        "exact_bills": exact,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "ms_per_bill": round(elapsed * 1000 / max(1, len(entries)), 2),
+        "ms_per_page": round(elapsed * 1000 / max(1, pages), 2),
+        "pages_parsed": pages,
+        "page_count": page_count,
+        "layouts": {name: {"exact": e, "bills": n} for name, (e, n) in sorted(by_layout.items())},
+        "fields": fields,
+    }
+
+
+def fmt(value):
+    return "   -  " if value is None else f"{value * 100:5.1f}%"
+
+
+def print_report(results):
+    modes = list(results)
+    print(f"\n{'':<22}" + "".join(f"{mode:>20}" for mode in modes))
+    rows = [
+        ("precision", lambda r: fmt(r["precision"])),
+        ("recall", lambda r: fmt(r["recall"])),
+        ("bills all correct", lambda r: f"{r['exact_bills']}/{r['bills']}"),
+        ("ms / bill", lambda r: f"{r['ms_per_bill']:.1f}"),
+        ("ms / parsed page", lambda r: f"{r['ms_per_page']:.1f}"),
+        ("pages parsed", lambda r: f"{r['pages_parsed']}/{r['page_count']}"),
+    ]
+    layouts = sorted({name for r in results.values() for name in r["layouts"]})
+    rows += [(f"  {name} correct",
+              lambda r, name=name: "{exact}/{bills}".format(**r["layouts"].get(name, {"exact": 0, "bills": 0})))
+             for name in layouts]
+    for label, value in rows:
+        print(f"{label:<22}" + "".join(f"{value(results[mode]):>20}" for mode in modes))
+
+    print(f"\n{'field (P / R)':<22}" + "".join(f"{mode:>20}" for mode in modes))
+    for field in FIELDS:
+        cells = []
+        for mode in modes:
+            f = results[mode]["fields"].get(field)
+            cells.append(f"{fmt(f['precision'])} / {fmt(f['recall'])}" if f else "-")
+        if any(cell != "-" for cell in cells):
+            print(f"{field:<22}" + "".join(f"{cell:>20}" for cell in cells))
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["modes"]
+    losses = []
+    for mode, result in results.items():
+        old = baseline.get(mode)
+        if not old:
+            continue
+        for field, now in result["fields"].items():
+            before = old["fields"].get(field)
+            if not before:
+                continue
+            for metric in ("precision", "recall"):
+                if before[metric] is not None and (now[metric] or 0) < before[metric]:
+                    losses.append(f"{mode} {field} {metric}: {fmt(before[metric])} -> {fmt(now[metric])}")
+        speed = (result["ms_per_page"] - old["ms_per_page"]) / old["ms_per_page"] * 100 if old["ms_per_page"] else 0
+        print(f"{mode}: {old['ms_per_page']:.1f} -> {result['ms_per_page']:.1f} ms/page ({speed:+.1f}%), "
+              f"{old['exact_bills']} -> {result['exact_bills']} bills all correct")
+    for loss in losses:
+        print(f"ACCURACY LOSS {loss}")
+    return losses
+
+
+def show(directory, entries, filename, modes):
+    entry = next((e for e in entries if e["filename"] == filename), None)
+    path = os.path.join(directory, filename)
+    print(f"--- {filename} ---")
+    with pdfplumber.open(path) as pdf:
+        for number, page in enumerate(pdf.pages, 1):
+            print(f"RAW TEXT, PAGE {number}:")
+            print("--------------------------------------------------")
+            print(page.extract_text() or "")
+            print("--------------------------------------------------")
+    with open(path, "rb") as f:
+        contents = f.read()
+    expected = entry["fields"] if entry else {}
+    for mode in modes:
+        data, _ = extract_bill(contents, mode)
+        print(f"\n{mode}:")
+        for field in FIELDS:
+            if field in expected or field in (data or {}):
+                actual = (data or {}).get(field)
+                mark = "ok" if field in expected and same(expected.get(field), actual) else "MISMATCH"
+                print(f"  {field:<18}{str(actual):>18}   expected {str(expected.get(field)):>18}   {mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default="generated_bills", help="corpus with a manifest.jsonl")
+    parser.add_argument("--manifest", help="manifest path (default: DIRECTORY/manifest.jsonl)")
+    parser.add_argument("--modes", nargs="+", choices=EXTRACTION_MODES, default=list(EXTRACTION_MODES))
+    parser.add_argument("--limit", type=int, help="score at most this many bills")
+    parser.add_argument("--errors", type=int, default=5, help="mismatched bills to print")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--compare", help="earlier --out file; exit 1 on any accuracy loss")
+    parser.add_argument("--show", metavar="FILE", help="print one bill's raw text and extracted fields")
+    args = parser.parse_args()
+
+    entries = load_manifest(args.directory, args.manifest, args.limit)
+    if args.show:
+        show(args.directory, entries, args.show, args.modes)
+        return
+
+    print(f"Scoring {len(entries)} bills from {args.directory}...")
+    errors = []
+    results = {mode: score_mode(args.directory, entries, mode, errors, args.errors) for mode in args.modes}
+    print_report(results)
+
+    if errors:
+        print("\nMismatches (field: expected -> extracted):")
+        for mode, filename, wrong in errors:
+            print(f"  [{mode}] {filename}: " + ", ".join(f"{k}: {e} -> {a}" for k, (e, a) in wrong.items()))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"directory": os.path.abspath(args.directory), "modes": results}, f, indent=2)
+        print(f"\nWrote {args.out}")
+
+    if args.compare:
+        print()
+        if compare(results, args.compare):
+            sys.exit(1)
+
 
 if __name__ == "__main__":
-    debug_pdf("bill1_normal.pdf")
+    main()
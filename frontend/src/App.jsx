@@ -14,28 +14,53 @@ function App() {
         const selectedFiles = Array.from(e.target.files)
         setFiles(selectedFiles)
         setLoading(true)
+        setResults([])
         const newResults = []
 
+        // One request for the whole selection; the backend extracts in parallel
+        // and streams each bill back (NDJSON) as soon as it is analyzed
+        const formData = new FormData()
         for (const file of selectedFiles) {
-            const formData = new FormData()
-            formData.append('file', file)
-
-            try {
-                const response = await fetch('/api/analyze', {
-                    method: 'POST',
-                    body: formData,
-                })
-
-                if (response.ok) {
-                    const data = await response.json()
-                    newResults.push(data)
+            formData.append('files', file)
+        }
+
+        try {
+            const response = await fetch('/api/analyze/batch?stream=ndjson', {
+                method: 'POST',
+                body: formData,
+            })
+
+            if (response.ok) {
+                const reader = response.body.getReader()
+                const decoder = new TextDecoder()
+                let buffer = ''
+
+                while (true) {
+                    const { value, done } = await reader.read()
+                    if (done) break
+                    buffer += decoder.decode(value, { stream: true })
+                    const lines = buffer.split('\n')
+                    buffer = lines.pop()
+
+                    for (const line of lines) {
+                        if (!line.trim()) continue
+                        const event = JSON.parse(line)
+                        if (event.event !== 'result') continue
+                        if (event.error) {
+                            console.error(`Error analyzing ${event.filename}:`, event.error)
+                        } else {
+                            // Bills finish in any order; `index` is the bill's
+                            // position in the upload, so cards keep that order
+                            newResults[event.index] = event
+                            setResults(newResults.filter(Boolean))
+                        }
+                    }
                 }
-            } catch (error) {
-                console.error('Error analyzing file:', error)
             }
+        } catch (error) {
+            console.error('Error analyzing files:', error)
         }
 
-        setResults(newResults)
         setLoading(false)
     }
 
@@ -49,19 +74,29 @@ function App() {
             })
 
             if (response.ok) {
-                const data = await response.json()
+                // The report is generated in the background; poll the job
+                // until its result is ready
+                const job = await response.json()
+                let result = await fetch(job.result_url)
+                while (result.status === 202) {
+                    await new Promise(resolve => setTimeout(resolve, 1000))
+                    result = await fetch(job.result_url)
+                }
+                if (!result.ok) {
+                    const { error } = await result.json()
+                    throw new Error(error || 'Report job failed')
+                }
+                const data = await result.json()
                 setCombinedReport(data.report)
                 setShowCombinedReport(true)
 
-                // Auto-download PDF if available
-                if (data.pdf) {
-                    const pdfBlob = base64ToBlob(data.pdf, 'application/pdf')
-                    const url = URL.createObjectURL(pdfBlob)
+                // Auto-download PDF if available; the browser fetches it
+                // straight from the server
+                if (data.pdf_url) {
                     const a = document.createElement('a')
-                    a.href = url
+                    a.href = data.pdf_url
                     a.download = `BillGuard-Combined-Report-${new Date().toISOString().split('T')[0]}.pdf`
                     a.click()
-                    URL.revokeObjectURL(url)
                 }
             } else {
                 alert('Failed to generate combined report. Please check your Gemini API key in .env file.')
@@ -74,17 +109,6 @@ function App() {
         }
     }
 
-    // Helper function to convert base64 to blob
-    const base64ToBlob = (base64, type) => {
-        const binStr = atob(base64)
-        const len = binStr.length
-        const arr = new Uint8Array(len)
-        for (let i = 0; i < len; i++) {
-            arr[i] = binStr.charCodeAt(i)
-        }
-        return new Blob([arr], { type })
-    }
-
     if (!showApp) {
         return <LandingPage onGetStarted={() => setShowApp(true)} />
     }
@@ -193,8 +217,8 @@ function App() {
 
                 {/* Results */}
                 <div className="space-y-6">
-                    {results.map((result, idx) => (
-                        <BillCard key={idx} result={result} />
+                    {results.map((result) => (
+                        <BillCard key={result.index} result={result} />
                     ))}
                 </div>
             </div>
@@ -1,9 +1,16 @@
+import argparse
+import datetime
+import functools
+import json
 import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import LETTER
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
 from reportlab.graphics.shapes import Drawing, Rect, String
 from reportlab.graphics.charts.barcharts import VerticalBarChart
 
@@ -15,6 +22,7 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 bills = [
     {
         "filename": "bill1_normal.pdf",
+        "scenario": "normal",
         "account_number": "8271-4523-0019",
         "address": "123 Maple Ave, Metro City",
         "bill_date": "Oct 01, 2024",
@@ -37,6 +45,7 @@ bills = [
     },
     {
         "filename": "bill2_spike.pdf",
+        "scenario": "spike",
         "account_number": "8271-4523-0019",
         "address": "123 Maple Ave, Metro City",
         "bill_date": "Nov 01, 2024",
@@ -59,6 +68,7 @@ bills = [
     },
     {
         "filename": "bill3_math_error.pdf",
+        "scenario": "math_error",
         "account_number": "9384-6172-0041",
         "address": "789 Oak Ln, Metro City",
         "bill_date": "Nov 01, 2024",
@@ -81,6 +91,7 @@ bills = [
     },
     {
         "filename": "bill4_wrong_rate.pdf",
+        "scenario": "wrong_rate",
         "account_number": "7159-2846-0033",
         "address": "456 Pine St, Metro City",
         "bill_date": "Nov 01, 2024",
@@ -103,8 +114,12 @@ bills = [
     }
 ]
 
-def create_bill(bill_data):
-    filepath = os.path.join(OUTPUT_DIR, bill_data['filename'])
+def create_bill(bill_data, output_dir=OUTPUT_DIR):
+    # Optional layout keys (set by the corpus generator): "inserts" are
+    # messages placed between the meter and charges tables, "insert_pages"
+    # adds trailing pages of program text, "charges_col_widths" overrides the
+    # charges table columns.
+    filepath = os.path.join(output_dir, bill_data['filename'])
     doc = SimpleDocTemplate(filepath, pagesize=LETTER, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
     story = []
     styles = getSampleStyleSheet()
@@ -195,6 +210,10 @@ def create_bill(bill_data):
         ('LINEBELOW', (0,0), (-1,-1), 1, colors.HexColor('#eee')),
     ]))
     story.append(meter_table)
+
+    for insert in bill_data.get('inserts', []):
+        story.append(Spacer(1, 8))
+        story.append(Paragraph(insert, normal_style))
     
     # --- CHARGES BREAKDOWN ---
     story.append(Paragraph("Electric Charges Detail", section_header))
@@ -202,7 +221,8 @@ def create_bill(bill_data):
     charges_header = ["Description", "Rate/Unit", "Usage", "Amount"]
     charges_data = [charges_header] + bill_data['charges']
     
-    charges_table = Table(charges_data, colWidths=[3.5*inch, 1*inch, 1.5*inch, 1*inch])
+    col_widths = bill_data.get('charges_col_widths', [3.5, 1, 1.5, 1])
+    charges_table = Table(charges_data, colWidths=[w*inch for w in col_widths])
     charges_table.setStyle(TableStyle([
         ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#f8f9fa')),
         ('TEXTCOLOR', (0,0), (-1,0), colors.HexColor('#555555')),
@@ -229,15 +249,233 @@ def create_bill(bill_data):
     footer_text = f"Please return this portion with your payment. Make checks payable to Metro City Power.<br/>Account: {bill_data['account_number']} | Amount Due: ${bill_data['total_amount']} | Due by: {bill_data['due_date']}"
     footer = Paragraph(footer_text, ParagraphStyle('Footer', parent=normal_style, alignment=1, textColor=colors.gray, fontSize=9))
     story.append(footer)
+
+    # --- INSERT PAGES ---
+    for page in bill_data.get('insert_pages', []):
+        story.append(PageBreak())
+        story.append(Paragraph("Energy Efficiency Programs", section_header))
+        for text in page:
+            story.append(Paragraph(text, normal_style))
+            story.append(Spacer(1, 6))
     
     doc.build(story)
-    print(f"Created {filepath}")
+    return filepath
+
+# --- GROUND TRUTH ---
+# What a correct extractor and detector should report for each bill. Fields
+# use the extractor's names; anomalies use the rule engine's types (with the
+# default backend/rules.json thresholds).
+SCENARIO_ANOMALIES = {
+    "normal": [],
+    "spike": ["Usage Spike"],
+    "math_error": ["Calculation Error"],
+    "wrong_rate": ["Rate Error"],
+}
+
+CHARGE_FIELDS = [
+    ("Customer Charge", "customer_charge"),
+    ("Tier 1", "tier1"),
+    ("Tier 2", "tier2"),
+    ("Distribution", "dist_charge"),
+    ("Taxes", "taxes"),
+]
+
+
+def _money(text):
+    return float(text.replace("$", "").replace(",", ""))
+
+
+def expected_fields(bill_data):
+    fields = {
+        "account_number": bill_data["account_number"],
+        "bill_date": bill_data["bill_date"],
+        "total_amount": _money(bill_data["total_amount"]),
+        "usage_kwh": bill_data["usage_kwh"],
+    }
+    for description, rate, usage, amount in bill_data["charges"]:
+        for keyword, field in CHARGE_FIELDS:
+            if keyword in description:
+                if field.startswith("tier"):
+                    fields[f"{field}_rate"] = _money(rate)
+                    fields[f"{field}_usage"] = int(usage.split()[0])
+                    fields[f"{field}_cost"] = _money(amount)
+                else:
+                    fields[field] = _money(amount)
+    return fields
+
+
+def manifest_entry(bill_data):
+    return {
+        "filename": bill_data["filename"],
+        "scenario": bill_data["scenario"],
+        "layout": bill_data.get("layout", "standard"),
+        "insert_pages": len(bill_data.get("insert_pages", [])),
+        "fields": expected_fields(bill_data),
+        "anomalies": SCENARIO_ANOMALIES[bill_data["scenario"]],
+    }
+
+
+def write_manifest(bill_list, output_dir):
+    path = os.path.join(output_dir, "manifest.jsonl")
+    with open(path, "w") as f:
+        for bill in bill_list:
+            f.write(json.dumps(manifest_entry(bill)) + "\n")
+    return path
+
+
+# --- RANDOMIZED CORPUS ---
+# Every bill is drawn from its own Random(f"{seed}:{index}"), so a corpus is
+# reproducible for a given seed whatever the worker count, and bill N is the
+# same in a 100-bill and a 100,000-bill run.
+
+SCENARIO_WEIGHTS = {"normal": 55, "spike": 15, "math_error": 15, "wrong_rate": 15}
+LAYOUT_WEIGHTS = {"standard": 60, "noisy": 25, "multi_page": 15}
+
+STREETS = ["Maple Ave", "Oak Ln", "Pine St", "Cedar Rd", "Elm St", "Birch Blvd", "Willow Way", "Lakeview Dr"]
+
+INSERT_MESSAGES = [
+    "<b>Notice:</b> Tier 2 pricing applies to usage above 500 kWh in each billing period.",
+    "Sign up for paperless billing and AutoPay at www.metrocitypower.com.",
+    "Planned maintenance may briefly interrupt service in your area next month.",
+    "<b>Budget Billing:</b> spread your energy costs evenly across the year.",
+    "Report outages 24/7 at 1-800-555-0199 or through the Metro City Power app.",
+    "Customers on the Green Energy plan help fund local solar projects.",
+]
+
+PROGRAM_TEXT = [
+    "Switching to LED bulbs uses up to 75% less energy than incandescent lighting.",
+    "Smart thermostats can lower heating and cooling costs by adjusting to your schedule.",
+    "Rebates are available for qualifying ENERGY STAR appliances purchased this year.",
+    "Free home energy audits identify drafts, insulation gaps and inefficient equipment.",
+    "Time-of-use plans reward shifting laundry and dishwashing to off-peak hours.",
+    "Seal windows and doors with weatherstripping to keep conditioned air inside.",
+    "Unplug chargers and electronics when not in use to cut standby power draw.",
+    "Our assistance programs help eligible households with seasonal energy bills.",
+]
+
+CHARGES_COL_WIDTHS = [[3.5, 1, 1.5, 1], [3.0, 1.2, 1.6, 1.2], [3.8, 0.9, 1.3, 1.0]]
+
+
+def _fmt_date(d):
+    return d.strftime("%b %d, %Y")
+
+
+def random_bill(index, seed, scenario, layout):
+    rng = random.Random(f"{seed}:{index}")
+
+    month = rng.randint(1, 12)
+    start = datetime.date(2024, month, 1)
+    end = datetime.date(2024 + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    bill_date = end + datetime.timedelta(days=1)
+
+    usage = rng.randint(850, 1600) if scenario == "spike" else rng.randint(250, 790)
+    tier1_usage = min(usage, 500)
+    tier1_rate = rng.choice([0.15, 0.16, 0.17, 0.18]) if scenario == "wrong_rate" else 0.13
+    tier1_cost = round(tier1_usage * tier1_rate, 2)
+    tier2_usage = usage - tier1_usage
+    tier2_cost = round(tier2_usage * 0.17, 2)
+    dist = round(rng.uniform(6, 14), 2)
+    taxes = round((10 + tier1_cost + tier2_cost + dist) * 0.10, 2)
+    total = round(10 + tier1_cost + tier2_cost + dist + taxes, 2)
+    if scenario == "math_error":
+        total = round(total + rng.choice([-1, 1]) * rng.uniform(3, 25), 2)
+
+    charges = [
+        ["Customer Charge", "Fixed", "-", "$10.00"],
+        ["Energy Charge - Tier 1 (First 500 kWh)", f"${tier1_rate:.2f}", f"{tier1_usage} kWh", f"${tier1_cost:.2f}"],
+    ]
+    if tier2_usage:
+        charges.append(["Energy Charge - Tier 2 (Over 500 kWh)", "$0.17", f"{tier2_usage} kWh", f"${tier2_cost:.2f}"])
+    charges += [
+        ["Distribution Charges", "Variable", "-", f"${dist:.2f}"],
+        ["Taxes & Fees", "~10%", "-", f"${taxes:.2f}"],
+        ["Total Electric Charges", "", "", f"${total:.2f}"],
+    ]
+
+    prev_reading = rng.randint(1000, 90000)
+    typical = rng.randint(25, 79)
+    history = [max(5, typical + rng.randint(-12, 12)) for _ in range(11)] + [usage // 10]
+
+    bill = {
+        "filename": f"bill{index:06d}_{scenario}.pdf",
+        "scenario": scenario,
+        "layout": layout,
+        "account_number": f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}-{rng.randint(1, 9999):04d}",
+        "address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, Metro City",
+        "bill_date": _fmt_date(bill_date),
+        "period": f"{_fmt_date(start)} - {_fmt_date(end)}",
+        "due_date": _fmt_date(bill_date + datetime.timedelta(days=19)),
+        "meter_number": f"MC-{rng.randint(1000, 9999)}",
+        "prev_reading": f"{prev_reading:,}",
+        "curr_reading": f"{prev_reading + usage:,}",
+        "usage_kwh": usage,
+        "charges": charges,
+        "total_amount": f"{total:.2f}",
+        "history": history,
+    }
+    if layout == "noisy":
+        bill["inserts"] = rng.sample(INSERT_MESSAGES, rng.randint(1, 4))
+        bill["charges_col_widths"] = rng.choice(CHARGES_COL_WIDTHS)
+    elif layout == "multi_page":
+        bill["insert_pages"] = [[rng.choice(PROGRAM_TEXT) for _ in range(rng.randint(6, 12))]
+                                for _ in range(rng.randint(1, 3))]
+    return bill
+
+
+def random_bills(count, seed, scenarios=None, layouts=None):
+    scenario_weights = {k: v for k, v in SCENARIO_WEIGHTS.items() if not scenarios or k in scenarios}
+    layout_weights = {k: v for k, v in LAYOUT_WEIGHTS.items() if not layouts or k in layouts}
+    result = []
+    for index in range(count):
+        # Separate stream for the choices so they don't shift the bill's values
+        pick = random.Random(f"{seed}:{index}:kind")
+        scenario = pick.choices(list(scenario_weights), weights=list(scenario_weights.values()))[0]
+        layout = pick.choices(list(layout_weights), weights=list(layout_weights.values()))[0]
+        result.append(random_bill(index, seed, scenario, layout))
+    return result
+
+
+def render_bills(bill_list, output_dir, workers=None):
+    # Rendering is pure-Python ReportLab work, so it is spread over processes
+    os.makedirs(output_dir, exist_ok=True)
+    render = functools.partial(create_bill, output_dir=output_dir)
+    step = max(1, len(bill_list) // 10)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, min(50, len(bill_list) // ((workers or os.cpu_count() or 1) * 4)))
+        for done, _ in enumerate(pool.map(render, bill_list, chunksize=chunksize), 1):
+            if done % step == 0 or done == len(bill_list):
+                elapsed = time.perf_counter() - started
+                print(f"  {done}/{len(bill_list)} bills ({done / elapsed:.1f}/s)")
+
 
 def generate_bills():
     print("Generating bills with ReportLab...")
     for bill in bills:
-        create_bill(bill)
+        print(f"Created {create_bill(bill)}")
+    write_manifest(bills, OUTPUT_DIR)
     print("Done!")
 
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate sample utility bill PDFs. Without --count, writes the four fixed example bills.")
+    parser.add_argument("--count", type=int, help="number of randomized bills to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="rendering processes (default: CPU count)")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="output directory (manifest.jsonl is written here)")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIO_WEIGHTS), help="limit to these scenarios")
+    parser.add_argument("--layouts", nargs="+", choices=sorted(LAYOUT_WEIGHTS), help="limit to these layouts")
+    args = parser.parse_args()
+
+    if args.count is None:
+        generate_bills()
+        return
+
+    bill_list = random_bills(args.count, args.seed, args.scenarios, args.layouts)
+    print(f"Generating {len(bill_list)} bills in {args.out} (seed {args.seed})...")
+    render_bills(bill_list, args.out, args.workers)
+    print(f"Wrote {write_manifest(bill_list, args.out)}")
+
 if __name__ == "__main__":
-    generate_bills()
+    main()
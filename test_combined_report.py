@@ -1,5 +1,6 @@
 import requests
 import json
+import time
 
 # Test data matching the structure from frontend
 test_data = {
@@ -42,6 +43,15 @@ try:
         timeout=30
     )
     
+    # The report is generated as a background job; poll until it's done
+    if response.status_code == 202:
+        result_url = 'http://localhost:8000' + response.json()['result_url']
+        response = requests.get(result_url, timeout=30)
+        while response.status_code == 202:
+            print(f"Job status: {response.json()['status']}")
+            time.sleep(1)
+            response = requests.get(result_url, timeout=30)
+    
     print(f"Status Code: {response.status_code}")
     print(f"Response: {response.text[:500]}")  # First 500 chars
     
@@ -50,7 +60,7 @@ try:
         print("\n✅ SUCCESS!")
         print(f"Bills analyzed: {data.get('bills_analyzed')}")
         print(f"Total issues: {data.get('total_issues')}")
-        print(f"Has PDF: {'pdf' in data}")
+        print(f"PDF URL: {data.get('pdf_url')}")
         print(f"Report length: {len(data.get('report', ''))}")
     else:
         print(f"\n❌ ERROR: {response.status_code}")